@@ -0,0 +1,90 @@
+import io
+import re
+import wave
+
+import numpy as np
+
+# Whisper works on 16 kHz mono float32 samples.
+SAMPLE_RATE = 16000
+
+RAW_PCM_TYPES = {"audio/pcm", "audio/l16", "audio/x-raw", "audio/raw"}
+RATE_PARAM_RE = re.compile(r"rate=(\d+)")
+CHANNELS_PARAM_RE = re.compile(r"channels=(\d+)")
+
+
+def resample(samples, rate):
+    """Resamples mono float32 audio to SAMPLE_RATE with linear interpolation."""
+    if rate == SAMPLE_RATE or len(samples) == 0:
+        return samples
+    duration = len(samples) / rate
+    target = np.arange(int(duration * SAMPLE_RATE)) / SAMPLE_RATE
+    return np.interp(target, np.arange(len(samples)) / rate, samples).astype(np.float32)
+
+
+def pcm16_to_float(data, rate=SAMPLE_RATE, channels=1):
+    """Converts little-endian signed 16-bit PCM to 16 kHz mono float32."""
+    samples = np.frombuffer(data[:len(data) - len(data) % (2 * channels)], dtype="<i2")
+    samples = samples.astype(np.float32) / 32768.0
+    if channels > 1:
+        samples = samples.reshape(-1, channels).mean(axis=1)
+    return resample(samples, rate)
+
+
+def _decode_wav(data):
+    with wave.open(io.BytesIO(data)) as wav:
+        if wav.getsampwidth() != 2 or wav.getcomptype() != "NONE":
+            return None
+        frames = wav.readframes(wav.getnframes())
+        return pcm16_to_float(frames, wav.getframerate(), wav.getnchannels())
+
+
+def _decode_compressed(data):
+    # PyAV decodes with the ffmpeg libraries linked into the process, no subprocess per request
+    import av
+
+    resampler = av.AudioResampler(format="s16", layout="mono", rate=SAMPLE_RATE)
+    chunks = []
+    with av.open(io.BytesIO(data), mode="r") as container:
+        stream = container.streams.audio[0]
+        for frame in container.decode(stream):
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+        for resampled in resampler.resample(None):
+            chunks.append(resampled.to_ndarray().reshape(-1))
+    if not chunks:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(chunks).astype(np.float32) / 32768.0
+
+
+def decode_audio(data, content_type=None):
+    """
+    Decodes an uploaded clip to 16 kHz mono float32 samples in memory.
+
+    Raw PCM (audio/pcm, audio/L16 with optional rate/channels parameters) and
+    16-bit WAV are converted directly; other formats (webm/opus, ogg, mp3, ...)
+    are decoded with PyAV.
+
+    Args:
+        data (bytes): Uploaded audio.
+        content_type (str, optional): MIME type sent by the client.
+
+    Returns:
+        numpy.ndarray: Samples in [-1, 1].
+    """
+    mime = (content_type or "").lower()
+    if mime.split(";")[0].strip() in RAW_PCM_TYPES:
+        rate = RATE_PARAM_RE.search(mime)
+        channels = CHANNELS_PARAM_RE.search(mime)
+        return pcm16_to_float(
+            data,
+            int(rate.group(1)) if rate else SAMPLE_RATE,
+            int(channels.group(1)) if channels else 1
+        )
+    if data[:4] == b"RIFF" and data[8:12] == b"WAVE":
+        try:
+            samples = _decode_wav(data)
+        except (wave.Error, EOFError):
+            samples = None
+        if samples is not None:
+            return samples
+    return _decode_compressed(data)
@@ -0,0 +1,77 @@
+"""
+Measures the real-time factor of each transcription backend option on a reference clip.
+
+The real-time factor (RTF) is inference time divided by audio duration; below 1.0
+transcription keeps up with speech. Run on the node type that serves /voice, e.g.:
+
+    python benchmark_voice.py reference.wav --models tiny base --quantize none int8 --threads 2 4
+
+Each combination loads its own model, transcribes the clip once to warm up and is
+then timed over --runs repetitions.
+"""
+import argparse
+import itertools
+import os
+import statistics
+import time
+
+from audio_decode import SAMPLE_RATE, decode_audio
+from vad import trim_silence
+from voice_backend import QUANTIZE_MODES, WHISPER_LANGUAGE, backend_options, create_backend
+
+
+def benchmark(options, audio, runs):
+    """
+    Transcribes a clip with one backend configuration.
+
+    Returns:
+        tuple: (load seconds, median inference seconds, transcript).
+    """
+    backend = create_backend(options)
+    started = time.perf_counter()
+    backend.load()
+    load_seconds = time.perf_counter() - started
+
+    text, _ = backend.transcribe(audio)
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        backend.transcribe(audio)
+        timings.append(time.perf_counter() - started)
+    return load_seconds, statistics.median(timings), text.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark transcription backend options")
+    parser.add_argument("clip", help="Reference clip (wav, webm, ogg, mp3, ...)")
+    parser.add_argument("--models", nargs="+", default=["tiny", "base"], help="Whisper model sizes")
+    parser.add_argument("--quantize", nargs="+", default=list(QUANTIZE_MODES), choices=QUANTIZE_MODES)
+    parser.add_argument("--threads", nargs="+", type=int, default=[os.cpu_count() or 1], help="Torch threads")
+    parser.add_argument("--beam-sizes", nargs="+", type=int, default=[1], help="1 decodes greedily")
+    parser.add_argument("--language", default=WHISPER_LANGUAGE, help="Language hint, e.g. ru")
+    parser.add_argument("--runs", type=int, default=3, help="Timed repetitions per option")
+    parser.add_argument("--no-vad", action="store_true", help="Transcribe the clip without trimming silence")
+    args = parser.parse_args()
+
+    with open(args.clip, "rb") as f:
+        audio = decode_audio(f.read())
+    if not args.no_vad:
+        audio, _ = trim_silence(audio)
+    duration = len(audio) / SAMPLE_RATE
+    if duration == 0:
+        parser.error("The clip contains no speech")
+    print(f"{args.clip}: {duration:.1f}s of speech\n")
+
+    print(f"{'model':<8} {'quantize':<8} {'threads':>7} {'beam':>4} {'load s':>7} {'infer s':>8} {'RTF':>6}  transcript")
+    combinations = itertools.product(args.models, args.quantize, args.threads, args.beam_sizes)
+    for model_size, quantize, threads, beam_size in combinations:
+        options = backend_options(
+            model_size=model_size, quantize=quantize, threads=threads, beam_size=beam_size, language=args.language
+        )
+        load_seconds, seconds, text = benchmark(options, audio, args.runs)
+        print(f"{model_size:<8} {quantize:<8} {threads:>7} {beam_size:>4} {load_seconds:>7.2f} "
+              f"{seconds:>8.2f} {seconds / duration:>6.3f}  {text[:60]}")
+
+
+if __name__ == "__main__":
+    main()
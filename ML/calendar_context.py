@@ -0,0 +1,144 @@
+import datetime
+import os
+import re
+import logging
+from collections import Counter
+
+from prompt_budget import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Prompt budget for the calendar section of the chat system prompt.
+CALENDAR_CONTEXT_TOKENS = int(os.getenv("CALENDAR_CONTEXT_TOKENS", "1500"))
+# Events inside this window around "now" are listed first.
+CALENDAR_WINDOW_PAST_DAYS = int(os.getenv("CALENDAR_WINDOW_PAST_DAYS", "1"))
+CALENDAR_WINDOW_FUTURE_DAYS = int(os.getenv("CALENDAR_WINDOW_FUTURE_DAYS", "14"))
+# Omitted events closer than this are summarised per day, farther ones per type.
+CALENDAR_DAILY_SUMMARY_DAYS = 30
+
+STOP_WORDS = {
+    "the", "and", "for", "with", "from", "what", "when", "where", "have", "about", "this", "that",
+    "add", "delete", "remove", "update", "move", "change", "meeting", "event", "task", "calendar",
+    "today", "tomorrow", "please", "can", "you", "my", "at", "on", "to",
+    "что", "как", "когда", "где", "это", "мне", "меня", "мой", "моя", "мои", "для", "или",
+    "добавь", "удали", "перенеси", "измени", "событие", "задачу", "задача", "календарь",
+    "сегодня", "завтра", "пожалуйста",
+}
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _event_start(event):
+    start_field = event.get("start") or event.get("start_time")
+    if not start_field:
+        return None
+    try:
+        start = datetime.datetime.fromisoformat(str(start_field).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if start.tzinfo is None:
+        start = start.replace(tzinfo=datetime.timezone.utc)
+    return start
+
+
+def _event_title(event):
+    return str(event.get("summary") or event.get("title") or "")
+
+
+def message_terms(message):
+    """
+    Extracts search terms from a user message.
+
+    Args:
+        message (str): User's message.
+
+    Returns:
+        set: Lower-cased words worth matching against event titles.
+    """
+    return {
+        word for word in WORD_RE.findall((message or "").lower())
+        if len(word) >= 3 and word not in STOP_WORDS and not word.isdigit()
+    }
+
+
+def _summarise(omitted, now):
+    """Builds per-day counts for near events and per-type counts for the rest."""
+    per_day = Counter()
+    per_type = Counter()
+    for event, start in omitted:
+        if start is not None and abs((start - now).days) <= CALENDAR_DAILY_SUMMARY_DAYS:
+            per_day[start.date()] += 1
+        else:
+            per_type[event.get("type") or "other"] += 1
+    lines = [f"- {day.strftime('%B %d, %Y')}: {count} more event(s)" for day, count in sorted(per_day.items())]
+    lines += [f"- {count} other '{kind}' event(s)" for kind, count in per_type.most_common()]
+    return lines
+
+
+def select_calendar_context(events, message="", formatter=str, now=None, token_budget=CALENDAR_CONTEXT_TOKENS):
+    """
+    Selects the part of the user's calendar that goes into the prompt.
+
+    Events whose titles match terms in the message come first, then events in a
+    window around now, closest first. Events are listed until the token budget
+    runs out; everything else is summarised as per-day or per-type counts.
+
+    Args:
+        events (list): Calendar events as sent by the backend.
+        message (str, optional): User's message, used for title matching.
+        formatter (callable, optional): Formats one event as a prompt line.
+        now (datetime, optional): Reference time, defaults to the current UTC time.
+        token_budget (int, optional): Token budget of the whole calendar section.
+
+    Returns:
+        str: Calendar context for the system prompt.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    window_start = now - datetime.timedelta(days=CALENDAR_WINDOW_PAST_DAYS)
+    window_end = now + datetime.timedelta(days=CALENDAR_WINDOW_FUTURE_DAYS)
+    terms = message_terms(message)
+
+    parsed = [(e, _event_start(e)) for e in events if isinstance(e, dict)]
+    far_future = datetime.timedelta.max
+
+    def distance(item):
+        start = item[1]
+        return abs(start - now) if start is not None else far_future
+
+    matched, in_window, rest = [], [], []
+    for item in parsed:
+        title = _event_title(item[0]).lower()
+        if terms and any(term in title for term in terms):
+            matched.append(item)
+        elif item[1] is not None and window_start <= item[1] <= window_end:
+            in_window.append(item)
+        else:
+            rest.append(item)
+    matched.sort(key=distance)
+    in_window.sort(key=distance)
+
+    selected, omitted = [], list(rest)
+    # Keep some room for the summary of the events that do not fit
+    used = count_tokens("\n".join(_summarise(rest, now)))
+    candidates = matched + in_window
+    for index, item in enumerate(candidates):
+        line = formatter(item[0])
+        cost = count_tokens(line)
+        if used + cost > token_budget:
+            omitted.extend(candidates[index:])
+            break
+        selected.append((item, line))
+        used += cost
+
+    selected.sort(key=lambda pair: pair[0][1] or datetime.datetime.max.replace(tzinfo=datetime.timezone.utc))
+    lines = [line for _, line in selected]
+    if omitted:
+        summary = _summarise(omitted, now)
+        if count_tokens("\n".join(lines + summary)) > token_budget:
+            # The detailed summary does not fit either, keep a single count
+            summary = [f"- {len(omitted)} more event(s) not listed"]
+        lines.append("Other events (not listed in detail):")
+        lines.extend(summary)
+
+    logger.info(f"Calendar context: {len(selected)} of {len(parsed)} events listed, {len(omitted)} summarised")
+    return "\n".join(lines)
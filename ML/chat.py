@@ -1,81 +1,44 @@
 import datetime
-import whisper
-import requests
-import os
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Literal, Optional
 import uvicorn
-import tempfile
+import asyncio
+import json
+import os
 import logging
+from llm_client import GROQ_API_KEY, LLM_UNAVAILABLE_ERRORS, model
+from metrics import metrics
+from history_summary import conversation_key, fold_history
+from calendar_context import CALENDAR_CONTEXT_TOKENS, select_calendar_context
+from prompt_budget import PromptBudget
+from response_cache import ResponseCache, canonical_key
+from structured_output import StructuredOutputError, parse_model
+from intent_router import route
+from transcription import VOICE_MAX_UPLOAD_BYTES, VOICE_RETRY_AFTER, TranscriptionQueueFull, transcriber
+from voice_stream import VoiceStream
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable not set")
-
-
-class Chat:
-    """Wrapper for Groq LLM chat API."""
-
-    def __init__(self, model_name, api_key):
-        """
-        Initialize the Chat class.
-
-        Args:
-            model_name (str): Name of the LLM model.
-            api_key (str): API key for Groq.
-        """
-        self.model = model_name
-        self.api_key = api_key
-        self.api_url = "https://api.groq.com/openai/v1/chat/completions"
+# Sent instead of the model's reply while the LLM is unavailable.
+FALLBACK_REPLY = (
+    "Сейчас я не могу обработать запрос: сервис ассистента временно недоступен. "
+    "Пожалуйста, попробуйте ещё раз через минуту."
+)
+# Sent when a voice message contains no speech; the LLM is not called.
+NO_SPEECH_REPLY = "Не удалось расслышать сообщение. Пожалуйста, запишите его ещё раз."
 
-    def chat(self, messages):
-        """
-        Sends a chat completion request to Groq API.
+# Calendar and history uploaded once via POST /context and referenced by voice requests.
+CONTEXT_TTL = float(os.getenv("CONTEXT_TTL", "900"))
+CONTEXT_CACHE_SIZE = int(os.getenv("CONTEXT_CACHE_SIZE", "1024"))
+# Share stored contexts between uvicorn workers through SQLite; empty keeps them per process.
+CONTEXT_STORE_DB = os.getenv("CONTEXT_STORE_DB", "")
+CONTEXT_FIELDS = ("calendar", "history", "timezone", "conversation_id")
 
-        Args:
-            messages (list): List of message dicts for the LLM.
-
-        Returns:
-            str: Model's reply.
-        """
-        try:
-            logger.info(f"Sending request to Groq API with {len(messages)} messages")
-            response = requests.post(
-                self.api_url,
-                headers={
-                    "Authorization": f"Bearer {self.api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": self.model,
-                    "messages": messages,
-                    "temperature": 0.5
-                },
-                timeout=30
-            )
-            logger.info(f"Response status: {response.status_code}")
-            if not response.ok:
-                logger.warning(f"Response content: {response.text}")
-            response.raise_for_status()
-            result = response.json()
-            return result['choices'][0]['message']['content'].strip()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Request error: {e}")
-            raise
-        except KeyError as e:
-            logger.error(f"Response parsing error: {e}, Response: {response.text if 'response' in locals() else 'No response'}")
-            raise
-        except Exception as e:
-            logger.exception("Unexpected error in chat method")
-            raise
-
-model = Chat("llama3-70b-8192", GROQ_API_KEY)
-model_voice = whisper.load_model("tiny")
+context_store = ResponseCache("context", max_entries=CONTEXT_CACHE_SIZE, db_path=CONTEXT_STORE_DB or None)
 
 
 def format_event(event):
@@ -108,13 +71,17 @@ def format_event(event):
         return f"- {summary} (formatting error)"
 
 
-def build_system_prompt(calendar_data=None, timezone="UTC+3"):
+def build_system_prompt(calendar_data=None, timezone="UTC+3", message="", calendar_tokens=CALENDAR_CONTEXT_TOKENS,
+                        formatter=format_event):
     """
     Builds a system prompt for the LLM based on the user's calendar.
 
     Args:
         calendar_data (list, optional): List of calendar events.
         timezone (str, optional): User's timezone.
+        message (str, optional): User's message, used to pick relevant events.
+        calendar_tokens (int, optional): Token budget of the calendar section.
+        formatter (callable, optional): Formats one event as a prompt line.
 
     Returns:
         dict: System prompt for the LLM.
@@ -123,7 +90,9 @@ def build_system_prompt(calendar_data=None, timezone="UTC+3"):
     try:
         if calendar_data:
             logger.info(f"Processing {len(calendar_data)} calendar events")
-            calendar_context = "\n".join(format_event(e) for e in calendar_data if e)
+            calendar_context = select_calendar_context(
+                calendar_data, message, formatter=formatter, token_budget=calendar_tokens
+            )
         else:
             calendar_context = "No calendar events available"
     except Exception as e:
@@ -178,6 +147,7 @@ class ChatRequest(BaseModel):
     calendar: Optional[List[dict]] = None
     history: Optional[List[dict]] = None
     timezone: Optional[str] = "55.75,37.61"
+    conversation_id: Optional[str] = None
 
 
 class ChatResponse(BaseModel):
@@ -191,8 +161,199 @@ class VoiceResponse(BaseModel):
     response: str
 
 
+class IntentEvent(BaseModel):
+    """Event of a calendar command reply; fields the model adds beyond these are kept."""
+    model_config = {"extra": "allow"}
+    title: Optional[str] = None
+    description: Optional[str] = None
+    start_time: Optional[str] = None
+    end_time: Optional[str] = None
+    all_day: Optional[bool] = None
+    location: Optional[str] = None
+    type: Optional[str] = None
+
+
+class IntentReply(BaseModel):
+    """Calendar command reply, see the JSON format in build_system_prompt()."""
+    intent: Literal["add", "delete", "update"]
+    event: IntentEvent
+
+
+def normalize_reply(reply):
+    """
+    Turns a calendar command reply into strict JSON so the backend can parse it.
+
+    Fences, trailing commas, single quotes and +0300 offsets are repaired locally
+    instead of the user having to ask again. Plain-text replies are returned unchanged.
+
+    Args:
+        reply (str): LLM reply.
+
+    Returns:
+        str: Normalised JSON command, or the reply as is.
+    """
+    if '"intent"' not in reply and "'intent'" not in reply:
+        return reply
+    try:
+        return parse_model(reply, IntentReply, "chat").model_dump_json(exclude_unset=True)
+    except StructuredOutputError:
+        return reply
+
+
+async def normalize_stream(deltas):
+    """
+    Relays reply deltas, repairing calendar commands like normalize_reply().
+
+    Plain-text replies are passed through as they arrive. A reply that starts with
+    a JSON object or a fence is a calendar command: it is buffered and sent as one
+    normalised delta once complete, so streamed and non-streamed commands parse alike.
+
+    Args:
+        deltas (AsyncIterator[str]): Reply deltas from Chat.stream().
+
+    Yields:
+        str: Deltas to send to the client.
+    """
+    buffer = []
+    is_command = None
+    async for delta in deltas:
+        if is_command is None:
+            buffer.append(delta)
+            head = "".join(buffer).lstrip()
+            if not head:
+                continue
+            is_command = head.startswith("{") or head.startswith("`")
+            if not is_command:
+                yield "".join(buffer)
+        elif is_command:
+            buffer.append(delta)
+        else:
+            yield delta
+    if is_command:
+        yield normalize_reply("".join(buffer))
+
+
+class ContextRequest(BaseModel):
+    """Calendar and history stored for later requests."""
+    calendar: Optional[List[dict]] = None
+    history: Optional[List[dict]] = None
+    timezone: Optional[str] = "55.75,37.61"
+    conversation_id: Optional[str] = None
+
+
+class ContextResponse(BaseModel):
+    """Reference to a stored context."""
+    context_id: str
+    expires_in: float
+
+
+async def fold_chat_history(req):
+    """
+    Replaces the older part of a request's history with its rolling summary.
+
+    Returns:
+        tuple: (summary or None, recent messages).
+    """
+    history = req.history or []
+    key = conversation_key(req.conversation_id, history)
+    return await fold_history(key, history, model)
+
+
+class PreparedContext:
+    """Prompt work that does not depend on the user's message, done ahead of time."""
+
+    def __init__(self, folded_history, event_lines):
+        self.folded_history = folded_history
+        self.event_lines = event_lines
+
+    def format_event(self, event):
+        return self.event_lines.get(id(event)) or format_event(event)
+
+
+async def prepare_context(req):
+    """
+    Folds the history and formats the calendar of a request before its message is known.
+
+    Voice requests run this while the clip is still being transcribed.
+
+    Args:
+        req (ChatRequest): Request whose message may still be empty.
+
+    Returns:
+        PreparedContext: Input for build_messages().
+    """
+    folded_history = await fold_chat_history(req)
+    event_lines = {id(event): format_event(event) for event in req.calendar or [] if isinstance(event, dict)}
+    return PreparedContext(folded_history, event_lines)
+
+
+async def build_messages(req: ChatRequest, llm=model, prepared=None):
+    """
+    Builds the LLM message list for a chat request: system prompt, history and the user's message.
+
+    Args:
+        req (ChatRequest): Incoming chat request.
+        llm (Chat, optional): Client the prompt is built for; its model's context window bounds the prompt.
+        prepared (PreparedContext, optional): Result of prepare_context() for this request.
+
+    Returns:
+        list: Messages for the LLM.
+    """
+    if req.history:
+        print(f"Chat history provided: {len(req.history)} messages")
+
+    budget = PromptBudget(llm.model, "chat")
+    budget.add("message", req.message)
+    # The calendar may use at most half of what the user's message leaves free
+    calendar_tokens = min(CALENDAR_CONTEXT_TOKENS, budget.remaining // 2)
+    formatter = prepared.format_event if prepared is not None else format_event
+    system_prompt = build_system_prompt(req.calendar, req.timezone, req.message, calendar_tokens, formatter)
+    budget.add("system", system_prompt["content"])
+
+    # Старые сообщения заменяются накопительным кратким содержанием
+    messages = [system_prompt]
+    summary, recent = prepared.folded_history if prepared is not None else await fold_chat_history(req)
+    if summary:
+        summary_message = {"role": "system", "content": f"История чата (сжата): {summary}"}
+        budget.add("history_summary", summary_message["content"])
+        messages.append(summary_message)
+    recent_messages = []
+    for hist_msg in recent:
+        if isinstance(hist_msg, dict) and 'role' in hist_msg and 'content' in hist_msg:
+            role = hist_msg['role']
+            if role == 'llm':
+                role = 'assistant'
+            recent_messages.append({"role": role, "content": hist_msg['content']})
+    # Oldest messages are dropped first when the history does not fit
+    kept = budget.fit_items("history", recent_messages[::-1], render=lambda m: m["content"])
+    messages.extend(kept[::-1])
+
+    messages.append({"role": "user", "content": req.message})
+    budget.record()
+
+    logger.info(f"Built messages with system prompt + history + current, total messages: {len(messages)}")
+    return messages
+
+
+def sse_event(data, event=None):
+    """
+    Formats a Server-Sent Events frame.
+
+    Args:
+        data (dict | str): Payload; dicts are JSON-encoded.
+        event (str, optional): Event name.
+
+    Returns:
+        str: SSE frame.
+    """
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False)
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {data}\n\n"
+
+
 @app.post("/", response_model=ChatResponse)
-def chat(req: ChatRequest):
+async def chat(req: ChatRequest):
     """
     Handles chat requests, builds prompt, sends to LLM, and returns the response.
 
@@ -204,38 +365,14 @@ def chat(req: ChatRequest):
     """
     try:
         logger.info(f"Received chat request: {req.message[:50]}...")
-        if req.history:
-            print(f"Chat history provided: {len(req.history)} messages")
-        
-        system_prompt = build_system_prompt(req.calendar, req.timezone)
-        
-        # Сжимаем историю, если сообщений >= 50
-        messages = [system_prompt]
-        history = req.history or []
-        if len(history) >= 50:
-            # Собираем текстовую историю для сжатия
-            history_text = '\n'.join([f"{m.get('role','user')}: {m.get('content','')}" for m in history])
-            compress_prompt = {
-                "role": "system",
-                "content": "Сожми следующую историю чата в 3-6 предложений, сохраняя суть диалога:"
-            }
-            compress_user = {"role": "user", "content": history_text}
-            summary = model.chat([compress_prompt, compress_user])
-            # Заменяем историю на одно сжатое сообщение
-            messages.append({"role": "system", "content": f"История чата (сжата): {summary}"})
-        else:
-            for hist_msg in history:
-
-                if isinstance(hist_msg, dict) and 'role' in hist_msg and 'content' in hist_msg:
-                    role = hist_msg['role']
-                    if role == 'llm':
-                        role = 'assistant'
-                    messages.append({"role": role, "content": hist_msg['content']})
-
-        messages.append({"role": "user", "content": req.message})
-
-        logger.info(f"Built messages with system prompt + history + current, total messages: {len(messages)}")
-        reply = model.chat(messages)
+        llm = route(req.message)
+        messages = await build_messages(req, llm)
+        try:
+            reply = normalize_reply(await llm.chat(messages, endpoint="chat"))
+        except LLM_UNAVAILABLE_ERRORS as e:
+            logger.warning(f"LLM unavailable, answering with the fallback reply: {e}")
+            metrics.inc("llm_fallbacks", endpoint="chat")
+            reply = FALLBACK_REPLY
         logger.info(f"Got reply from model: {reply[:50] if reply else 'None'}...")
         return ChatResponse(response=reply)
     except Exception as e:
@@ -243,38 +380,298 @@ def chat(req: ChatRequest):
         raise HTTPException(status_code=500, detail=f"ML Service Error: {str(e)}")
 
 
+@app.post("/stream")
+async def chat_stream(req: ChatRequest):
+    """
+    Streams the LLM's reply as Server-Sent Events.
+
+    Each frame carries ``{"delta": "..."}``; the stream ends with ``data: [DONE]``.
+    Upstream failures after the stream has started are reported as an ``error`` event.
+
+    Args:
+        req (ChatRequest): Incoming chat request.
+
+    Returns:
+        StreamingResponse: ``text/event-stream`` of reply deltas.
+    """
+    try:
+        logger.info(f"Received streaming chat request: {req.message[:50]}...")
+        llm = route(req.message)
+        messages = await build_messages(req, llm)
+    except Exception as e:
+        logger.error(f"Chat stream endpoint error: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"ML Service Error: {str(e)}")
+
+    async def relay():
+        try:
+            async for delta in normalize_stream(llm.stream(messages)):
+                yield sse_event({"delta": delta})
+        except LLM_UNAVAILABLE_ERRORS as e:
+            logger.warning(f"LLM unavailable, streaming the fallback reply: {e}")
+            metrics.inc("llm_fallbacks", endpoint="chat")
+            yield sse_event({"delta": FALLBACK_REPLY})
+        except Exception as e:
+            logger.error(f"Chat stream error: {e}", exc_info=True)
+            yield sse_event({"detail": f"ML Service Error: {str(e)}"}, event="error")
+        yield sse_event("[DONE]")
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.post("/context", response_model=ContextResponse)
+async def store_context(req: ContextRequest):
+    """
+    Stores the user's calendar and history so voice requests can reference them by id.
+
+    The id is derived from the content, so storing an unchanged context again returns the same id.
+
+    Args:
+        req (ContextRequest): Calendar, history, timezone and conversation id.
+
+    Returns:
+        ContextResponse: context_id to pass to /voice and how long it stays valid, in seconds.
+    """
+    context = req.model_dump()
+    context_id = canonical_key("context", context)
+    await context_store.set(context_id, context, CONTEXT_TTL)
+    return ContextResponse(context_id=context_id, expires_in=CONTEXT_TTL)
+
+
+async def resolve_context(context_id=None, **fields):
+    """
+    Returns the chat context of a voice request.
+
+    Args:
+        context_id (str, optional): Id returned by POST /context.
+        **fields: Context fields sent with the request itself; they override stored ones.
+
+    Returns:
+        dict: calendar, history, timezone and conversation_id, as far as known.
+
+    Raises:
+        HTTPException: 404 if the context is unknown or expired.
+    """
+    context = {}
+    if context_id:
+        stored = await context_store.get(context_id)
+        if stored is None:
+            raise HTTPException(status_code=404, detail="Context not found or expired, store it again via /context.")
+        context.update(stored)
+    context.update({name: value for name, value in fields.items() if value is not None})
+    return context
+
+
+def parse_json_field(name, value):
+    """
+    Decodes a JSON-encoded multipart form field.
+
+    Raises:
+        HTTPException: 422 if the field is not valid JSON.
+    """
+    if value is None:
+        return None
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=422, detail=f"Field '{name}' must be JSON.")
+
+
+async def read_upload(file: UploadFile, chunk_size=64 * 1024):
+    """
+    Reads an uploaded clip into memory chunk by chunk.
+
+    Raises:
+        HTTPException: 413 if the clip exceeds VOICE_MAX_UPLOAD_BYTES.
+    """
+    data = bytearray()
+    while chunk := await file.read(chunk_size):
+        data.extend(chunk)
+        if len(data) > VOICE_MAX_UPLOAD_BYTES:
+            raise HTTPException(status_code=413, detail="Audio file is too large.")
+    return bytes(data)
+
+
 @app.post("/voice", response_model=VoiceResponse)
-def voice_chat(file: UploadFile = File(...)):
+async def voice_chat(
+    file: UploadFile = File(...),
+    context_id: Optional[str] = Form(None),
+    calendar: Optional[str] = Form(None),
+    history: Optional[str] = Form(None),
+    timezone: Optional[str] = Form(None),
+    conversation_id: Optional[str] = Form(None),
+    language: Optional[str] = Form(None),
+):
     """
     Handles voice chat requests: transcribes audio and gets LLM response.
 
+    The calendar and history are passed by reference (context_id from POST /context)
+    or inline as JSON form fields. They are loaded and folded into the prompt while
+    the clip is being transcribed.
+
     Args:
         file (UploadFile): Uploaded audio file.
+        context_id (str, optional): Stored context to answer with.
+        calendar (str, optional): JSON list of calendar events.
+        history (str, optional): JSON list of chat messages.
+        timezone (str, optional): User's timezone.
+        conversation_id (str, optional): Conversation id for history summaries.
+        language (str, optional): Language hint for transcription, e.g. "ru".
 
     Returns:
         VoiceResponse: Transcription and LLM's reply.
     """
-    tmp_path = None
+    transcription = None
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".wav") as tmp:
-            tmp.write(file.file.read())
-            tmp_path = tmp.name
-
-        result = model_voice.transcribe(tmp_path, fp16=False)
+        audio = await read_upload(file)
+        transcription = asyncio.create_task(transcriber.transcribe(audio, file.content_type, language))
+
+        # Everything that does not need the transcript runs while the clip is transcribed
+        context = await resolve_context(
+            context_id,
+            calendar=parse_json_field("calendar", calendar),
+            history=parse_json_field("history", history),
+            timezone=timezone,
+            conversation_id=conversation_id,
+        )
+        base = ChatRequest(message="", **context)
+        prepared = await prepare_context(base)
+
+        result = await transcription
         text = result["text"].strip()
-
-        system_prompt = build_system_prompt()
-        messages = [system_prompt, {"role": "user", "content": text}]
-        reply = model.chat(messages)
+        logger.info(f"Transcribed {result['audio_seconds']:.1f}s of audio, {result['trimmed_seconds']:.1f}s of silence trimmed")
+        if not text:
+            metrics.inc("voice_no_speech")
+            return VoiceResponse(transcription="", response=NO_SPEECH_REPLY)
+
+        # A shallow copy keeps the calendar events prepare_context() formatted
+        req = base.model_copy(update={"message": text})
+        llm = route(text)
+        messages = await build_messages(req, llm, prepared)
+        try:
+            reply = normalize_reply(await llm.chat(messages, endpoint="chat"))
+        except LLM_UNAVAILABLE_ERRORS as e:
+            logger.warning(f"LLM unavailable, answering with the fallback reply: {e}")
+            metrics.inc("llm_fallbacks", endpoint="voice")
+            reply = FALLBACK_REPLY
 
         return VoiceResponse(transcription=text, response=reply)
+    except HTTPException:
+        raise
+    except TranscriptionQueueFull as e:
+        logger.warning(f"Voice request rejected: {e}")
+        raise HTTPException(
+            status_code=429,
+            detail="Too many voice requests, please retry shortly.",
+            headers={"Retry-After": str(VOICE_RETRY_AFTER)}
+        )
     except Exception as e:
         logger.error(f"Voice chat endpoint error: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"ML Service Error: {e}")
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            os.remove(tmp_path)
+        if transcription is not None and not transcription.done():
+            transcription.cancel()
+
+
+@app.websocket("/voice/stream")
+async def voice_stream(websocket: WebSocket):
+    """
+    Streams a voice message: transcribes it while the user speaks and answers once they stop.
+
+    Client frames: an optional ``{"type": "start", "sample_rate": 16000, "context_id": "...",
+    "calendar": [...], "history": [...], "timezone": "...", "conversation_id": "..."}`` text frame
+    (context_id refers to POST /context, inline fields override it), then binary
+    frames of raw 16-bit mono PCM, and optionally ``{"type": "end"}`` to stop recording.
+
+    Server frames: ``partial`` transcripts while audio arrives, the ``final`` transcript once
+    end of speech is detected, the reply as ``delta`` frames, then ``done`` (or ``error``).
+
+    Args:
+        websocket (WebSocket): Client connection.
+    """
+    await websocket.accept()
+    stream = VoiceStream(transcriber)
+    base = ChatRequest(message="")
+    preparing = None
+    send_lock = asyncio.Lock()
+    partial_task = None
+
+    async def send(payload):
+        async with send_lock:
+            await websocket.send_json(payload)
+
+    async def send_partial():
+        try:
+            text = await stream.partial()
+            if text:
+                await send({"type": "partial", "text": text})
+        except TranscriptionQueueFull:
+            # Partials are best effort; the final transcript is still produced
+            metrics.inc("voice_partials_skipped")
+        except Exception as e:
+            logger.warning(f"Partial transcription failed: {e}")
 
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                return
+            if frame.get("bytes"):
+                stream.feed(frame["bytes"])
+                if stream.speech_ended():
+                    break
+                if stream.partial_due() and (partial_task is None or partial_task.done()):
+                    partial_task = asyncio.create_task(send_partial())
+            elif frame.get("text"):
+                data = json.loads(frame["text"])
+                if data.get("type") == "end":
+                    break
+                if data.get("type") == "start":
+                    stream.sample_rate = int(data.get("sample_rate") or stream.sample_rate)
+                    context = await resolve_context(data.get("context_id"), **{k: data.get(k) for k in CONTEXT_FIELDS})
+                    base = ChatRequest(message="", **context)
+                    # History folding and calendar formatting run while the user is speaking
+                    preparing = asyncio.create_task(prepare_context(base))
+
+        if partial_task is not None:
+            partial_task.cancel()
+        result = await stream.final()
+        text = result["text"].strip()
+        await send({"type": "final", "text": text})
+        if not text:
+            metrics.inc("voice_no_speech")
+            await send({"type": "delta", "delta": NO_SPEECH_REPLY})
+        else:
+            prepared = await preparing if preparing is not None else None
+            req = base.model_copy(update={"message": text})
+            llm = route(text)
+            messages = await build_messages(req, llm, prepared)
+            try:
+                async for delta in normalize_stream(llm.stream(messages)):
+                    await send({"type": "delta", "delta": delta})
+            except LLM_UNAVAILABLE_ERRORS as e:
+                logger.warning(f"LLM unavailable, streaming the fallback reply: {e}")
+                metrics.inc("llm_fallbacks", endpoint="voice")
+                await send({"type": "delta", "delta": FALLBACK_REPLY})
+        await send({"type": "done"})
+        await websocket.close()
+    except WebSocketDisconnect:
+        logger.info("Voice stream client disconnected")
+    except Exception as e:
+        logger.error(f"Voice stream error: {e}", exc_info=True)
+        try:
+            await send({"type": "error", "detail": f"ML Service Error: {e}"})
+            await websocket.close()
+        except (WebSocketDisconnect, RuntimeError):
+            pass
+    finally:
+        if partial_task is not None:
+            partial_task.cancel()
+        if preparing is not None:
+            preparing.cancel()
 
 if __name__ == "__main__":
     logger.info(f"Starting ML service with GROQ_API_KEY: {'*' * (len(GROQ_API_KEY) - 4) + GROQ_API_KEY[-4:] if GROQ_API_KEY else 'NOT SET'}")
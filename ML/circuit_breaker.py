@@ -0,0 +1,112 @@
+import os
+import time
+import logging
+from collections import deque
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Outcomes of the latest calls the breaker decides on.
+LLM_BREAKER_WINDOW = int(os.getenv("LLM_BREAKER_WINDOW", "20"))
+# The breaker does not trip before this many calls are in the window.
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", "5"))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", "0.5"))
+# Calls slower than this count as slow; too many slow calls trip the breaker as well.
+LLM_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("LLM_BREAKER_SLOW_CALL_SECONDS", "10"))
+LLM_BREAKER_SLOW_CALL_RATE = float(os.getenv("LLM_BREAKER_SLOW_CALL_RATE", "0.8"))
+# How long the breaker stays open before a single probe call is let through.
+LLM_BREAKER_OPEN_SECONDS = float(os.getenv("LLM_BREAKER_OPEN_SECONDS", "30"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_GAUGE = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the upstream while the circuit breaker is open."""
+
+
+class CircuitBreaker:
+    """Stops calling an upstream whose recent calls mostly fail or are too slow."""
+
+    def __init__(self, name, window=LLM_BREAKER_WINDOW, min_calls=LLM_BREAKER_MIN_CALLS,
+                 failure_rate=LLM_BREAKER_FAILURE_RATE, slow_call_seconds=LLM_BREAKER_SLOW_CALL_SECONDS,
+                 slow_call_rate=LLM_BREAKER_SLOW_CALL_RATE, open_seconds=LLM_BREAKER_OPEN_SECONDS):
+        """
+        Initialize the breaker.
+
+        Args:
+            name (str): Upstream name used in logs and as the metrics label.
+            window (int, optional): Number of latest calls taken into account.
+            min_calls (int, optional): Calls needed in the window before the breaker may trip.
+            failure_rate (float, optional): Share of failed calls that trips the breaker.
+            slow_call_seconds (float, optional): Duration from which a call counts as slow.
+            slow_call_rate (float, optional): Share of slow calls that trips the breaker.
+            open_seconds (float, optional): Time the breaker stays open before probing the upstream.
+        """
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probing = False
+        self._outcomes = deque(maxlen=window)
+
+    def _set_state(self, state):
+        if state != self.state:
+            logger.warning(f"[{self.name}] Circuit breaker {self.state} -> {state}")
+            self.state = state
+            metrics.inc("circuit_breaker_transitions", breaker=self.name, state=state)
+        metrics.set_gauge("circuit_breaker_state", STATE_GAUGE[state], breaker=self.name)
+
+    def before_call(self):
+        """
+        Lets a call through or refuses it.
+
+        Raises:
+            CircuitOpenError: The breaker is open, or a probe call is already running.
+        """
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_seconds:
+            self._set_state(HALF_OPEN)
+        if self.state == OPEN or (self.state == HALF_OPEN and self._probing):
+            metrics.inc("circuit_breaker_rejected", breaker=self.name)
+            raise CircuitOpenError(f"{self.name} is unavailable, circuit breaker is open")
+        if self.state == HALF_OPEN:
+            self._probing = True
+
+    def record(self, success, duration):
+        """
+        Records the outcome of a call that before_call() let through.
+
+        Args:
+            success (bool): Whether the upstream answered.
+            duration (float): Call duration in seconds.
+        """
+        if self.state == HALF_OPEN:
+            self._probing = False
+            if success and duration < self.slow_call_seconds:
+                self._outcomes.clear()
+                self._set_state(CLOSED)
+            else:
+                self._trip()
+            return
+
+        self._outcomes.append((success, duration >= self.slow_call_seconds))
+        if self.state != CLOSED or len(self._outcomes) < self.min_calls:
+            return
+        failures = sum(1 for ok, _ in self._outcomes if not ok) / len(self._outcomes)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow) / len(self._outcomes)
+        if failures >= self.failure_rate or slow >= self.slow_call_rate:
+            logger.warning(f"[{self.name}] Failure rate {failures:.0%}, slow call rate {slow:.0%}")
+            self._trip()
+
+    def release(self):
+        """Forgets a call that ended without an upstream verdict (cancelled, rejected locally, ...)."""
+        self._probing = False
+
+    def _trip(self):
+        self.opened_at = time.monotonic()
+        self._set_state(OPEN)
@@ -2,21 +2,20 @@ import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import Optional, List
+from typing import Literal, Optional, List
 import uvicorn
-from chat import Chat
-import os
-import re
+from llm_client import LLM_UNAVAILABLE_ERRORS, model
+from metrics import metrics
+from poi_ranker import GEO_POI_SHORTLIST, describe_place, rank_places
+from poi_snapper import PlaceIndex
+from prompt_budget import PromptBudget
+from structured_output import StructuredOutputError, parse_items
 from pydantic import Field
-import json
 import logging
 
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable not set")
-
-model = Chat("llama3-70b-8192", GROQ_API_KEY)
+GEO_USER_MESSAGE = "Please suggest places."
+GEO_RECOMMENDATION_COUNT = 10
 
 app = FastAPI(title="Location-based Recommender")
 
@@ -36,6 +35,8 @@ class GeoRecommendationRequest(BaseModel):
     local_time: Optional[str] = None
     timezone: Optional[str] = None
     nearby_places: Optional[List[dict]] = None
+    # "fast" ranks the nearby places locally without the LLM, "rich" has the LLM write the answer
+    mode: Literal["fast", "rich"] = "rich"
 
    
 
@@ -45,6 +46,7 @@ class RecommendationItem(BaseModel):
     latitude: float
     longitude: float
     confidence: float = Field(..., ge=0, le=10)
+    category: Optional[str] = None
 
 
 
@@ -75,41 +77,56 @@ def build_geo_prompt(data: GeoRecommendationRequest) -> dict:
             local_time_str += f" ({data.timezone})"
         local_time_str += ".\n"
 
+    def render(nearby_places_str):
+        return (
+            f"You are a helpful and knowledgeable local guide.\n"
+            f"The user is currently located at: {data.position or 'Unknown location'}.\n"
+            f"Today is {day_of_week}, {date_str}, and the weather is: {data.weather or 'unknown'}.\n"
+            f"{local_time_str}"
+            f"{nearby_places_str}"
+            f"The user is a {user_desc}.\n"
+            f"Based on this information, recommend {GEO_RECOMMENDATION_COUNT} interesting places nearby to visit.\n"
+            f"For each place, return a valid JSON object with the following fields:\n"
+            f"- name: string (the name of the place)\n"
+            f"- description: string (brief description)\n"
+            f"- latitude: float\n"
+            f"- longitude: float\n"
+            f"- confidence: float (0 to 10, how confident you are about this suggestion)\n\n"
+            f"Respond ONLY with a JSON array of {GEO_RECOMMENDATION_COUNT} objects like this:\n"
+            f"[{{\"name\": \"...\", \"description\": \"...\", \"latitude\": ..., \"longitude\": ..., \"confidence\": ...}}, ...]"
+        )
+
+    budget = PromptBudget(model.model, "recommend")
+    budget.add("user_message", GEO_USER_MESSAGE)
+    budget.add("instructions", render(""))
+
     # Добавляем nearby_places, если есть
     nearby_places_str = ""
-    if hasattr(data, "nearby_places") and data.nearby_places:
+    # Only a locally ranked shortlist goes into the prompt, best places first
+    shortlist = rank_places(
+        data.nearby_places, data.position, data.description, data.weather, data.local_time, data.age,
+        top_k=max(GEO_POI_SHORTLIST, GEO_RECOMMENDATION_COUNT)
+    )
+    if shortlist:
         # Формируем краткий список POI для промпта
         poi_lines = []
-        for poi in data.nearby_places:
+        for poi in shortlist:
             name = poi.get("name", "")
             poi_type = poi.get("type", "")
             address = poi.get("address", "")
             lat = poi.get("lat", "")
             lon = poi.get("lon", "")
-            poi_lines.append(f"- {name} ({poi_type}), {address}, {lat},{lon}")
+            distance = f", {poi['distance_km']} km away" if "distance_km" in poi else ""
+            poi_lines.append(f"- {name} ({poi_type}), {address}, {lat},{lon}{distance}")
+        # Места в конце списка отбрасываются первыми, если промпт не помещается в контекст
+        poi_lines = budget.fit_items("nearby_places", poi_lines)
         nearby_places_str = (
             "Here is a list of real places nearby. Choose the best ones for the user from this list only.\n" +
             "\n".join(poi_lines) + "\n\n"
         )
+    budget.record()
 
-    prompt = (
-        f"You are a helpful and knowledgeable local guide.\n"
-        f"The user is currently located at: {data.position or 'Unknown location'}.\n"
-        f"Today is {day_of_week}, {date_str}, and the weather is: {data.weather or 'unknown'}.\n"
-        f"{local_time_str}"
-        f"{nearby_places_str}"
-        f"The user is a {user_desc}.\n"
-        f"Based on this information, recommend 10 interesting places nearby to visit.\n"
-        f"For each place, return a valid JSON object with the following fields:\n"
-        f"- name: string (the name of the place)\n"
-        f"- description: string (brief description)\n"
-        f"- latitude: float\n"
-        f"- longitude: float\n"
-        f"- confidence: float (0 to 10, how confident you are about this suggestion)\n\n"
-        f"Respond ONLY with a JSON array of 10 objects like this:\n"
-        f"[{{\"name\": \"...\", \"description\": \"...\", \"latitude\": ..., \"longitude\": ..., \"confidence\": ...}}, ...]"
-    )
-
+    prompt = render(nearby_places_str)
     return {"role": "system", "content": prompt}
 
 
@@ -117,49 +134,118 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
+def fast_recommendations(data: GeoRecommendationRequest) -> GeoRecommendationResponse:
+    """
+    Recommends the best-ranked nearby places without calling the LLM.
+
+    Serves mode="fast" and is the fallback while the LLM is unavailable or its
+    reply is unusable. Places are ranked by poi_ranker and get templated descriptions;
+    the ranking score becomes the confidence.
+
+    Args:
+        data (GeoRecommendationRequest): Incoming request.
+
+    Returns:
+        GeoRecommendationResponse: Up to GEO_RECOMMENDATION_COUNT places.
+    """
+    ranked = rank_places(
+        data.nearby_places, data.position, data.description, data.weather, data.local_time, data.age,
+        top_k=GEO_RECOMMENDATION_COUNT
+    )
+    items = [
+        RecommendationItem(
+            name=place["name"],
+            description=describe_place(place),
+            latitude=float(place["lat"]),
+            longitude=float(place["lon"]),
+            confidence=round(min(max(place["score"] * 10, 0), 10), 1),
+            category=place["category"]
+        )
+        for place in ranked
+    ]
+    return GeoRecommendationResponse(recommendations=items)
+
+
+def snap_to_places(items: List[RecommendationItem], nearby_places: Optional[List[dict]]) -> List[RecommendationItem]:
+    """
+    Replaces the LLM's coordinates with those of the real places it recommended.
+
+    Each item is matched to one of the nearby places by name similarity and distance
+    (see poi_snapper). Matched items get the place's name and coordinates; items that
+    match no place, or a place already recommended, are dropped. Without nearby places
+    there is nothing to check against and the items are returned unchanged.
+
+    Args:
+        items (list): Recommendations parsed from the LLM reply.
+        nearby_places (list, optional): Real places sent by the backend.
+
+    Returns:
+        list: Recommendations that point to real places.
+    """
+    index = PlaceIndex(nearby_places)
+    if not len(index):
+        return items
+    snapped, used = [], set()
+    for item in items:
+        match = index.match(item.name, item.latitude, item.longitude)
+        if match is None or match[0] in used:
+            outcome = "unmatched" if match is None else "duplicate"
+            logger.info(f"[ML] Dropping {outcome} recommendation {item.name!r} at {item.latitude},{item.longitude}")
+            metrics.inc("recommend_snapping", outcome=outcome)
+            continue
+        i, distance = match
+        used.add(i)
+        place = index.places[i]
+        metrics.inc("recommend_snapping", outcome="snapped")
+        metrics.observe("recommend_snap_distance_km", distance)
+        snapped.append(item.model_copy(update={
+            "name": place["name"], "latitude": float(place["lat"]), "longitude": float(place["lon"])
+        }))
+    return snapped
+
+
 @app.post("/", response_model=GeoRecommendationResponse)
-def recommend(req: GeoRecommendationRequest):
+async def recommend(req: GeoRecommendationRequest):
     try:
         logger.info(f"[ML] Incoming payload: {req.dict()}")
+        metrics.inc("recommend_requests", mode=req.mode)
+        if req.mode == "fast":
+            return fast_recommendations(req)
         system_prompt = build_geo_prompt(req)
         logger.info(f"[ML] Built system prompt: {system_prompt}")
-        messages = [system_prompt, {"role": "user", "content": "Please suggest places."}]
-        response = model.chat(messages)
+        messages = [system_prompt, {"role": "user", "content": GEO_USER_MESSAGE}]
+        try:
+            response = await model.chat(messages, endpoint="recommend")
+        except LLM_UNAVAILABLE_ERRORS as e:
+            if not req.nearby_places:
+                raise HTTPException(status_code=503, detail="Recommendations are temporarily unavailable.")
+            logger.warning(f"[ML] LLM unavailable, returning locally ranked places: {e}")
+            metrics.inc("llm_fallbacks", endpoint="recommend")
+            return fast_recommendations(req)
         logger.info(f"[ML] LLM raw response: {response}")
         
         # Log the raw response before JSON parsing
         logger.info(f"[ML] Raw LLM response length: {len(response)}")
         logger.info(f"[ML] Raw LLM response first 200 chars: {response[:200]}")
         
-        json_match = re.search(r'(\[\s*{.*}\s*\])', response, re.DOTALL)
-        if not json_match:
-            logger.error("[ML] No valid JSON found in model response")
-            logger.error(f"[ML] Full response that didn't contain JSON: {response}")
-            raise HTTPException(status_code=500, detail="ML returned invalid JSON. Please try again later.")
-        
-        json_str = json_match.group(1)
-        logger.info(f"[ML] Extracted JSON string: {json_str}")
-        
         try:
-            parsed = json.loads(json_str)
-            logger.info(f"[ML] Successfully parsed JSON: {parsed}")
-        except Exception as e:
-            logger.error(f"[ML] JSON parse error: {e}")
-            logger.error(f"[ML] JSON string that failed to parse: {json_str}")
-            raise HTTPException(status_code=500, detail="ML returned malformed JSON. Please try again later.")
-        
-        # Validate the parsed structure
-        if not isinstance(parsed, list):
-            logger.error(f"[ML] Parsed result is not a list: {type(parsed)}")
-            raise HTTPException(status_code=500, detail="ML returned invalid structure. Expected list.")
-        
-        logger.info(f"[ML] Parsed recommendations count: {len(parsed)}")
-        logger.info(f"[ML] Parsed recommendations: {parsed}")
-        
-        # Create response object
-        response_obj = GeoRecommendationResponse(recommendations=parsed)
+            items = parse_items(response, RecommendationItem, "recommend")
+        except StructuredOutputError as e:
+            logger.error(f"[ML] No usable recommendations in model response: {e}")
+            if not req.nearby_places:
+                raise HTTPException(status_code=500, detail="ML returned invalid JSON. Please try again later.")
+            metrics.inc("llm_fallbacks", endpoint="recommend")
+            return fast_recommendations(req)
+
+        logger.info(f"[ML] Parsed recommendations count: {len(items)}")
+        items = snap_to_places(items, req.nearby_places)
+        if not items:
+            logger.warning("[ML] No recommendation matches a real place, returning locally ranked places")
+            metrics.inc("llm_fallbacks", endpoint="recommend")
+            return fast_recommendations(req)
+        response_obj = GeoRecommendationResponse(recommendations=items)
         logger.info(f"[ML] Final response object: {response_obj.dict()}")
-        
+
         return response_obj
     except HTTPException as e:
         logger.error(f"[ML] HTTPException raised: {e.detail}")
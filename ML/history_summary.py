@@ -0,0 +1,167 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Directory of the service's local state; created when the first store is opened.
+ML_DATA_DIR = os.getenv("ML_DATA_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data"))
+HISTORY_SUMMARY_DB = os.getenv("HISTORY_SUMMARY_DB", os.path.join(ML_DATA_DIR, "history_summaries.sqlite3"))
+# Number of latest messages that are always sent to the LLM verbatim.
+HISTORY_KEEP_RECENT = int(os.getenv("HISTORY_KEEP_RECENT", "20"))
+# How many not-yet-summarised messages may pile up before the next compaction.
+HISTORY_COMPACT_BATCH = int(os.getenv("HISTORY_COMPACT_BATCH", "30"))
+# Conversations without an id are recognised by this many opening messages.
+HISTORY_KEY_MESSAGES = int(os.getenv("HISTORY_KEY_MESSAGES", "4"))
+
+COMPACT_PROMPT = (
+    "Обнови краткое содержание диалога, добавив в него новые сообщения. "
+    "Ответь 3-6 предложениями, сохраняя суть диалога."
+)
+
+
+def _prefix_hash(messages):
+    """Fingerprint of the messages already folded into a summary."""
+    canonical = json.dumps(
+        [[m.get("role"), m.get("content")] if isinstance(m, dict) else str(m) for m in messages],
+        ensure_ascii=False, separators=(",", ":")
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def conversation_key(conversation_id, history):
+    """
+    Returns the key a conversation's summary is stored under.
+
+    Without an id the key is derived from the conversation's opening
+    HISTORY_KEY_MESSAGES messages, which stay the same as it grows. Two
+    conversations that open alike share a key, but never a summary: a checkpoint
+    is only used if the messages it covers match the history, see fold_history().
+
+    Args:
+        conversation_id (str, optional): Explicit user or conversation id.
+        history (list): Chat history.
+
+    Returns:
+        str: Storage key, or None for a history too short to tell apart.
+    """
+    if conversation_id:
+        return str(conversation_id)
+    if len(history or []) <= HISTORY_KEY_MESSAGES:
+        return None
+    return f"history:{_prefix_hash(history[:HISTORY_KEY_MESSAGES])}"
+
+
+class SummaryStore:
+    """SQLite-backed storage of rolling conversation summaries."""
+
+    def __init__(self, path=HISTORY_SUMMARY_DB):
+        """
+        Initialize the store; the database is only created by open().
+
+        Args:
+            path (str): Path to the SQLite database file.
+        """
+        self.path = path
+        self._opened = False
+
+    def open(self):
+        """Creates the database directory and table if needed; safe to call repeatedly."""
+        if self._opened:
+            return
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        with sqlite3.connect(self.path, timeout=5) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "conversation_id TEXT PRIMARY KEY, "
+                "summary TEXT NOT NULL, "
+                "covered INTEGER NOT NULL, "
+                "prefix_hash TEXT NOT NULL, "
+                "updated_at REAL NOT NULL)"
+            )
+        self._opened = True
+        logger.info(f"History summaries stored in {self.path}")
+
+    def _connect(self):
+        self.open()
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        """
+        Returns the stored checkpoint for a conversation.
+
+        Returns:
+            tuple: (summary, covered, prefix_hash) or None.
+        """
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT summary, covered, prefix_hash FROM summaries WHERE conversation_id = ?",
+                (key,)
+            ).fetchone()
+        return row
+
+    def put(self, key, summary, covered, prefix_hash):
+        """Stores a new checkpoint for a conversation."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?, ?)",
+                (key, summary, covered, prefix_hash, time.time())
+            )
+
+
+store = SummaryStore()
+
+
+async def fold_history(key, history, llm):
+    """
+    Replaces old chat history with a rolling summary.
+
+    Only messages newer than the stored checkpoint are folded in, and only once
+    more than HISTORY_KEEP_RECENT + HISTORY_COMPACT_BATCH of them have piled up.
+    A checkpoint whose folded prefix no longer matches the history is discarded.
+
+    Args:
+        key (str): Conversation key from conversation_key().
+        history (list): Full chat history, oldest first.
+        llm (Chat): Client used for compaction.
+
+    Returns:
+        tuple: (summary or None, messages that still have to be sent verbatim).
+    """
+    if not key:
+        return None, history
+
+    summary, covered = None, 0
+    checkpoint = await asyncio.to_thread(store.get, key)
+    if checkpoint:
+        stored_summary, stored_covered, stored_hash = checkpoint
+        if stored_covered <= len(history) and _prefix_hash(history[:stored_covered]) == stored_hash:
+            summary, covered = stored_summary, stored_covered
+        else:
+            logger.info(f"Discarding stale history summary for conversation {key}")
+
+    if len(history) - covered > HISTORY_KEEP_RECENT + HISTORY_COMPACT_BATCH:
+        fold_until = len(history) - HISTORY_KEEP_RECENT
+        new_text = "\n".join(
+            f"{m.get('role', 'user')}: {m.get('content', '')}" for m in history[covered:fold_until]
+        )
+        content = f"Текущее краткое содержание: {summary}\n\nНовые сообщения:\n{new_text}" if summary else new_text
+        logger.info(f"Folding messages {covered}..{fold_until} into summary for conversation {key}")
+        try:
+            summary = await llm.chat([
+                {"role": "system", "content": COMPACT_PROMPT},
+                {"role": "user", "content": content}
+            ], endpoint="summary")
+        except Exception as e:
+            # Compaction is best effort; the prompt budget trims the unfolded history instead
+            logger.warning(f"History compaction failed for conversation {key}: {e}")
+            return summary, history[covered:]
+        covered = fold_until
+        await asyncio.to_thread(store.put, key, summary, covered, _prefix_hash(history[:covered]))
+
+    return summary, history[covered:]
@@ -0,0 +1,197 @@
+import json
+import math
+import os
+import random
+import re
+import time
+import logging
+from collections import Counter
+
+from llm_client import DEFAULT_MODEL, client_for
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("greeting", "general", "calendar_query", "calendar_mutation")
+
+ROUTER_MODEL_PATH = os.getenv("ROUTER_MODEL_PATH", "router_model.json")
+ROUTER_SEED_PATH = os.getenv("ROUTER_SEED_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "router_seed.jsonl"))
+# Messages classified with a lower probability go to the default (largest) model.
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", "0.6"))
+LLM_MODEL_SMALL = os.getenv("LLM_MODEL_SMALL", "llama-3.1-8b-instant")
+
+# Model used for each class of message.
+ROUTE_MODELS = {
+    "greeting": os.getenv("ROUTER_MODEL_GREETING", LLM_MODEL_SMALL),
+    "general": os.getenv("ROUTER_MODEL_GENERAL", LLM_MODEL_SMALL),
+    "calendar_query": os.getenv("ROUTER_MODEL_CALENDAR_QUERY", DEFAULT_MODEL),
+    "calendar_mutation": os.getenv("ROUTER_MODEL_CALENDAR_MUTATION", DEFAULT_MODEL),
+}
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def extract_features(text):
+    """
+    Turns a message into sparse term counts: words, word bigrams and character
+    trigrams of words (the latter cope with Russian inflection).
+
+    Args:
+        text (str): User's message.
+
+    Returns:
+        Counter: Feature counts.
+    """
+    words = WORD_RE.findall((text or "").lower())
+    features = Counter(f"w:{word}" for word in words)
+    features.update(f"b:{a}_{b}" for a, b in zip(words, words[1:]))
+    for word in words:
+        padded = f"<{word}>"
+        features.update(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    if "?" in (text or ""):
+        features["p:?"] += 1
+    if len(words) <= 2:
+        features["len:short"] += 1
+    return features
+
+
+class IntentClassifier:
+    """TF-IDF features with a multinomial logistic regression on top, in plain Python."""
+
+    def __init__(self, labels=LABELS, idf=None, weights=None, bias=None):
+        self.labels = list(labels)
+        self.idf = idf or {}
+        self.weights = weights or {label: {} for label in self.labels}
+        self.bias = bias or {label: 0.0 for label in self.labels}
+
+    def _vector(self, text):
+        vector = {
+            feature: (1 + math.log(count)) * self.idf[feature]
+            for feature, count in extract_features(text).items() if feature in self.idf
+        }
+        norm = math.sqrt(sum(v * v for v in vector.values())) or 1.0
+        return {feature: v / norm for feature, v in vector.items()}
+
+    def _probabilities(self, vector):
+        scores = {
+            label: self.bias[label] + sum(self.weights[label].get(f, 0.0) * v for f, v in vector.items())
+            for label in self.labels
+        }
+        top = max(scores.values())
+        exps = {label: math.exp(score - top) for label, score in scores.items()}
+        total = sum(exps.values())
+        return {label: e / total for label, e in exps.items()}
+
+    def fit(self, texts, labels, epochs=40, learning_rate=0.5, l2=1e-4, seed=13):
+        """
+        Trains the classifier with stochastic gradient descent.
+
+        Args:
+            texts (list): Training messages.
+            labels (list): Class of each message, one of self.labels.
+            epochs (int, optional): Passes over the data.
+            learning_rate (float, optional): SGD step size.
+            l2 (float, optional): L2 regularisation strength.
+            seed (int, optional): Shuffling seed, for reproducible models.
+
+        Returns:
+            IntentClassifier: self.
+        """
+        document_frequency = Counter()
+        for text in texts:
+            document_frequency.update(extract_features(text).keys())
+        total = len(texts)
+        self.idf = {f: math.log((1 + total) / (1 + df)) + 1 for f, df in document_frequency.items()}
+
+        samples = [(self._vector(text), label) for text, label in zip(texts, labels)]
+        rng = random.Random(seed)
+        for epoch in range(epochs):
+            rng.shuffle(samples)
+            step = learning_rate / (1 + epoch * 0.1)
+            for vector, label in samples:
+                probabilities = self._probabilities(vector)
+                for candidate in self.labels:
+                    gradient = probabilities[candidate] - (1.0 if candidate == label else 0.0)
+                    weights = self.weights[candidate]
+                    for feature, value in vector.items():
+                        w = weights.get(feature, 0.0)
+                        weights[feature] = w - step * (gradient * value + l2 * w)
+                    self.bias[candidate] -= step * gradient
+        return self
+
+    def predict(self, text):
+        """
+        Classifies a message.
+
+        Returns:
+            tuple: (label, probability).
+        """
+        probabilities = self._probabilities(self._vector(text))
+        label = max(probabilities, key=probabilities.get)
+        return label, probabilities[label]
+
+    def to_dict(self):
+        return {"labels": self.labels, "idf": self.idf, "weights": self.weights, "bias": self.bias}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["labels"], data["idf"], data["weights"], data["bias"])
+
+
+def load_examples(path):
+    """
+    Reads labelled messages from a JSONL file of {"text", "label"} objects.
+
+    Returns:
+        tuple: (texts, labels).
+    """
+    texts, labels = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                example = json.loads(line)
+                texts.append(example["text"])
+                labels.append(example["label"])
+    return texts, labels
+
+
+def load_classifier(model_path=ROUTER_MODEL_PATH, seed_path=ROUTER_SEED_PATH):
+    """
+    Loads the trained router, or trains one on the seed corpus if none was saved.
+
+    Returns:
+        IntentClassifier: Classifier, or None if neither a model nor the seed corpus is available.
+    """
+    if os.path.exists(model_path):
+        with open(model_path, encoding="utf-8") as f:
+            logger.info(f"Loading message router from {model_path}")
+            return IntentClassifier.from_dict(json.load(f))
+    if os.path.exists(seed_path):
+        started = time.perf_counter()
+        classifier = IntentClassifier().fit(*load_examples(seed_path))
+        logger.info(f"Trained message router on the seed corpus in {time.perf_counter() - started:.2f}s")
+        return classifier
+    logger.warning("No router model or seed corpus found, every message goes to the default model")
+    return None
+
+
+classifier = load_classifier()
+
+
+def route(message):
+    """
+    Picks the LLM client for a chat message.
+
+    Args:
+        message (str): User's message.
+
+    Returns:
+        Chat: Client of the model tier for the message's class.
+    """
+    if classifier is None:
+        return client_for(DEFAULT_MODEL)
+    label, probability = classifier.predict(message)
+    model_name = ROUTE_MODELS[label] if probability >= ROUTER_MIN_CONFIDENCE else DEFAULT_MODEL
+    metrics.inc("router_decisions", label=label, model=model_name)
+    logger.info(f"Routed message as '{label}' ({probability:.2f}) to {model_name}")
+    return client_for(model_name)
@@ -0,0 +1,342 @@
+import asyncio
+import json
+import os
+import logging
+
+import httpx
+
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from metrics import metrics
+from prompt_budget import count_message_tokens, count_tokens
+from rate_limiter import (
+    LLM_COMPLETION_TOKENS_ESTIMATE, LLM_MAX_RETRIES, RETRYABLE_STATUS_CODES,
+    RateLimiter, RateLimitExceeded, backoff_delay,
+)
+from response_cache import LLM_CACHE_TTLS, canonical_key, llm_cache
+from single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+if not GROQ_API_KEY:
+    raise ValueError("GROQ_API_KEY environment variable not set")
+
+GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
+DEFAULT_MODEL = os.getenv("LLM_MODEL", "llama3-70b-8192")
+
+# Upper bound for a single LLM call, including the time spent waiting for a free slot.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))
+# How many upstream calls may be in flight at once for the whole process.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "256"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "64"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TEMPERATURE = 0.5
+
+# Errors raised without waiting for the provider; endpoints answer them with their degraded-mode fallback.
+LLM_UNAVAILABLE_ERRORS = (CircuitOpenError, RateLimitExceeded)
+
+
+class Chat:
+    """Asynchronous wrapper for Groq LLM chat API with a pooled HTTP/2 connection."""
+
+    def __init__(self, model_name, api_key, timeout=LLM_TIMEOUT,
+                 max_concurrency=LLM_MAX_CONCURRENCY, max_connections=LLM_MAX_CONNECTIONS,
+                 temperature=LLM_TEMPERATURE, cache=llm_cache, limiter=None, breaker=None):
+        """
+        Initialize the Chat class.
+
+        Args:
+            model_name (str): Name of the LLM model.
+            api_key (str): API key for Groq.
+            timeout (float, optional): Default per-call deadline in seconds.
+            max_concurrency (int, optional): Maximum number of concurrent upstream calls.
+            max_connections (int, optional): Size of the keep-alive connection pool.
+            temperature (float, optional): Sampling temperature.
+            cache (ResponseCache, optional): Cache of replies, None to disable caching.
+            limiter (RateLimiter, optional): Provider rate limits, a default limiter is created if omitted.
+            breaker (CircuitBreaker, optional): Breaker guarding the provider, a default one is created if omitted.
+        """
+        self.model = model_name
+        self.api_key = api_key
+        self.api_url = GROQ_API_URL
+        self.timeout = timeout
+        self.temperature = temperature
+        self.cache = cache
+        self.limiter = limiter or RateLimiter()
+        self.breaker = breaker or CircuitBreaker("llm")
+        self.max_connections = max_connections
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._flights = SingleFlight("llm")
+        self._client = None
+
+    def _get_client(self):
+        """
+        Returns the shared HTTP client, creating it on first use.
+
+        The client is created lazily so that it is bound to the running event loop.
+        """
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=True,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json"
+                },
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=LLM_KEEPALIVE_EXPIRY
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=5.0)
+            )
+        return self._client
+
+    async def _request(self, messages, estimated_tokens):
+        """Sends one request; the caller holds a concurrency slot."""
+        logger.info(f"Sending request to Groq API with {len(messages)} messages")
+        response = await self._get_client().post(
+            self.api_url,
+            json={
+                "model": self.model,
+                "messages": messages,
+                "temperature": self.temperature
+            }
+        )
+        logger.info(f"Response status: {response.status_code}")
+        self.limiter.update_from_headers(response.headers)
+        if response.is_error:
+            logger.warning(f"Response content: {response.text}")
+        response.raise_for_status()
+        try:
+            result = response.json()
+            self.limiter.settle(estimated_tokens, result.get("usage", {}).get("total_tokens"))
+            return result['choices'][0]['message']['content'].strip()
+        except (KeyError, IndexError, ValueError) as e:
+            logger.error(f"Response parsing error: {e}, Response: {response.text}")
+            raise
+
+    def _record_outcome(self, error, duration, sent=True):
+        """
+        Reports a finished upstream call to the circuit breaker.
+
+        Calls that failed before they were sent, e.g. while waiting for a free
+        concurrency slot, say nothing about the provider and are only released.
+        """
+        if not sent:
+            self.breaker.release()
+        elif error is None:
+            self.breaker.record(True, duration)
+        elif isinstance(error, (asyncio.TimeoutError, httpx.TransportError)) or (
+                isinstance(error, httpx.HTTPStatusError) and error.response.status_code in RETRYABLE_STATUS_CODES):
+            self.breaker.record(False, duration)
+        else:
+            # Cancelled, rejected by the local rate limiter or refused as a bad request
+            self.breaker.release()
+
+    async def _complete(self, messages, deadline, key, ttl):
+        self.breaker.before_call()
+        loop = asyncio.get_running_loop()
+        until = loop.time() + deadline
+        estimated_tokens = count_message_tokens(messages) + LLM_COMPLETION_TOKENS_ESTIMATE
+        attempt = 0
+        error = None
+        while True:
+            started = loop.time()
+            sent = False
+            try:
+                await self.limiter.acquire(estimated_tokens, until)
+                await asyncio.wait_for(self._semaphore.acquire(), max(until - loop.time(), 0))
+                sent = True
+                started = loop.time()
+                try:
+                    reply = await asyncio.wait_for(
+                        self._request(messages, estimated_tokens), max(until - loop.time(), 0)
+                    )
+                finally:
+                    self._semaphore.release()
+                break
+            except asyncio.TimeoutError as e:
+                if sent:
+                    logger.error(f"Groq API call exceeded deadline of {deadline}s")
+                else:
+                    metrics.inc("llm_slot_timeouts")
+                    logger.error(f"No free LLM slot within the deadline of {deadline}s")
+                error = e
+                raise
+            except RateLimitExceeded as e:
+                logger.error(f"Groq API rate limit: {e}")
+                error = e
+                raise
+            except httpx.HTTPError as e:
+                status = e.response.status_code if isinstance(e, httpx.HTTPStatusError) else None
+                retryable = status in RETRYABLE_STATUS_CODES or isinstance(e, httpx.TransportError)
+                # A 429 pauses the limiter for Retry-After, so the next acquire() does the waiting
+                delay = 0 if status == 429 else backoff_delay(attempt)
+                if not retryable or attempt >= LLM_MAX_RETRIES or loop.time() + delay >= until:
+                    logger.error(f"Request error: {e}")
+                    error = e
+                    raise
+                attempt += 1
+                metrics.inc("llm_retries", reason=status or type(e).__name__)
+                logger.warning(f"Retrying Groq API call ({attempt}/{LLM_MAX_RETRIES}) in {delay:.2f}s after: {e}")
+                await asyncio.sleep(delay)
+            except BaseException as e:
+                error = e
+                raise
+            finally:
+                if error is not None:
+                    self._record_outcome(error, loop.time() - started, sent)
+        self._record_outcome(None, loop.time() - started)
+        if ttl > 0:
+            await self.cache.set(key, reply, ttl)
+        return reply
+
+    async def chat(self, messages, timeout=None, endpoint=None):
+        """
+        Sends a chat completion request to Groq API.
+
+        Replies of endpoints with a positive TTL in LLM_CACHE_TTLS are cached
+        by model, messages and temperature. Concurrent calls with the same
+        prompt share a single upstream request.
+
+        Args:
+            messages (list): List of message dicts for the LLM.
+            timeout (float, optional): Deadline for this call in seconds, defaults to the client timeout.
+            endpoint (str, optional): Calling endpoint, selects the cache TTL.
+
+        Returns:
+            str: Model's reply.
+        """
+        key = canonical_key(self.model, messages, self.temperature)
+        ttl = LLM_CACHE_TTLS.get(endpoint, 0) if self.cache is not None else 0
+        if ttl > 0:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                metrics.inc("llm_requests", endpoint=endpoint, source="cache")
+                return cached
+        metrics.inc("llm_requests", endpoint=endpoint or "other", source="upstream")
+
+        deadline = timeout or self.timeout
+        return await self._flights.run(key, lambda: self._complete(messages, deadline, key, ttl))
+
+    async def stream(self, messages, timeout=None):
+        """
+        Streams a chat completion from Groq API as it is generated.
+
+        The rate limiter is charged an estimate up front and settled with the usage
+        of the final chunk, or the counted tokens of the text if none is reported.
+
+        Args:
+            messages (list): List of message dicts for the LLM.
+            timeout (float, optional): Deadline for the whole stream in seconds.
+
+        Yields:
+            str: Text deltas in the order the model produced them.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+
+        def remaining():
+            left = deadline - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+
+        self.breaker.before_call()
+        started = loop.time()
+        error = None
+        prompt_tokens = count_message_tokens(messages)
+        estimated_tokens = prompt_tokens + LLM_COMPLETION_TOKENS_ESTIMATE
+        try:
+            await self.limiter.acquire(estimated_tokens, deadline)
+            await asyncio.wait_for(self._semaphore.acquire(), remaining())
+        except BaseException as e:
+            if isinstance(e, asyncio.TimeoutError):
+                metrics.inc("llm_slot_timeouts")
+            # Nothing was sent yet, so local congestion does not count against the provider
+            self._record_outcome(e, loop.time() - started, sent=False)
+            raise
+        started = loop.time()
+        # Usage the provider reports in the final chunk, otherwise counted from the text
+        usage = None
+        streamed = []
+        try:
+            logger.info(f"Streaming request to Groq API with {len(messages)} messages")
+            async with self._get_client().stream(
+                "POST",
+                self.api_url,
+                json={
+                    "model": self.model,
+                    "messages": messages,
+                    "temperature": self.temperature,
+                    "stream": True,
+                    "stream_options": {"include_usage": True}
+                }
+            ) as response:
+                self.limiter.update_from_headers(response.headers)
+                if response.is_error:
+                    await response.aread()
+                    logger.warning(f"Response content: {response.text}")
+                response.raise_for_status()
+                lines = response.aiter_lines()
+                while True:
+                    try:
+                        line = await asyncio.wait_for(lines.__anext__(), remaining())
+                    except StopAsyncIteration:
+                        break
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    chunk = json.loads(data)
+                    reported = chunk.get("usage") or (chunk.get("x_groq") or {}).get("usage")
+                    if reported:
+                        usage = reported.get("total_tokens", usage)
+                    if not chunk.get("choices"):
+                        continue
+                    delta = chunk["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        streamed.append(delta)
+                        yield delta
+        except asyncio.TimeoutError as e:
+            logger.error("Groq API stream exceeded its deadline")
+            error = e
+            raise
+        except httpx.HTTPError as e:
+            logger.error(f"Request error: {e}")
+            error = e
+            raise
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self._semaphore.release()
+            self.limiter.settle(estimated_tokens, usage or prompt_tokens + count_tokens("".join(streamed)))
+            self._record_outcome(error, loop.time() - started)
+
+    async def aclose(self):
+        """Closes the underlying connection pool."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+# Shared client for every app mounted in ml_api.
+model = Chat(DEFAULT_MODEL, GROQ_API_KEY)
+# Clients of the other model tiers, created on first use; each model has its own provider rate limits.
+clients = {DEFAULT_MODEL: model}
+
+
+def client_for(model_name):
+    """Returns the shared client of a model, creating it on first use."""
+    client = clients.get(model_name)
+    if client is None:
+        client = clients[model_name] = Chat(model_name, GROQ_API_KEY)
+    return client
+
+
+async def aclose_all():
+    """Closes the connection pools of every model's client."""
+    for client in clients.values():
+        await client.aclose()
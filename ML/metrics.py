@@ -0,0 +1,64 @@
+import threading
+from collections import defaultdict
+
+
+def _key(name, labels):
+    if not labels:
+        return name
+    label_str = ",".join(f"{k}={v}" for k, v in sorted(labels.items()))
+    return f"{name}{{{label_str}}}"
+
+
+class Metrics:
+    """In-process counters, gauges and value summaries exposed by the /metrics endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        self._gauges = {}
+        self._summaries = {}
+
+    def inc(self, name, value=1, **labels):
+        """Increments a counter."""
+        with self._lock:
+            self._counters[_key(name, labels)] += value
+
+    def set_gauge(self, name, value, **labels):
+        """Sets a gauge to its current value."""
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name, value, **labels):
+        """Records one observation (latency, size, ...) into a count/sum/min/max summary."""
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = {"count": 1, "sum": value, "min": value, "max": value, "last": value}
+            else:
+                summary["count"] += 1
+                summary["sum"] += value
+                summary["min"] = min(summary["min"], value)
+                summary["max"] = max(summary["max"], value)
+                summary["last"] = value
+
+    def snapshot(self):
+        """
+        Returns a copy of all metrics.
+
+        Returns:
+            dict: Counters, gauges and summaries (with the mean added) keyed by metric name and labels.
+        """
+        with self._lock:
+            summaries = {
+                key: dict(value, avg=value["sum"] / value["count"])
+                for key, value in self._summaries.items()
+            }
+            return {
+                "counters": dict(self._counters),
+                "gauges": dict(self._gauges),
+                "summaries": summaries,
+            }
+
+
+metrics = Metrics()
@@ -1,3 +1,4 @@
+import asyncio
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import logging
@@ -6,6 +7,10 @@ import logging
 from geo_recommender import app as geo_app
 from rescheduler import app as rescheduler_app
 from chat import app as chat_app
+from history_summary import store as summary_store
+from llm_client import aclose_all
+from metrics import metrics
+from transcription import VOICE_WARMUP, transcriber
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -34,4 +39,36 @@ app.mount("/recommend", geo_app)
 app.mount("/reschedule", rescheduler_app)
 app.mount("/chat", chat_app)
 
+
+@app.get("/metrics")
+async def get_metrics():
+    """Returns in-process service metrics (prompt sizes, caches, queues, ...)."""
+    return metrics.snapshot()
+
+
+@app.get("/ready")
+async def get_readiness():
+    """Readiness probe: the API serves requests; `voice` tells whether the Whisper model is warm."""
+    return {"status": "ok", "voice": transcriber.state, "voice_ready": transcriber.ready}
+
+
+@app.on_event("startup")
+async def warm_up_voice():
+    # Mounted sub-apps do not receive lifespan events, so background warm-ups are started here
+    if VOICE_WARMUP:
+        transcriber.warm_up()
+
+
+@app.on_event("startup")
+async def open_stores():
+    # Local databases are created on startup rather than at import time
+    await asyncio.to_thread(summary_store.open)
+
+
+@app.on_event("shutdown")
+async def close_clients():
+    # Mounted sub-apps do not receive lifespan events, so shared clients and workers are closed here
+    await aclose_all()
+    transcriber.close()
+
 # Теперь запускать только этот файл: uvicorn ml_api:app --host 0.0.0.0 --port 8001 
\ No newline at end of file
@@ -0,0 +1,287 @@
+import datetime
+import os
+import re
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Candidate places that go into the recommendation prompt; the LLM only re-ranks this shortlist.
+GEO_POI_SHORTLIST = int(os.getenv("GEO_POI_SHORTLIST", "15"))
+# Distance at which the proximity score has dropped to 1/e.
+POI_DISTANCE_SCALE_KM = float(os.getenv("POI_DISTANCE_SCALE_KM", "5"))
+# Weights of the score components: distance, profile affinity, weather, time of day.
+POI_SCORE_WEIGHTS = np.array([
+    float(os.getenv("POI_WEIGHT_DISTANCE", "0.35")),
+    float(os.getenv("POI_WEIGHT_AFFINITY", "0.3")),
+    float(os.getenv("POI_WEIGHT_WEATHER", "0.2")),
+    float(os.getenv("POI_WEIGHT_TIME", "0.15")),
+])
+
+EARTH_RADIUS_KM = 6371.0
+
+# Categories of places, recognised from fragments of OpenTripMap kinds and OSM types.
+CATEGORIES = ("food", "nightlife", "culture", "outdoor", "shopping", "sport", "wellness", "entertainment", "family")
+CATEGORY_KINDS = {
+    "food": ("cafe", "restaurant", "fast_food", "bakery", "foods", "food_court"),
+    "nightlife": ("bar", "pub", "nightclub", "casino", "biergarten"),
+    "culture": ("museum", "gallery", "theatre", "theatres", "library", "cultural", "historic", "architecture",
+                "monument", "memorial", "castle", "fort", "ruins", "archaeolog", "church", "cathedral",
+                "monaster", "religion", "place_of_worship", "exhibition"),
+    "outdoor": ("park", "garden", "natural", "beach", "viewpoint", "view_points", "nature", "camp_site",
+                "golf", "dog_park", "water"),
+    "shopping": ("shop", "mall", "marketplace", "supermarket", "clothes", "shoes", "gift"),
+    "sport": ("sport", "stadium", "fitness", "swimming", "ice_rink", "bowling", "climbing"),
+    "wellness": ("spa", "sauna", "baths"),
+    "entertainment": ("cinema", "amusement", "theme_park", "water_park", "attraction", "interesting_places"),
+    "family": ("zoo", "aquarium", "playground", "theme_park", "water_park", "amusement"),
+}
+# Profile words (English and Russian stems) that point to each category.
+CATEGORY_INTERESTS = {
+    "food": ("food", "eat", "coffee", "cuisine", "gourmet", "еда", "кофе", "кухн", "ресторан", "кафе", "вкусн"),
+    "nightlife": ("party", "night", "club", "bar", "beer", "wine", "вечеринк", "клуб", "бар", "пиво", "вино", "ночн"),
+    "culture": ("art", "history", "museum", "theatre", "theater", "architecture", "book", "read", "culture",
+                "искусств", "истори", "музе", "театр", "архитектур", "книг", "чита", "культур"),
+    "outdoor": ("nature", "walk", "hik", "outdoor", "park", "photo", "travel", "природ", "гуля", "прогулк",
+                "поход", "парк", "фото", "путешеств"),
+    "shopping": ("shop", "fashion", "cloth", "шопинг", "мод", "одежд", "магазин"),
+    "sport": ("sport", "fitness", "gym", "run", "swim", "football", "yoga", "спорт", "фитнес", "бег", "плава",
+              "футбол", "йог", "трениров"),
+    "wellness": ("relax", "spa", "sauna", "wellness", "отдых", "расслаб", "спа", "саун", "бан"),
+    "entertainment": ("movie", "film", "cinema", "game", "fun", "кино", "фильм", "игр", "развлеч"),
+    "family": ("kid", "child", "family", "дет", "ребен", "ребён", "сем"),
+}
+# How much bad weather hurts a category (1 = fully outdoors) and helps it (negative = indoors).
+CATEGORY_EXPOSURE = np.array([-0.5, -0.5, -0.7, 1.0, -0.6, 0.3, -0.8, -0.6, 0.2])
+# Suitability of each category (columns as CATEGORIES) for each hour of local time (rows 0-23).
+_HOURS = np.arange(24)[:, None]
+HOUR_SUITABILITY = np.clip(np.hstack([
+    np.exp(-((_HOURS - 13) ** 2) / 18) + np.exp(-((_HOURS - 19.5) ** 2) / 8),  # food: lunch and dinner
+    ((_HOURS >= 19) | (_HOURS <= 3)).astype(float),  # nightlife
+    ((_HOURS >= 10) & (_HOURS <= 18)).astype(float),  # culture: museum hours
+    ((_HOURS >= 8) & (_HOURS <= 19)).astype(float),  # outdoor: daylight
+    ((_HOURS >= 10) & (_HOURS <= 21)).astype(float),  # shopping
+    ((_HOURS >= 7) & (_HOURS <= 22)).astype(float),  # sport
+    ((_HOURS >= 10) & (_HOURS <= 22)).astype(float),  # wellness
+    ((_HOURS >= 11) & (_HOURS <= 23)).astype(float),  # entertainment
+    ((_HOURS >= 9) & (_HOURS <= 19)).astype(float),  # family
+]), 0, 1)
+
+# Templated descriptions of places, used when no LLM prose is wanted or available.
+CATEGORY_LABELS = {
+    "food": "A place to eat",
+    "nightlife": "A bar for the evening",
+    "culture": "A cultural site",
+    "outdoor": "An outdoor spot",
+    "shopping": "A shopping stop",
+    "sport": "A place for sport",
+    "wellness": "A place to relax",
+    "entertainment": "Something fun to do",
+    "family": "A family attraction",
+}
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+WEATHER_CODE_RE = re.compile(r"code\s*(\d+)")
+TEMPERATURE_RE = re.compile(r"(-?\d+(?:\.\d+)?)\s*°")
+
+
+def haversine_km(lat, lon, lats, lons):
+    """
+    Great-circle distances from one point to many.
+
+    Args:
+        lat (float): Latitude of the origin in degrees.
+        lon (float): Longitude of the origin in degrees.
+        lats (numpy.ndarray): Latitudes in degrees.
+        lons (numpy.ndarray): Longitudes in degrees.
+
+    Returns:
+        numpy.ndarray: Distances in kilometres.
+    """
+    lat, lon, lats, lons = map(np.radians, (lat, lon, lats, lons))
+    a = np.sin((lats - lat) / 2) ** 2 + np.cos(lat) * np.cos(lats) * np.sin((lons - lon) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def parse_position(position):
+    """Parses a "lat,lon" string; returns None if it is not one."""
+    try:
+        lat, lon = (float(part) for part in str(position).split(","))
+    except (TypeError, ValueError):
+        return None
+    return lat, lon
+
+
+def outdoor_suitability(weather):
+    """
+    Rates the weather for being outdoors, from the backend's "12.3°C, code 61" string.
+
+    Uses the WMO weather code (rain, snow, fog, thunderstorms) and the temperature.
+
+    Returns:
+        float: 1.0 for pleasant weather down to 0.0 for a storm; 0.5 if unknown.
+    """
+    if not weather:
+        return 0.5
+    score = 0.5
+    code = WEATHER_CODE_RE.search(weather)
+    if code:
+        code = int(code.group(1))
+        if code <= 3:
+            score = 1.0
+        elif code in (45, 48):
+            score = 0.6
+        elif code in (51, 53, 55, 56, 57, 71, 77):
+            score = 0.35
+        elif code >= 95:
+            score = 0.0
+        else:  # rain, heavy snow, showers
+            score = 0.15
+    temperature = TEMPERATURE_RE.search(weather)
+    if temperature:
+        temperature = float(temperature.group(1))
+        if temperature < -5 or temperature > 32:
+            score *= 0.4
+        elif temperature < 5 or temperature > 28:
+            score *= 0.75
+    return score
+
+
+def local_hour(local_time):
+    """Returns the hour of a "YYYY-MM-DD HH:MM:SS" local time, or None."""
+    try:
+        return datetime.datetime.fromisoformat(str(local_time)).hour
+    except ValueError:
+        return None
+
+
+def category_matrix(places):
+    """Returns a (places x categories) 0/1 matrix of the categories each place belongs to."""
+    matrix = np.zeros((len(places), len(CATEGORIES)))
+    for i, place in enumerate(places):
+        kinds = str(place.get("type") or place.get("kinds") or "").lower()
+        for j, category in enumerate(CATEGORIES):
+            matrix[i, j] = any(fragment in kinds for fragment in CATEGORY_KINDS[category])
+    return matrix
+
+
+def interest_vector(description, age=None):
+    """Returns how strongly a profile points to each category, in [0, 1]."""
+    words = WORD_RE.findall((description or "").lower())
+    interests = np.array([
+        float(any(word.startswith(CATEGORY_INTERESTS[c]) for word in words)) for c in CATEGORIES
+    ])
+    if age is not None and age < 18:
+        interests[CATEGORIES.index("nightlife")] = 0.0
+    return interests
+
+
+def rank_places(places, position=None, description=None, weather=None, local_time=None, age=None,
+                top_k=GEO_POI_SHORTLIST):
+    """
+    Scores nearby places for a user and keeps the best ones.
+
+    The score is a weighted sum of proximity (haversine distance from the user),
+    affinity of the place's kinds to the profile description, weather suitability
+    (outdoor places suffer from rain, indoor ones gain) and fit to the local time
+    of day. Places without a name or coordinates are dropped, as are duplicates.
+
+    Args:
+        places (list): Nearby places as sent by the backend (name, type, lat, lon, address).
+        position (str, optional): User's "lat,lon".
+        description (str, optional): Profile description.
+        weather (str, optional): Weather string such as "12.3°C, code 61".
+        local_time (str, optional): User's local time, "YYYY-MM-DD HH:MM:SS".
+        age (int, optional): User's age.
+        top_k (int, optional): Number of places to keep.
+
+    Returns:
+        list: Up to top_k places, best first. Each gets "score", its main "category"
+        (None if its kinds are unknown), the "factors" behind the score and "distance_km"
+        if the user's position is known.
+    """
+    valid, seen = [], set()
+    for place in places or []:
+        try:
+            lat, lon = float(place["lat"]), float(place["lon"])
+        except (KeyError, TypeError, ValueError):
+            continue
+        name = str(place.get("name") or "").strip()
+        if not name or name.lower() in seen:
+            continue
+        seen.add(name.lower())
+        valid.append((place, lat, lon))
+    if not valid:
+        return []
+
+    lats = np.array([lat for _, lat, _ in valid])
+    lons = np.array([lon for _, _, lon in valid])
+    categories = category_matrix([place for place, _, _ in valid])
+    known = categories.any(axis=1)
+    # Places of several categories get the mean of their category scores
+    shares = categories / np.maximum(categories.sum(axis=1, keepdims=True), 1)
+
+    origin = parse_position(position)
+    if origin is not None:
+        distances = haversine_km(origin[0], origin[1], lats, lons)
+        proximity = np.exp(-distances / POI_DISTANCE_SCALE_KM)
+    else:
+        distances = np.full(len(valid), np.nan)
+        proximity = np.full(len(valid), 0.5)
+
+    affinity = shares @ interest_vector(description, age)
+
+    outdoor = outdoor_suitability(weather)
+    # Exposure 1 scores the outdoor suitability itself, -1 its opposite, 0 stays neutral
+    weather_fit = 0.5 + (outdoor - 0.5) * (shares @ CATEGORY_EXPOSURE)
+    weather_fit[~known] = 0.5
+
+    hour = local_hour(local_time)
+    time_fit = shares @ HOUR_SUITABILITY[hour] if hour is not None else np.full(len(valid), 0.5)
+    time_fit[~known] = 0.5
+
+    scores = np.column_stack([proximity, affinity, weather_fit, time_fit]) @ POI_SCORE_WEIGHTS
+    order = np.argsort(-scores, kind="stable")[:top_k]
+    ranked = []
+    for i in order:
+        place = dict(
+            valid[i][0],
+            score=round(float(scores[i]), 4),
+            category=CATEGORIES[int(np.argmax(categories[i]))] if known[i] else None,
+            factors={
+                "affinity": round(float(affinity[i]), 3),
+                "weather": round(float(weather_fit[i]), 3),
+                "time": round(float(time_fit[i]), 3),
+            },
+        )
+        if not np.isnan(distances[i]):
+            place["distance_km"] = round(float(distances[i]), 2)
+        ranked.append(place)
+    logger.info(f"Ranked {len(valid)} of {len(places)} places, kept {len(ranked)}")
+    return ranked
+
+
+def describe_place(place):
+    """
+    Writes a short description of a ranked place from its kinds and score factors.
+
+    Args:
+        place (dict): Place returned by rank_places().
+
+    Returns:
+        str: Description such as "A cultural site, 1.2 km away. Matches your interests."
+    """
+    label = CATEGORY_LABELS.get(place.get("category"), "A place nearby")
+    details = [part for part in (place.get("address"),) if part]
+    if "distance_km" in place:
+        details.append(f"{place['distance_km']:.1f} km away")
+    sentences = [", ".join([label] + details) + "."]
+    factors = place.get("factors", {})
+    if factors.get("affinity", 0) > 0:
+        sentences.append("Matches your interests.")
+    if factors.get("weather", 0.5) >= 0.7:
+        sentences.append("A good choice for today's weather.")
+    if factors.get("time", 0.5) >= 0.9:
+        sentences.append("Just right for this time of day.")
+    return " ".join(sentences)
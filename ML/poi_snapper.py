@@ -0,0 +1,188 @@
+import difflib
+import os
+import re
+import logging
+
+import numpy as np
+
+from poi_ranker import EARTH_RADIUS_KM
+
+logger = logging.getLogger(__name__)
+
+# A recommendation is only matched to real places within this distance of its coordinates...
+POI_SNAP_RADIUS_KM = float(os.getenv("POI_SNAP_RADIUS_KM", "2"))
+# ...whose names are at least this similar (0-1)...
+POI_SNAP_MIN_NAME_SIMILARITY = float(os.getenv("POI_SNAP_MIN_NAME_SIMILARITY", "0.6"))
+# ...unless its coordinates are practically those of the place, then the name does not matter.
+POI_SNAP_EXACT_KM = float(os.getenv("POI_SNAP_EXACT_KM", "0.15"))
+# A place with exactly the suggested name may be further away, as the LLM often misplaces
+# well-known places by a few kilometres, but never further than this.
+POI_SNAP_NAME_RADIUS_KM = float(os.getenv("POI_SNAP_NAME_RADIUS_KM", "15"))
+# How many kilometres of distance cost as much as a fully different name when choosing between candidates.
+POI_SNAP_DISTANCE_WEIGHT_KM = float(os.getenv("POI_SNAP_DISTANCE_WEIGHT_KM", "10"))
+
+NAME_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def unit_vectors(lats, lons):
+    """Converts coordinates in degrees to (n x 3) points on the unit sphere."""
+    lats, lons = np.radians(lats), np.radians(lons)
+    return np.column_stack([np.cos(lats) * np.cos(lons), np.cos(lats) * np.sin(lons), np.sin(lats)])
+
+
+def chord_length(km):
+    """Straight-line distance between two unit-sphere points that are km apart on the surface."""
+    return 2 * np.sin(min(km / EARTH_RADIUS_KM, np.pi) / 2)
+
+
+def arc_km(chord):
+    """Surface distance in kilometres of a chord between unit-sphere points."""
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.clip(chord / 2, 0, 1))
+
+
+def normalise_name(name):
+    return " ".join(NAME_WORD_RE.findall(str(name or "").lower()))
+
+
+def name_similarity(a, b):
+    """
+    Similarity of two place names in [0, 1].
+
+    Case and punctuation are ignored. A name made of two or more words that all occur
+    in the other one ("Pushkin Museum" in "Pushkin State Museum of Fine Arts") counts as
+    similar even though the strings differ a lot.
+    """
+    a, b = normalise_name(a), normalise_name(b)
+    if not a or not b:
+        return 0.0
+    similarity = difflib.SequenceMatcher(None, a, b).ratio()
+    shorter, longer = sorted((set(a.split()), set(b.split())), key=len)
+    if len(shorter) >= 2 and shorter <= longer:
+        similarity = max(similarity, 0.85)
+    return similarity
+
+
+class KDTree:
+    """
+    KD-tree over points in 3-D space, built once and queried by radius.
+
+    Nodes are stored in flat arrays: node i splits on axis[i] at points[index[i]],
+    with its children in left[i] and right[i] (-1 if there are none).
+    """
+
+    def __init__(self, points):
+        self.points = np.asarray(points, dtype=float)
+        n = len(self.points)
+        self.index = np.empty(n, dtype=int)
+        self.axis = np.empty(n, dtype=int)
+        self.left = np.full(n, -1)
+        self.right = np.full(n, -1)
+        self._size = 0
+        self.root = self._build(np.arange(n)) if n else -1
+
+    def _build(self, ids):
+        points = self.points[ids]
+        # Split on the widest dimension at the median
+        axis = int(np.argmax(points.max(axis=0) - points.min(axis=0)))
+        ids = ids[np.argsort(points[:, axis], kind="stable")]
+        middle = len(ids) // 2
+        node = self._size
+        self._size += 1
+        self.index[node], self.axis[node] = ids[middle], axis
+        if middle > 0:
+            self.left[node] = self._build(ids[:middle])
+        if middle + 1 < len(ids):
+            self.right[node] = self._build(ids[middle + 1:])
+        return node
+
+    def query_radius(self, point, radius):
+        """
+        Finds the points within radius of a point.
+
+        Returns:
+            list: (distance, point index) pairs, nearest first.
+        """
+        found = []
+        stack = [self.root] if self.root >= 0 else []
+        while stack:
+            node = stack.pop()
+            i, axis = self.index[node], self.axis[node]
+            distance = float(np.linalg.norm(self.points[i] - point))
+            if distance <= radius:
+                found.append((distance, int(i)))
+            offset = point[axis] - self.points[i][axis]
+            near, far = (self.left[node], self.right[node]) if offset < 0 else (self.right[node], self.left[node])
+            if near >= 0:
+                stack.append(near)
+            # The other side can only hold matches if the splitting plane is within reach
+            if far >= 0 and abs(offset) <= radius:
+                stack.append(far)
+        return sorted(found)
+
+
+class PlaceIndex:
+    """
+    Spatial index of the real places a recommendation may point to.
+
+    Places are indexed by their position on the unit sphere, so distances stay
+    correct at any latitude, and by normalised name, so a correctly named place
+    is found even when the LLM got its coordinates wrong.
+    """
+
+    def __init__(self, places):
+        self.places = []
+        coordinates = []
+        for place in places or []:
+            try:
+                lat, lon = float(place["lat"]), float(place["lon"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if not normalise_name(place.get("name")) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                continue
+            self.places.append(place)
+            coordinates.append((lat, lon))
+        self.names = {}
+        for i, place in enumerate(self.places):
+            self.names.setdefault(normalise_name(place["name"]), []).append(i)
+        points = unit_vectors(*np.array(coordinates).T) if coordinates else np.empty((0, 3))
+        self.points = points
+        self.tree = KDTree(points)
+
+    def __len__(self):
+        return len(self.places)
+
+    def match(self, name, lat, lon):
+        """
+        Finds the real place a recommendation most likely means.
+
+        Candidates are the places within POI_SNAP_RADIUS_KM of the suggested coordinates
+        and the places with the same name within POI_SNAP_NAME_RADIUS_KM. A candidate is
+        accepted if its name is similar enough or it lies within POI_SNAP_EXACT_KM; among
+        those, the one with the best name similarity minus distance penalty wins.
+
+        Args:
+            name (str): Suggested name.
+            lat (float): Suggested latitude.
+            lon (float): Suggested longitude.
+
+        Returns:
+            tuple: (place index, distance in km) or None if nothing matches.
+        """
+        if not len(self.places):
+            return None
+        point = unit_vectors(np.array([lat]), np.array([lon]))[0]
+        candidates = {i: arc_km(chord) for chord, i in self.tree.query_radius(point, chord_length(POI_SNAP_RADIUS_KM))}
+        for i in self.names.get(normalise_name(name), ()):
+            distance = arc_km(float(np.linalg.norm(self.points[i] - point)))
+            if distance <= POI_SNAP_NAME_RADIUS_KM:
+                candidates.setdefault(i, distance)
+
+        best, best_score = None, None
+        for i, distance in candidates.items():
+            similarity = name_similarity(name, self.places[i]["name"])
+            if similarity < POI_SNAP_MIN_NAME_SIMILARITY and distance > POI_SNAP_EXACT_KM:
+                continue
+            score = similarity - distance / POI_SNAP_DISTANCE_WEIGHT_KM
+            if best_score is None or score > best_score:
+                best, best_score = (i, float(distance)), score
+        return best
@@ -0,0 +1,128 @@
+import os
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Context windows of the models we call, in tokens.
+MODEL_CONTEXT_WINDOWS = {
+    "llama3-70b-8192": 8192,
+    "llama3-8b-8192": 8192,
+    "llama-3.1-8b-instant": 131072,
+    "llama-3.3-70b-versatile": 131072,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+# Tokens kept free for the model's answer.
+PROMPT_COMPLETION_RESERVE = int(os.getenv("PROMPT_COMPLETION_RESERVE", "1024"))
+# Per-message overhead of the chat format (role markers, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+
+TOKENIZER_ENCODING = os.getenv("TOKENIZER_ENCODING", "cl100k_base")
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+except Exception as e:  # tokenizer missing or its BPE file unavailable offline
+    logger.warning(f"Tokenizer '{TOKENIZER_ENCODING}' unavailable, falling back to a length estimate: {e}")
+    _encoding = None
+
+
+def count_tokens(text):
+    """
+    Counts the tokens of a prompt fragment locally.
+
+    Args:
+        text (str): Prompt text.
+
+    Returns:
+        int: Number of tokens.
+    """
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    # UTF-8 length keeps the estimate conservative for Cyrillic text
+    return len(text.encode("utf-8")) // 4 + 1
+
+
+def count_message_tokens(messages):
+    """Counts the tokens of a chat message list, including per-message overhead."""
+    return sum(count_tokens(m.get("content", "")) + MESSAGE_OVERHEAD_TOKENS for m in messages)
+
+
+def context_window(model_name):
+    """Returns the context window of a model in tokens."""
+    return MODEL_CONTEXT_WINDOWS.get(model_name, DEFAULT_CONTEXT_WINDOW)
+
+
+class PromptBudget:
+    """Tracks how many prompt tokens each section uses against a model's context window."""
+
+    def __init__(self, model_name, endpoint, reserve=PROMPT_COMPLETION_RESERVE):
+        """
+        Initialize the budget.
+
+        Args:
+            model_name (str): Model the prompt is built for.
+            endpoint (str): Endpoint name used as the metrics label.
+            reserve (int, optional): Tokens kept free for the completion.
+        """
+        self.endpoint = endpoint
+        self.limit = context_window(model_name) - reserve
+        self.sections = {}
+
+    @property
+    def used(self):
+        return sum(self.sections.values())
+
+    @property
+    def remaining(self):
+        return max(self.limit - self.used, 0)
+
+    def add(self, name, text):
+        """
+        Accounts a section that is always sent in full.
+
+        Returns:
+            int: Tokens used by the section.
+        """
+        tokens = count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+        self.sections[name] = self.sections.get(name, 0) + tokens
+        return tokens
+
+    def fit_items(self, name, items, render=lambda item: item):
+        """
+        Keeps the leading items of a priority-ordered list that fit into the remaining budget.
+
+        Each item is charged MESSAGE_OVERHEAD_TOKENS on top of its text, as in add(),
+        so history messages are not undercounted.
+
+        Args:
+            name (str): Section name.
+            items (list): Items, most important first.
+            render (callable, optional): Returns the prompt text of one item.
+
+        Returns:
+            list: Items that fit; the rest are dropped.
+        """
+        kept, tokens = [], 0
+        available = self.remaining
+        for item in items:
+            cost = count_tokens(render(item)) + MESSAGE_OVERHEAD_TOKENS
+            if tokens + cost > available:
+                break
+            kept.append(item)
+            tokens += cost
+        self.sections[name] = self.sections.get(name, 0) + tokens
+        if len(kept) < len(items):
+            logger.info(f"[{self.endpoint}] Trimmed section '{name}' from {len(items)} to {len(kept)} items")
+            metrics.inc("prompt_trimmed_items", len(items) - len(kept), endpoint=self.endpoint, section=name)
+        return kept
+
+    def record(self):
+        """Publishes the prompt size of this request to the metrics registry and the log."""
+        metrics.observe("prompt_tokens", self.used, endpoint=self.endpoint)
+        for name, tokens in self.sections.items():
+            metrics.observe("prompt_section_tokens", tokens, endpoint=self.endpoint, section=name)
+        logger.info(f"[{self.endpoint}] Prompt tokens: {self.used} of {self.limit} ({self.sections})")
@@ -0,0 +1,183 @@
+import asyncio
+import os
+import random
+import re
+import time
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Optional local budgets per client; 0 leaves pacing to the provider's headers. The token budget
+# is set, or replaced, by the x-ratelimit-limit-tokens the provider reports with every response;
+# exhausted request quotas and Retry-After pause all calls until the reported reset.
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "0"))
+LLM_RATE_LIMIT_TPM = float(os.getenv("LLM_RATE_LIMIT_TPM", "0"))
+# Retries of 429, 5xx and connection errors, bounded by the caller's deadline.
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+# Completion tokens charged up front; corrected by the usage the provider reports.
+LLM_COMPLETION_TOKENS_ESTIMATE = int(os.getenv("LLM_COMPLETION_TOKENS_ESTIMATE", "512"))
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+DURATION_PART_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+class RateLimitExceeded(Exception):
+    """Raised when the rate limit budget cannot be obtained before the caller's deadline."""
+
+
+def parse_duration(value):
+    """
+    Parses a rate-limit reset value such as "7.66s", "2m59.56s", "120ms" or "30".
+
+    Returns:
+        float: Seconds, or None if the value cannot be parsed.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART_RE.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def backoff_delay(attempt):
+    """Returns the pause before retry number `attempt` (from 0): exponential backoff with full jitter."""
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class TokenBucket:
+    """Continuously refilled budget of `capacity` units per minute."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.capacity / 60)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available; requests larger than the bucket wait for a full one."""
+        self.refill()
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / self.capacity
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute budgets of the LLM provider.
+
+    Callers are served strictly in arrival order: the first one in the queue
+    waits for the budget and everybody else waits behind it.
+    """
+
+    def __init__(self, rpm=LLM_RATE_LIMIT_RPM, tpm=LLM_RATE_LIMIT_TPM):
+        """
+        Initialize the limiter.
+
+        Args:
+            rpm (float, optional): Requests per minute, 0 disables the limit.
+            tpm (float, optional): Tokens per minute, 0 until the provider reports its limit.
+        """
+        self.requests = TokenBucket(rpm) if rpm > 0 else None
+        self.tokens = TokenBucket(tpm) if tpm > 0 else None
+        self.blocked_until = 0.0
+        self._queue = asyncio.Lock()
+        self._waiting = 0
+
+    def _wait_time(self, tokens):
+        wait = max(self.blocked_until - time.monotonic(), 0.0)
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens))
+        return wait
+
+    async def acquire(self, tokens, deadline):
+        """
+        Waits in line until the budget allows one request of `tokens` tokens.
+
+        Args:
+            tokens (int): Estimated tokens of the request (prompt and completion).
+            deadline (float): Event loop time by which the request must be sent.
+
+        Raises:
+            RateLimitExceeded: The budget will not be available before the deadline.
+        """
+        loop = asyncio.get_running_loop()
+        self._waiting += 1
+        metrics.set_gauge("llm_rate_limit_queue", self._waiting)
+        try:
+            try:
+                await asyncio.wait_for(self._queue.acquire(), max(deadline - loop.time(), 0))
+            except asyncio.TimeoutError:
+                raise RateLimitExceeded("Timed out waiting in the rate limit queue")
+            try:
+                # Re-check after sleeping: responses that arrived meanwhile may have paused the provider
+                while (wait := self._wait_time(tokens)) > 0:
+                    if loop.time() + wait > deadline:
+                        metrics.inc("llm_rate_limit_rejected")
+                        raise RateLimitExceeded(f"Rate limit budget available in {wait:.1f}s, after the deadline")
+                    metrics.observe("llm_rate_limit_wait_seconds", wait)
+                    await asyncio.sleep(wait)
+                if self.requests is not None:
+                    self.requests.level -= 1
+                if self.tokens is not None:
+                    self.tokens.level -= min(tokens, self.tokens.capacity)
+            finally:
+                self._queue.release()
+        finally:
+            self._waiting -= 1
+            metrics.set_gauge("llm_rate_limit_queue", self._waiting)
+
+    def settle(self, estimated, actual):
+        """Corrects the token budget once the provider reports the real usage of a request."""
+        if self.tokens is not None and actual is not None:
+            self.tokens.level -= actual - min(estimated, self.tokens.capacity)
+
+    def update_from_headers(self, headers):
+        """
+        Aligns the budgets with the provider's x-ratelimit-* and retry-after headers.
+
+        Args:
+            headers (Mapping): Response headers.
+        """
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        try:
+            if limit_tokens and float(limit_tokens) > 0:
+                if self.tokens is None:
+                    self.tokens = TokenBucket(float(limit_tokens))
+                    logger.info(f"Provider token limit: {float(limit_tokens):.0f} per minute")
+                else:
+                    self.tokens.capacity = float(limit_tokens)
+            if self.tokens is not None and remaining_tokens:
+                self.tokens.refill()
+                self.tokens.level = min(self.tokens.level, float(remaining_tokens))
+        except ValueError:
+            logger.warning(f"Unparseable rate limit headers: {limit_tokens}, {remaining_tokens}")
+
+        pause = parse_duration(headers.get("retry-after"))
+        if pause is None and remaining_requests == "0":
+            pause = parse_duration(headers.get("x-ratelimit-reset-requests"))
+        if pause is None and remaining_tokens == "0":
+            pause = parse_duration(headers.get("x-ratelimit-reset-tokens"))
+        if pause:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + pause)
+            logger.warning(f"Provider rate limit reached, pausing LLM calls for {pause:.1f}s")
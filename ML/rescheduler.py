@@ -2,16 +2,14 @@ import datetime
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from typing import List, Optional
-import re, json
-from chat import Chat
-import os
+from typing import List, Optional, Tuple
+from llm_client import LLM_UNAVAILABLE_ERRORS, model
+from metrics import metrics
+from prompt_budget import PromptBudget
+from structured_output import StructuredOutputError, parse_items
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
-if not GROQ_API_KEY:
-    raise ValueError("GROQ_API_KEY environment variable not set")
-
-model = Chat("llama3-70b-8192", GROQ_API_KEY)
+RESCHEDULE_USER_MESSAGE = "Please optimize my schedule for maximum productivity."
+FALLBACK_SUGGESTION = "The assistant is temporarily unavailable, so your schedule was left unchanged."
 
 app = FastAPI(title="ML Calendar Rescheduler API")
 
@@ -38,21 +36,35 @@ class RescheduleResponse(BaseModel):
     suggestion: str
     new_calendar: Optional[List[RescheduleEvent]] = None
 
-def build_reschedule_prompt(calendar_data: List[dict]) -> dict:
+def build_reschedule_prompt(calendar_data: List[dict]) -> Tuple[dict, List[int]]:
+    """
+    Builds the rescheduling prompt within the model's context window.
+
+    If the calendar does not fit, the events furthest from today are left out of
+    the prompt; the caller has to keep them unchanged.
+
+    Returns:
+        tuple: (system message, indices of the events left out of the prompt).
+    """
+    now = datetime.datetime.now(datetime.timezone.utc)
     today = datetime.datetime.now().strftime("%B %d, %Y")
     events = []
+    distances = []
     for e in calendar_data:
-        start = datetime.datetime.fromisoformat(e["start"].replace("Z", "+00:00")).strftime("%B %d, %Y %I:%M %p")
+        start_dt = datetime.datetime.fromisoformat(e["start"].replace("Z", "+00:00"))
+        start = start_dt.strftime("%B %d, %Y %I:%M %p")
         end = datetime.datetime.fromisoformat(e["end"].replace("Z", "+00:00")).strftime("%I:%M %p")
         location = e.get("location", "Unknown location") or "Unknown location"
         events.append(f"- {e['summary']} from {start} to {end} at {location}")
-    calendar_context = "\n".join(events)
-    content = (
+        if start_dt.tzinfo is None:
+            start_dt = start_dt.replace(tzinfo=datetime.timezone.utc)
+        distances.append(abs(start_dt - now))
+    instructions = (
         "Reschedule task between 6 am and 11 pm"
         "You are an expert time-management assistant. "
         "Analyze the user's calendar and suggest a slightly more convenient or balanced schedule. "
         "Do not focus only on maximum productivity. "
-        "All events from the original calendar must be preserved — you may only change their order or time, but do not remove or add events. "
+        "All events from the calendar below must be preserved — you may only change their order or time, but do not remove or add events. "
         "Give a short summary of your suggestion (1–2 sentences). "
         "In your summary, clearly specify what exactly was changed (e.g., which events were moved or swapped). "
         "Then return the new optimized calendar as a JSON array of events, using the following format:\n\n"
@@ -69,30 +81,45 @@ def build_reschedule_prompt(calendar_data: List[dict]) -> dict:
         "]\n\n"
         "Only return the JSON — do not include anything else after it.\n"
         f"Today: {today}\n"
-        f"User's calendar:\n\n{calendar_context}"
     )
-    return {"role": "system", "content": content}
+
+    budget = PromptBudget(model.model, "reschedule")
+    budget.add("user_message", RESCHEDULE_USER_MESSAGE)
+    budget.add("instructions", instructions)
+    # Если календарь не помещается в контекст, отбрасываются самые далёкие от сегодняшнего дня события
+    by_distance = sorted(range(len(events)), key=lambda i: distances[i])
+    kept = set(budget.fit_items("events", by_distance, render=lambda i: events[i]))
+    budget.record()
+
+    calendar_context = "\n".join(line for i, line in enumerate(events) if i in kept)
+    content = instructions + f"User's calendar:\n\n{calendar_context}"
+    omitted = [i for i in range(len(events)) if i not in kept]
+    return {"role": "system", "content": content}, omitted
 
 @app.post("/", response_model=RescheduleResponse)
-def reschedule(req: RescheduleRequest):
+async def reschedule(req: RescheduleRequest):
     try:
-        system_prompt = build_reschedule_prompt([e.model_dump() for e in req.calendar])
-        messages = [system_prompt, {"role": "user", "content": "Please optimize my schedule for maximum productivity."}]
-        suggestion_full = model.chat(messages)
-        json_match = re.search(r'(\[.*\])', suggestion_full, re.DOTALL)
-        new_calendar = None
-        if json_match:
-            try:
-                raw_calendar = json.loads(json_match.group(1))
-                # The AI is expected to return a list of {"event": {...}}
-                # We just need to validate it matches our Pydantic models
-                if raw_calendar and isinstance(raw_calendar[0], dict) and 'event' in raw_calendar[0]:
-                     new_calendar = raw_calendar
-                else: # If the AI returns a flat list, wrap it
-                    new_calendar = [{"event": item} for item in raw_calendar]
-
-            except Exception:
-                new_calendar = None
+        system_prompt, omitted = build_reschedule_prompt([e.model_dump() for e in req.calendar])
+        messages = [system_prompt, {"role": "user", "content": RESCHEDULE_USER_MESSAGE}]
+        try:
+            suggestion_full = await model.chat(messages, endpoint="reschedule")
+        except LLM_UNAVAILABLE_ERRORS:
+            metrics.inc("llm_fallbacks", endpoint="reschedule")
+            return RescheduleResponse(
+                suggestion=FALLBACK_SUGGESTION,
+                new_calendar=[RescheduleEvent(event=e) for e in req.calendar]
+            )
+        try:
+            # The AI is expected to return a list of {"event": {...}}; a flat list of events is wrapped
+            new_calendar = parse_items(
+                suggestion_full, RescheduleEvent, "reschedule",
+                wrap=lambda item: item if isinstance(item, dict) and "event" in item else {"event": item}
+            )
+        except StructuredOutputError:
+            new_calendar = None
+        if new_calendar is not None and omitted:
+            # Events that did not fit into the prompt are returned unchanged, so the new calendar stays complete
+            new_calendar += [RescheduleEvent(event=req.calendar[i]) for i in omitted]
         short_suggestion = suggestion_full.split('\n')[0]
         return RescheduleResponse(suggestion=short_suggestion, new_calendar=new_calendar)
     except Exception as e:
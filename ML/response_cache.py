@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import logging
+from collections import OrderedDict
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of entries kept in memory by each cache.
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "1024"))
+# Optional SQLite file for the on-disk tier; empty disables it.
+LLM_CACHE_DB = os.getenv("LLM_CACHE_DB", "")
+
+# How long LLM replies are reused, per endpoint, in seconds. 0 disables caching.
+LLM_CACHE_TTLS = {
+    "recommend": float(os.getenv("LLM_CACHE_TTL_RECOMMEND", "900")),
+    "reschedule": float(os.getenv("LLM_CACHE_TTL_RESCHEDULE", "300")),
+    "chat": float(os.getenv("LLM_CACHE_TTL_CHAT", "0")),
+}
+
+
+def canonical_key(*parts):
+    """
+    Returns a stable hash of JSON-serialisable request parts.
+
+    Args:
+        *parts: Values that fully determine the cached result (model, messages, ...).
+
+    Returns:
+        str: Hex SHA-256 digest.
+    """
+    canonical = json.dumps(parts, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """TTL cache with an in-memory LRU tier and an optional SQLite tier."""
+
+    def __init__(self, name, max_entries=RESPONSE_CACHE_SIZE, db_path=None):
+        """
+        Initialize the cache.
+
+        Args:
+            name (str): Cache name used as the metrics label.
+            max_entries (int, optional): Capacity of the in-memory tier.
+            db_path (str, optional): SQLite file of the on-disk tier, None to keep entries in memory only.
+        """
+        self.name = name
+        self.max_entries = max_entries
+        self.db_path = db_path
+        self._entries = OrderedDict()
+        if db_path:
+            with self._connect() as conn:
+                conn.execute(
+                    "CREATE TABLE IF NOT EXISTS cache ("
+                    "key TEXT PRIMARY KEY, "
+                    "value TEXT NOT NULL, "
+                    "expires_at REAL NOT NULL)"
+                )
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=5)
+
+    def _disk_get(self, key):
+        with self._connect() as conn:
+            row = conn.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= time.time():
+            with self._connect() as conn:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _disk_put(self, key, value, expires_at):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                (key, json.dumps(value, ensure_ascii=False), expires_at)
+            )
+
+    def _remember(self, key, value, expires_at):
+        self._entries[key] = (value, expires_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        metrics.set_gauge("cache_entries", len(self._entries), cache=self.name)
+
+    def get_memory(self, key):
+        """
+        Looks a key up in the in-memory tier only.
+
+        Returns:
+            The cached value, or None if it is missing or expired.
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def get(self, key):
+        """
+        Returns a cached value, checking memory first and then the disk tier.
+
+        Args:
+            key (str): Key from canonical_key().
+
+        Returns:
+            The cached value, or None on a miss.
+        """
+        value = self.get_memory(key)
+        if value is not None:
+            metrics.inc("cache_hits", cache=self.name, tier="memory")
+            return value
+        if self.db_path:
+            try:
+                entry = await asyncio.to_thread(self._disk_get, key)
+            except sqlite3.Error as e:
+                logger.warning(f"[{self.name}] Disk cache read failed: {e}")
+                entry = None
+            if entry is not None:
+                value, expires_at = entry
+                self._remember(key, value, expires_at)
+                metrics.inc("cache_hits", cache=self.name, tier="disk")
+                return value
+        metrics.inc("cache_misses", cache=self.name)
+        return None
+
+    async def set(self, key, value, ttl):
+        """
+        Stores a JSON-serialisable value for ttl seconds.
+
+        Args:
+            key (str): Key from canonical_key().
+            value: Value to cache.
+            ttl (float): Time to live in seconds; non-positive values are not cached.
+        """
+        if ttl <= 0 or value is None:
+            return
+        expires_at = time.time() + ttl
+        self._remember(key, value, expires_at)
+        if self.db_path:
+            try:
+                await asyncio.to_thread(self._disk_put, key, value, expires_at)
+            except sqlite3.Error as e:
+                logger.warning(f"[{self.name}] Disk cache write failed: {e}")
+
+
+# Cache of LLM replies, used by llm_client.Chat.
+llm_cache = ResponseCache("llm", db_path=LLM_CACHE_DB or None)
@@ -0,0 +1,53 @@
+import asyncio
+import logging
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time and shares its outcome with every concurrent caller."""
+
+    def __init__(self, name):
+        """
+        Initialize the group.
+
+        Args:
+            name (str): Group name used as the metrics label.
+        """
+        self.name = name
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, factory):
+        """
+        Awaits the call running for key, starting it if there is none.
+
+        The call runs as a separate task, so a caller that is cancelled (for
+        example because its client disconnected) does not cancel it for the others.
+
+        Args:
+            key (str): Identity of the call, e.g. from canonical_key().
+            factory (callable): Returns the coroutine to run when no call is in flight.
+
+        Returns:
+            The call's result; its exception is raised to every caller.
+        """
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._finish(key))
+            # Leaders that all went away must not leave an unretrieved exception behind
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        else:
+            metrics.inc("single_flight_shared", group=self.name)
+        metrics.set_gauge("single_flight_in_flight", len(self._calls), group=self.name)
+        return await asyncio.shield(task)
+
+    def _finish(self, key):
+        self._calls.pop(key, None)
+        metrics.set_gauge("single_flight_in_flight", len(self._calls), group=self.name)
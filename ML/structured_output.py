@@ -0,0 +1,263 @@
+import json
+import re
+import logging
+
+from pydantic import ValidationError
+
+from metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CLOSERS = {"{": "}", "[": "]"}
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# "2024-05-01T10:00:00+0300" -> "2024-05-01T10:00:00+03:00"
+COMPACT_OFFSET_RE = re.compile(r"(\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?)([+-])(\d{2})(\d{2})$")
+
+
+class StructuredOutputError(ValueError):
+    """Raised when no usable JSON can be recovered from an LLM reply."""
+
+
+def _scan(text, start):
+    """
+    Scans one JSON value that starts with a bracket at text[start].
+
+    Strings in double or single quotes are skipped, so brackets inside them do not count.
+
+    Returns:
+        tuple: (end, complete, safe_points). end is the index after the closing bracket, of a
+        mismatched bracket, or the end of the text if the value is truncated. safe_points lists
+        (index, open brackets) right after each complete nested value, the places a truncated
+        value can be cut back to.
+    """
+    stack = []
+    safe_points = []
+    quote = None
+    i = start
+    while i < len(text):
+        char = text[i]
+        if quote:
+            if char == "\\":
+                i += 1
+            elif char == quote:
+                quote = None
+        elif char in "\"'":
+            quote = char
+        elif char in CLOSERS:
+            stack.append(char)
+        elif char in "}]":
+            if CLOSERS[stack[-1]] != char:
+                return i, False, []
+            stack.pop()
+            if not stack:
+                return i + 1, True, safe_points
+            safe_points.append((i + 1, tuple(stack)))
+        i += 1
+    return len(text), False, safe_points
+
+
+def _normalise(text, repairs):
+    """
+    Rewrites JSON-like text into strict JSON in a single pass.
+
+    Single-quoted strings become double-quoted, Python literals become JSON ones,
+    and commas before a closing bracket are dropped.
+    """
+    out = []
+    i = 0
+    pending_comma = False
+    while i < len(text):
+        char = text[i]
+        if char in "\"'":
+            # Copy the whole string, converting single quotes to double ones
+            if char == "'":
+                repairs.add("single_quotes")
+            if pending_comma:
+                out.append(",")
+                pending_comma = False
+            out.append('"')
+            i += 1
+            while i < len(text) and text[i] != char:
+                if text[i] == "\\" and i + 1 < len(text):
+                    if char == "'" and text[i + 1] == "'":
+                        out.append("'")
+                    else:
+                        out.append(text[i:i + 2])
+                    i += 2
+                    continue
+                if char == "'" and text[i] == '"':
+                    out.append('\\"')
+                elif text[i] == "\n":
+                    out.append("\\n")
+                else:
+                    out.append(text[i])
+                i += 1
+            out.append('"')
+            i += 1
+            continue
+        if char == ",":
+            if pending_comma:
+                repairs.add("trailing_commas")
+            pending_comma = True
+        elif char in "}]":
+            if pending_comma:
+                repairs.add("trailing_commas")
+                pending_comma = False
+            out.append(char)
+        elif char.isspace():
+            out.append(char)
+        else:
+            if pending_comma:
+                out.append(",")
+                pending_comma = False
+            word = re.match(r"[A-Za-z_]\w*", text[i:i + 6])
+            if word and word.group() in PYTHON_LITERALS:
+                repairs.add("python_literals")
+                out.append(PYTHON_LITERALS[word.group()])
+                i += len(word.group())
+                continue
+            out.append(char)
+        i += 1
+    return "".join(out)
+
+
+def _fix_offsets(value, repairs):
+    """Adds the colon to compact UTC offsets in timestamps (+0300 -> +03:00)."""
+    if isinstance(value, dict):
+        return {key: _fix_offsets(item, repairs) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_fix_offsets(item, repairs) for item in value]
+    if isinstance(value, str):
+        fixed = COMPACT_OFFSET_RE.sub(r"\1\2\3:\4", value)
+        if fixed != value:
+            repairs.add("utc_offsets")
+        return fixed
+    return value
+
+
+def _candidate(text, start, repairs):
+    """Returns the JSON text of the value starting at text[start], closing it if it was cut off."""
+    end, complete, safe_points = _scan(text, start)
+    if complete:
+        return text[start:end], end
+    if not safe_points:
+        # A mismatched bracket or a stray apostrophe in prose; the payload may start further on
+        return None, start + 1
+    # The reply was cut off: keep the complete elements and close the open brackets
+    repairs.add("truncated")
+    cut, stack = safe_points[-1]
+    closers = "".join(CLOSERS[bracket] for bracket in reversed(stack))
+    return text[start:cut].rstrip().rstrip(",") + closers, len(text)
+
+
+def extract_json(text, expect=None):
+    """
+    Finds and parses the JSON payload of an LLM reply, repairing common defects.
+
+    The reply is scanned once from left to right, so prose, markdown fences and
+    brackets inside strings around the payload cost linear time. Repaired defects:
+    trailing commas, single-quoted strings, Python literals, a truncated reply
+    (cut back to its last complete element) and +0300-style UTC offsets.
+
+    Args:
+        text (str): LLM reply.
+        expect (type, optional): list or dict; other top-level values are skipped.
+
+    Returns:
+        tuple: (parsed value, sorted names of the repairs that were needed).
+
+    Raises:
+        StructuredOutputError: The reply contains no recoverable JSON value.
+    """
+    openers = "[" if expect is list else "{" if expect is dict else "[{"
+    i = 0
+    while i < len(text):
+        if text[i] not in openers:
+            i += 1
+            continue
+        repairs = set()
+        candidate, i = _candidate(text, i, repairs)
+        if candidate is None:
+            continue
+        try:
+            value = json.loads(candidate)
+        except json.JSONDecodeError:
+            try:
+                value = json.loads(_normalise(candidate, repairs))
+            except json.JSONDecodeError:
+                continue
+        if expect is not None and not isinstance(value, expect):
+            continue
+        return _fix_offsets(value, repairs), sorted(repairs)
+    raise StructuredOutputError("No JSON value found in the reply")
+
+
+def _record(endpoint, outcome, repairs=()):
+    metrics.inc("structured_output", endpoint=endpoint, outcome=outcome)
+    for repair in repairs:
+        metrics.inc("structured_output_repairs", endpoint=endpoint, repair=repair)
+
+
+def parse_model(text, model, endpoint):
+    """
+    Parses an LLM reply into a Pydantic model.
+
+    Args:
+        text (str): LLM reply.
+        model (type): Pydantic model of the expected JSON object.
+        endpoint (str): Metrics label.
+
+    Returns:
+        BaseModel: Validated object.
+
+    Raises:
+        StructuredOutputError: No JSON object was found or it does not match the model.
+    """
+    try:
+        value, repairs = extract_json(text, dict)
+        result = model.model_validate(value)
+    except (StructuredOutputError, ValidationError) as e:
+        _record(endpoint, "failed")
+        raise StructuredOutputError(str(e)) from e
+    _record(endpoint, "repaired" if repairs else "clean", repairs)
+    return result
+
+
+def parse_items(text, model, endpoint, wrap=None):
+    """
+    Parses an LLM reply that should be a JSON array of objects.
+
+    Items that fail validation are dropped instead of failing the whole reply.
+
+    Args:
+        text (str): LLM reply.
+        model (type): Pydantic model of one item.
+        endpoint (str): Metrics label.
+        wrap (callable, optional): Adjusts each raw item before validation.
+
+    Returns:
+        list: Validated items.
+
+    Raises:
+        StructuredOutputError: No array was found or none of its items is valid.
+    """
+    try:
+        values, repairs = extract_json(text, list)
+    except StructuredOutputError:
+        _record(endpoint, "failed")
+        raise
+    items = []
+    for value in values:
+        try:
+            items.append(model.model_validate(wrap(value) if wrap else value))
+        except ValidationError as e:
+            logger.warning(f"Dropping invalid {endpoint} item {value!r}: {e.errors()[:1]}")
+            metrics.inc("structured_output_dropped_items", endpoint=endpoint)
+    if values and not items:
+        _record(endpoint, "failed")
+        raise StructuredOutputError(f"None of the {len(values)} items matches {model.__name__}")
+    if len(items) < len(values):
+        repairs = sorted(set(repairs) | {"invalid_items"})
+    _record(endpoint, "repaired" if repairs else "clean", repairs)
+    return items
+
@@ -0,0 +1,131 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+from llm_client import Chat
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(circuit_breaker, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def make_breaker():
+    return CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5,
+                          slow_call_seconds=5, slow_call_rate=0.8, open_seconds=30)
+
+
+def call(breaker, success, duration=0.1):
+    breaker.before_call()
+    breaker.record(success, duration)
+
+
+def trip(breaker):
+    for success in (True, False, True, False):
+        call(breaker, success)
+    assert breaker.state == OPEN
+
+
+def test_failures_open_the_breaker(clock):
+    breaker = make_breaker()
+    for _ in range(3):
+        call(breaker, False)
+    # Below min_calls the breaker stays closed
+    assert breaker.state == CLOSED
+    call(breaker, False)
+    assert breaker.state == OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_slow_calls_open_the_breaker(clock):
+    breaker = make_breaker()
+    for _ in range(4):
+        call(breaker, True, duration=6)
+    assert breaker.state == OPEN
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 29
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    clock.now += 1
+    breaker.before_call()
+    assert breaker.state == HALF_OPEN
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+    call(breaker, False)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_opens_the_breaker_again(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.record(False, 0.1)
+    assert breaker.state == OPEN
+    assert breaker.opened_at == clock.now
+
+
+def test_released_probe_lets_the_next_call_probe(clock):
+    breaker = make_breaker()
+    trip(breaker)
+    clock.now += 30
+    breaker.before_call()
+    breaker.release()
+    assert breaker.state == HALF_OPEN
+    breaker.before_call()
+    breaker.record(True, 0.1)
+    assert breaker.state == CLOSED
+
+
+def status_error(status):
+    request = httpx.Request("POST", "https://example.com")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+@pytest.mark.parametrize("error, sent, failure", [
+    (None, True, False),
+    (asyncio.TimeoutError(), True, True),
+    (httpx.ConnectError("refused"), True, True),
+    (status_error(503), True, True),
+    (status_error(429), True, True),
+    (status_error(400), True, None),
+    (asyncio.CancelledError(), True, None),
+    (asyncio.TimeoutError(), False, None),
+])
+def test_outcome_classification(error, sent, failure):
+    outcomes = []
+    breaker = SimpleNamespace(record=lambda success, duration: outcomes.append(not success),
+                              release=lambda: outcomes.append(None))
+    chat = Chat("model", "key", cache=None, breaker=breaker)
+    chat._record_outcome(error, 0.1, sent)
+    assert outcomes == [failure]
+
+
+def test_local_slot_timeouts_do_not_trip_the_breaker():
+    breaker = CircuitBreaker("test", min_calls=2)
+    chat = Chat("model", "key", cache=None, max_concurrency=1, breaker=breaker)
+
+    async def scenario():
+        # Every slot is taken, so calls time out before anything is sent
+        await chat._semaphore.acquire()
+        for i in range(5):
+            with pytest.raises(asyncio.TimeoutError):
+                await chat.chat([{"role": "user", "content": f"hi {i}"}], timeout=0.01)
+
+    asyncio.run(scenario())
+    assert breaker.state == CLOSED
+    assert len(breaker._outcomes) == 0
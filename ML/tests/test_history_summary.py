@@ -0,0 +1,42 @@
+import asyncio
+
+import history_summary
+from history_summary import SummaryStore, conversation_key, fold_history
+
+
+class FakeLLM:
+    def __init__(self):
+        self.calls = 0
+
+    async def chat(self, messages, endpoint=None):
+        self.calls += 1
+        return f"summary {self.calls}"
+
+
+def conversation(opening, length):
+    return [{"role": "user", "content": opening}] + [
+        {"role": "user" if i % 2 else "assistant", "content": f"message {i}"} for i in range(1, length)
+    ]
+
+
+def test_key_without_id_comes_from_the_opening_messages():
+    history = conversation("Hi", 60)
+    assert conversation_key("user-1", history) == "user-1"
+    assert conversation_key(None, history[:3]) is None
+    assert conversation_key(None, history) == conversation_key(None, history[:10])
+    assert conversation_key(None, history) != conversation_key(None, conversation("Hello", 60))
+
+
+def test_long_history_without_id_is_folded(tmp_path, monkeypatch):
+    monkeypatch.setattr(history_summary, "store", SummaryStore(str(tmp_path / "summaries.sqlite3")))
+    llm = FakeLLM()
+    history = conversation("Hi", 60)
+
+    summary, recent = asyncio.run(fold_history(conversation_key(None, history), history, llm))
+    assert summary == "summary 1"
+    assert len(recent) == history_summary.HISTORY_KEEP_RECENT
+
+    # Same opening, different conversation: the stored summary does not match it
+    other = conversation("Hi", 30)
+    other[10]["content"] = "something else"
+    assert asyncio.run(fold_history(conversation_key(None, other), other, llm)) == (None, other)
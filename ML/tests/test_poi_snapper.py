@@ -0,0 +1,21 @@
+from poi_snapper import PlaceIndex
+
+PLACES = [
+    {"name": "Gorky Park", "lat": 55.7298, "lon": 37.6011},
+    {"name": "Pushkin State Museum of Fine Arts", "lat": 55.7473, "lon": 37.6051},
+]
+
+
+def test_exact_name_found_a_few_kilometres_off():
+    match = PlaceIndex(PLACES).match("Gorky Park", 55.76, 37.64)
+    assert match is not None
+    assert match[0] == 0
+    assert 3 < match[1] < 15
+
+
+def test_exact_name_far_away_is_not_matched():
+    assert PlaceIndex(PLACES).match("Gorky Park", 10, 10) is None
+
+
+def test_similar_name_nearby_is_matched():
+    assert PlaceIndex(PLACES).match("Pushkin Museum", 55.7480, 37.6060)[0] == 1
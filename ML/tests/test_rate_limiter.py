@@ -0,0 +1,140 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import rate_limiter
+from llm_client import Chat
+from rate_limiter import RateLimiter, RateLimitExceeded, TokenBucket, backoff_delay, parse_duration
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(rate_limiter, "time", SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def test_bucket_refills_continuously(clock):
+    bucket = TokenBucket(60)
+    bucket.level = 0
+    assert bucket.wait_time(30) == 30
+    clock.now += 10
+    assert bucket.wait_time(30) == 20
+    clock.now += 120
+    assert bucket.wait_time(30) == 0
+    assert bucket.level == 60
+
+
+def test_oversized_request_waits_for_a_full_bucket(clock):
+    bucket = TokenBucket(60)
+    bucket.level = 30
+    assert bucket.wait_time(1000) == 30
+
+
+def test_parse_duration():
+    assert parse_duration("7.66s") == 7.66
+    assert parse_duration("2m59.56s") == pytest.approx(179.56)
+    assert parse_duration("120ms") == 0.12
+    assert parse_duration("30") == 30
+    assert parse_duration("soon") is None
+    assert parse_duration(None) is None
+
+
+def test_token_limit_is_learned_from_headers(clock):
+    limiter = RateLimiter(rpm=0, tpm=0)
+    assert limiter.tokens is None
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "6000", "x-ratelimit-remaining-tokens": "1000"})
+    assert limiter.tokens.capacity == 6000
+    assert limiter.tokens.level == 1000
+    limiter.update_from_headers({"x-ratelimit-limit-tokens": "12000"})
+    assert limiter.tokens.capacity == 12000
+
+
+def test_retry_after_and_exhausted_quotas_pause_calls(clock):
+    limiter = RateLimiter(rpm=0, tpm=0)
+    limiter.update_from_headers({"retry-after": "2"})
+    assert limiter._wait_time(1) == 2
+    limiter.update_from_headers({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "1m"})
+    assert limiter._wait_time(1) == 60
+    clock.now += 60
+    assert limiter._wait_time(1) == 0
+
+
+def test_acquire_rejects_budget_after_the_deadline(clock):
+    async def scenario():
+        limiter = RateLimiter(rpm=0, tpm=0)
+        limiter.blocked_until = clock.now + 30
+        deadline = asyncio.get_running_loop().time() + 1
+        with pytest.raises(RateLimitExceeded):
+            await limiter.acquire(100, deadline)
+
+    asyncio.run(scenario())
+
+
+def test_acquire_charges_and_settle_corrects_the_budget(clock):
+    async def scenario():
+        limiter = RateLimiter(rpm=10, tpm=1000)
+        await limiter.acquire(300, asyncio.get_running_loop().time() + 1)
+        return limiter
+
+    limiter = asyncio.run(scenario())
+    assert limiter.requests.level == 9
+    assert limiter.tokens.level == 700
+    limiter.settle(300, 120)
+    assert limiter.tokens.level == 880
+
+
+def test_backoff_delay_grows_exponentially_up_to_the_cap(monkeypatch):
+    monkeypatch.setattr(rate_limiter.random, "uniform", lambda low, high: high)
+    monkeypatch.setattr(rate_limiter, "LLM_BACKOFF_BASE", 0.5)
+    monkeypatch.setattr(rate_limiter, "LLM_BACKOFF_MAX", 8)
+    assert [backoff_delay(attempt) for attempt in range(6)] == [0.5, 1, 2, 4, 8, 8]
+
+
+class FakeStreamResponse:
+    headers = {}
+    is_error = False
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def raise_for_status(self):
+        pass
+
+    async def aiter_lines(self):
+        for chunk in self.chunks:
+            yield f"data: {json.dumps(chunk)}"
+        yield "data: [DONE]"
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+def stream_tokens_left(chunks):
+    chat = Chat("model", "key", cache=None, limiter=RateLimiter(rpm=0, tpm=10000))
+    chat._get_client = lambda: SimpleNamespace(stream=lambda *args, **kwargs: FakeStreamResponse(chunks))
+
+    async def scenario():
+        return "".join([delta async for delta in chat.stream([{"role": "user", "content": "hi"}])])
+
+    assert asyncio.run(scenario()) == "Hello"
+    return chat.limiter.tokens.level
+
+
+def test_stream_is_settled_with_reported_usage():
+    chunks = [
+        {"choices": [{"delta": {"content": "Hello"}}]},
+        {"choices": [], "usage": {"total_tokens": 40}},
+    ]
+    assert stream_tokens_left(chunks) == pytest.approx(10000 - 40, abs=1)
+
+
+def test_stream_without_usage_is_settled_with_counted_tokens():
+    level = stream_tokens_left([{"choices": [{"delta": {"content": "Hello"}}]}])
+    # Prompt and reply are a few tokens, far below the up-front estimate
+    assert 10000 - 50 < level < 10000
@@ -0,0 +1,80 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import response_cache
+from llm_client import Chat
+from response_cache import ResponseCache, canonical_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(response_cache, "time", SimpleNamespace(time=lambda: clock.now))
+    return clock
+
+
+def test_canonical_key_is_stable():
+    a = canonical_key("model", [{"role": "user", "content": "привет"}], {"b": 1, "a": 2})
+    b = canonical_key("model", [{"content": "привет", "role": "user"}], {"a": 2, "b": 1})
+    assert a == b
+    assert len(a) == 64
+    assert a != canonical_key("model", [{"role": "user", "content": "привет!"}], {"a": 2, "b": 1})
+
+
+def test_entries_expire(clock):
+    cache = ResponseCache("test")
+    asyncio.run(cache.set("k", "value", 10))
+    clock.now += 9
+    assert asyncio.run(cache.get("k")) == "value"
+    clock.now += 1
+    assert asyncio.run(cache.get("k")) is None
+
+
+def test_least_recently_used_entry_is_evicted(clock):
+    cache = ResponseCache("test", max_entries=2)
+    asyncio.run(cache.set("a", 1, 60))
+    asyncio.run(cache.set("b", 2, 60))
+    assert asyncio.run(cache.get("a")) == 1
+    asyncio.run(cache.set("c", 3, 60))
+    assert asyncio.run(cache.get("b")) is None
+    assert asyncio.run(cache.get("a")) == 1
+    assert asyncio.run(cache.get("c")) == 3
+
+
+def test_disk_tier_outlives_memory(tmp_path, clock):
+    path = str(tmp_path / "cache.sqlite3")
+    asyncio.run(ResponseCache("test", db_path=path).set("k", {"a": [1]}, 60))
+    restarted = ResponseCache("test", db_path=path)
+    assert asyncio.run(restarted.get("k")) == {"a": [1]}
+    clock.now += 60
+    assert asyncio.run(ResponseCache("test", db_path=path).get("k")) is None
+
+
+def test_zero_ttl_is_not_cached(clock):
+    cache = ResponseCache("test")
+    asyncio.run(cache.set("k", "value", 0))
+    assert asyncio.run(cache.get("k")) is None
+
+
+def test_endpoints_with_zero_ttl_always_go_upstream(monkeypatch):
+    monkeypatch.setitem(response_cache.LLM_CACHE_TTLS, "chat", 0)
+    monkeypatch.setitem(response_cache.LLM_CACHE_TTLS, "recommend", 900)
+    chat = Chat("model", "key", cache=ResponseCache("test"))
+    requests = []
+
+    async def fake_request(messages, estimated_tokens):
+        requests.append(messages)
+        return "reply"
+
+    monkeypatch.setattr(chat, "_request", fake_request)
+    messages = [{"role": "user", "content": "hi"}]
+
+    async def scenario():
+        for endpoint in ("chat", "chat", "recommend", "recommend"):
+            assert await chat.chat(messages, endpoint=endpoint) == "reply"
+
+    asyncio.run(scenario())
+    assert len(requests) == 3
+    assert len(chat.cache._entries) == 1
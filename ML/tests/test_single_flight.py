@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from single_flight import SingleFlight
+
+
+def test_concurrent_calls_share_one_upstream_call():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def scenario():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.run("k", upstream) for _ in range(5)))
+        assert len(flights) == 0
+        return results
+
+    assert asyncio.run(scenario()) == ["result"] * 5
+    assert len(calls) == 1
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def scenario():
+        flights = SingleFlight("test")
+        release = asyncio.Event()
+
+        async def upstream():
+            await release.wait()
+            return "result"
+
+        leader = asyncio.create_task(flights.run("k", upstream))
+        follower = asyncio.create_task(flights.run("k", upstream))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        assert await follower == "result"
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
+
+
+def test_failure_reaches_every_waiter():
+    calls = []
+
+    async def upstream():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("provider down")
+
+    async def scenario():
+        flights = SingleFlight("test")
+        results = await asyncio.gather(*(flights.run("k", upstream) for _ in range(3)), return_exceptions=True)
+        assert len(flights) == 0
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert all(isinstance(r, RuntimeError) for r in results)
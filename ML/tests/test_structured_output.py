@@ -0,0 +1,52 @@
+import pytest
+from pydantic import BaseModel
+
+from structured_output import StructuredOutputError, extract_json, parse_items
+
+
+class Item(BaseModel):
+    name: str
+
+
+def test_clean_json_needs_no_repairs():
+    assert extract_json('{"a": 1}') == ({"a": 1}, [])
+
+
+def test_markdown_fence():
+    assert extract_json('Sure!\n```json\n[{"a": 1}]\n```') == ([{"a": 1}], [])
+
+
+def test_trailing_commas():
+    assert extract_json('{"a": [1, 2,], "b": 3,}') == ({"a": [1, 2], "b": 3}, ["trailing_commas"])
+
+
+def test_single_quotes():
+    value, repairs = extract_json("{'name': 'Cafe \"Pushkin\"', 'open': True}")
+    assert value == {"name": 'Cafe "Pushkin"', "open": True}
+    assert repairs == ["python_literals", "single_quotes"]
+
+
+def test_truncated_reply_keeps_complete_elements():
+    value, repairs = extract_json('[{"name": "Park"}, {"name": "Museum"}, {"name": "Ca')
+    assert value == [{"name": "Park"}, {"name": "Museum"}]
+    assert repairs == ["truncated"]
+
+
+def test_compact_utc_offsets():
+    value, repairs = extract_json('{"start": "2024-05-01T10:00:00+0300"}')
+    assert value == {"start": "2024-05-01T10:00:00+03:00"}
+    assert repairs == ["utc_offsets"]
+
+
+def test_brackets_in_prose_before_the_payload():
+    assert extract_json('Here\'s the plan [note: it\'s fine] and [{"a": 1}]', dict) == ({"a": 1}, [])
+    assert extract_json('Here\'s the plan [note: it\'s fine] and [{"a": 1}]') == ([{"a": 1}], [])
+
+
+def test_no_json_raises():
+    with pytest.raises(StructuredOutputError):
+        extract_json("I can't help with that.")
+
+
+def test_invalid_items_are_dropped():
+    assert parse_items('[{"name": "Park"}, {"title": "x"}]', Item, "test") == [Item(name="Park")]
@@ -0,0 +1,31 @@
+import numpy as np
+
+from vad import SAMPLE_RATE, VAD_MIN_SPEECH_DB, speech_segments, trim_silence
+
+
+def modulated_tone(seconds, depth_db, level=0.3):
+    """A 220 Hz tone whose loudness varies by depth_db at a syllable rate of 4 Hz."""
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    envelope_db = depth_db * (0.5 + 0.5 * np.sin(2 * np.pi * 4 * t)) - depth_db
+    return (level * 10 ** (envelope_db / 20) * np.sin(2 * np.pi * 220 * t)).astype(np.float32)
+
+
+def test_continuous_speech_with_little_dynamics_is_kept():
+    for depth_db in (0, 6, 10):
+        clip = modulated_tone(2.0, depth_db)
+        speech, removed = trim_silence(clip)
+        assert len(speech) == len(clip), depth_db
+        assert removed == 0
+
+
+def test_quiet_clip_has_no_speech():
+    level = 10 ** ((VAD_MIN_SPEECH_DB - 10) / 20)
+    assert speech_segments(modulated_tone(2.0, 3, level=level)) == []
+
+
+def test_silence_around_speech_is_trimmed():
+    silence = np.zeros(SAMPLE_RATE, dtype=np.float32)
+    clip = np.concatenate([silence, modulated_tone(1.0, 6), silence])
+    speech, removed = trim_silence(clip)
+    assert 1.0 <= len(speech) / SAMPLE_RATE < 1.6
+    assert removed > 1.0
@@ -0,0 +1,81 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+from audio_decode import SAMPLE_RATE
+from transcription import FINAL, PARTIAL, Transcriber, TranscriptionQueueFull
+from voice_stream import VoiceStream
+
+
+def pcm(seconds, amplitude):
+    rng = np.random.default_rng(0)
+    samples = rng.normal(0, amplitude, int(seconds * SAMPLE_RATE)).clip(-1, 1)
+    return (samples * 32767).astype("<i2").tobytes()
+
+
+class FakeTranscriber:
+    def __init__(self):
+        self.partials, self.finals = [], []
+
+    async def transcribe_partial(self, data, content_type=None, language=None):
+        self.partials.append(len(data))
+        return {"text": "partial"}
+
+    async def transcribe(self, data, content_type=None, language=None):
+        self.finals.append(len(data))
+        return {"text": "final"}
+
+
+def make_transcriber(partial_limit=1):
+    transcriber = Transcriber(options={"model_size": "tiny", "quantize": False, "threads": 1,
+                                       "beam_size": 1, "language": None, "backend": "whisper"},
+                              partial_limit=partial_limit)
+    # Pretend the workers are running, so clips stay in the queue
+    transcriber.state, transcriber._pool, transcriber._dispatcher = "ready", object(), object()
+    transcriber._queue = asyncio.PriorityQueue(transcriber.queue_size)
+    return transcriber
+
+
+def test_end_of_speech_is_found_in_a_long_message():
+    stream = VoiceStream(FakeTranscriber())
+    stream.feed(pcm(20, 0.2))
+    assert not stream.speech_ended()
+    stream.feed(pcm(1, 0.0005))
+    assert stream.speech_ended()
+
+
+def test_partials_skip_the_cache():
+    transcriber = FakeTranscriber()
+    stream = VoiceStream(transcriber)
+    stream.feed(pcm(2, 0.2))
+    assert asyncio.run(stream.partial()) == "partial"
+    assert transcriber.finals == []
+
+
+def test_complete_clips_go_before_partials():
+    async def scenario():
+        transcriber = make_transcriber()
+        partial = asyncio.create_task(transcriber.transcribe_partial(b"partial"))
+        final = asyncio.create_task(transcriber._enqueue((b"final", None, None)))
+        await asyncio.sleep(0)
+        first, second = transcriber._queue.get_nowait(), transcriber._queue.get_nowait()
+        partial.cancel()
+        final.cancel()
+        return first[0], second[0]
+
+    assert asyncio.run(scenario()) == (FINAL, PARTIAL)
+
+
+def test_partials_have_their_own_limit():
+    async def scenario():
+        transcriber = make_transcriber(partial_limit=1)
+        waiting = asyncio.create_task(transcriber.transcribe_partial(b"one"))
+        await asyncio.sleep(0)
+        with pytest.raises(TranscriptionQueueFull):
+            await transcriber.transcribe_partial(b"two")
+        waiting.cancel()
+        await asyncio.gather(waiting, return_exceptions=True)
+        assert transcriber._partials == 0
+
+    asyncio.run(scenario())
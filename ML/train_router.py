@@ -0,0 +1,100 @@
+"""
+Trains the chat message router on logged AI interactions and the seed corpus.
+
+Export the interactions from the backend database first, e.g.:
+
+    psql "$DATABASE_URL" -c "\\copy (SELECT input_text, intent FROM ai_interactions) TO 'interactions.csv' CSV HEADER"
+
+Then run:
+
+    python train_router.py --interactions interactions.csv --output router_model.json
+"""
+import argparse
+import csv
+import json
+import random
+from collections import Counter
+
+from intent_router import LABELS, ROUTER_MODEL_PATH, ROUTER_SEED_PATH, IntentClassifier, load_examples
+
+# Intent names stored in ai_interactions.intent, mapped to router classes.
+INTENT_LABELS = {
+    "add": "calendar_mutation",
+    "create": "calendar_mutation",
+    "delete": "calendar_mutation",
+    "remove": "calendar_mutation",
+    "update": "calendar_mutation",
+    "move": "calendar_mutation",
+    "reschedule": "calendar_mutation",
+    "query": "calendar_query",
+    "list": "calendar_query",
+    "show": "calendar_query",
+    "greeting": "greeting",
+    "smalltalk": "greeting",
+    "chat": "general",
+    "question": "general",
+    **{label: label for label in LABELS},
+}
+
+
+def read_interactions(path):
+    """
+    Reads exported interactions (CSV with input_text and intent columns, or JSONL).
+
+    Returns:
+        tuple: (texts, labels) of the interactions whose intent maps to a router class.
+    """
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    texts, labels = [], []
+    for row in rows:
+        label = INTENT_LABELS.get((row.get("intent") or "").strip().lower())
+        text = (row.get("input_text") or "").strip()
+        if label and text:
+            texts.append(text)
+            labels.append(label)
+    return texts, labels
+
+
+def accuracy(classifier, texts, labels):
+    if not texts:
+        return None
+    return sum(classifier.predict(t)[0] == l for t, l in zip(texts, labels)) / len(texts)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the chat message router")
+    parser.add_argument("--interactions", action="append", default=[],
+                        help="Exported ai_interactions (CSV or JSONL); may be repeated")
+    parser.add_argument("--seed", default=ROUTER_SEED_PATH, help="Seed corpus (JSONL of text/label)")
+    parser.add_argument("--output", default=ROUTER_MODEL_PATH, help="Where to save the trained router")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Share of examples kept for evaluation")
+    args = parser.parse_args()
+
+    texts, labels = load_examples(args.seed)
+    for path in args.interactions:
+        logged_texts, logged_labels = read_interactions(path)
+        print(f"{path}: {len(logged_texts)} usable interactions")
+        texts += logged_texts
+        labels += logged_labels
+    print(f"Training examples per class: {dict(Counter(labels))}")
+
+    examples = list(zip(texts, labels))
+    random.Random(13).shuffle(examples)
+    split = int(len(examples) * (1 - args.holdout))
+    train, test = examples[:split], examples[split:]
+    if test:
+        evaluation = IntentClassifier().fit(*zip(*train))
+        print(f"Holdout accuracy: {accuracy(evaluation, *zip(*test)):.3f} on {len(test)} examples")
+
+    classifier = IntentClassifier().fit(texts, labels)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(classifier.to_dict(), f, ensure_ascii=False)
+    print(f"Saved router to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,362 @@
+import asyncio
+import hashlib
+import itertools
+import multiprocessing
+import os
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from metrics import metrics
+from response_cache import ResponseCache, canonical_key
+from single_flight import SingleFlight
+from voice_backend import backend_options, create_backend
+
+logger = logging.getLogger(__name__)
+
+# Start the worker processes right after startup instead of on the first /voice request.
+VOICE_WARMUP = os.getenv("VOICE_WARMUP", "1") == "1"
+# Inference processes, each with its own copy of the model.
+VOICE_WORKERS = int(os.getenv("VOICE_WORKERS", "2"))
+# Clips waiting for a worker; further uploads are rejected with 429.
+VOICE_QUEUE_SIZE = int(os.getenv("VOICE_QUEUE_SIZE", "32"))
+# Short clips arriving within this window are decoded in one batched forward pass.
+VOICE_MAX_BATCH = int(os.getenv("VOICE_MAX_BATCH", "8"))
+VOICE_BATCH_WINDOW_MS = float(os.getenv("VOICE_BATCH_WINDOW_MS", "25"))
+# Cut silence before inference; clips without speech are not transcribed at all.
+VOICE_VAD = os.getenv("VOICE_VAD", "1") == "1"
+# Larger uploads are rejected with 413.
+VOICE_MAX_UPLOAD_BYTES = int(os.getenv("VOICE_MAX_UPLOAD_BYTES", str(25 * 1024 * 1024)))
+# Transcripts of identical uploads (client retries, test clips) are reused for this long.
+VOICE_CACHE_TTL = float(os.getenv("VOICE_CACHE_TTL", "3600"))
+VOICE_CACHE_SIZE = int(os.getenv("VOICE_CACHE_SIZE", "512"))
+# Partial transcripts of streamed voice messages waiting or running at once; more are skipped.
+VOICE_PARTIAL_LIMIT = int(os.getenv("VOICE_PARTIAL_LIMIT", str(VOICE_WORKERS)))
+# Retry-After sent with 429 responses, in seconds.
+VOICE_RETRY_AFTER = int(os.getenv("VOICE_RETRY_AFTER", "2"))
+
+COLD, LOADING, READY, FAILED = "cold", "loading", "ready", "failed"
+# Queue priorities: complete clips go to the workers before partial transcripts.
+FINAL, PARTIAL = 0, 1
+
+
+class TranscriptionQueueFull(Exception):
+    """Raised when the transcription queue is full and the upload should be retried later."""
+
+
+class TranscriptionError(Exception):
+    """Raised when a clip cannot be transcribed."""
+
+
+# Backend of the current worker process, set by _init_worker().
+_worker_backend = None
+
+
+def _init_worker(options):
+    global _worker_backend
+    _worker_backend = create_backend(options)
+    _worker_backend.load()
+
+
+def _worker_ready():
+    return os.getpid()
+
+
+def _transcribe_batch(clips):
+    """
+    Transcribes a batch of clips inside a worker process.
+
+    Audio is decoded in memory and cut down to its speech segments; clips
+    without speech skip inference. Clips of up to 30 s of speech are then
+    recognised together in one forward pass, longer ones go through the
+    regular sliding-window transcription one by one.
+
+    Args:
+        clips (list): (audio bytes, content type, language or None) tuples.
+
+    Returns:
+        list: {"text", "language", "audio_seconds", "trimmed_seconds"} or {"error"} per clip, in input order.
+    """
+    import whisper
+    from audio_decode import SAMPLE_RATE, decode_audio
+    from vad import trim_silence
+
+    results = [None] * len(clips)
+    audios = {}
+    for i, (data, content_type, _) in enumerate(clips):
+        try:
+            audio = decode_audio(data, content_type)
+        except Exception as e:
+            results[i] = {"error": f"Cannot decode audio: {e}"}
+            continue
+        results[i] = {"text": "", "language": None, "audio_seconds": len(audio) / SAMPLE_RATE, "trimmed_seconds": 0.0}
+        if VOICE_VAD:
+            audio, results[i]["trimmed_seconds"] = trim_silence(audio)
+        if len(audio):
+            audios[i] = audio
+
+    # Decoding options are shared by a batch, so short clips are batched per language hint
+    short = {}
+    for i, audio in audios.items():
+        if len(audio) <= whisper.audio.N_SAMPLES:
+            short.setdefault(clips[i][2], []).append(i)
+    for language, indices in short.items():
+        decoded = _worker_backend.decode_batch([audios[i] for i in indices], language)
+        for i, (text, detected) in zip(indices, decoded):
+            results[i].update(text=text, language=detected)
+
+    batched = {i for indices in short.values() for i in indices}
+    for i, audio in audios.items():
+        if i not in batched:
+            text, detected = _worker_backend.transcribe(audio, clips[i][2])
+            results[i].update(text=text, language=detected)
+    return results
+
+
+class Transcriber:
+    """
+    Whisper inference in a pool of worker processes fed by a bounded priority queue.
+
+    Complete clips are taken from the queue before partial transcripts of streamed
+    voice messages. Nothing is loaded at import time: the workers are started by
+    warm_up() or by the first transcription request.
+    """
+
+    def __init__(self, options=None, workers=VOICE_WORKERS, queue_size=VOICE_QUEUE_SIZE,
+                 max_batch=VOICE_MAX_BATCH, batch_window=VOICE_BATCH_WINDOW_MS / 1000,
+                 partial_limit=VOICE_PARTIAL_LIMIT):
+        """
+        Initialize the transcriber without starting any process.
+
+        Args:
+            options (dict, optional): Backend options, see voice_backend.backend_options().
+            workers (int, optional): Number of inference processes.
+            queue_size (int, optional): Maximum number of clips waiting for a worker.
+            max_batch (int, optional): Maximum number of clips decoded in one forward pass.
+            batch_window (float, optional): How long to wait for more clips to batch, in seconds.
+            partial_limit (int, optional): Maximum number of partial transcripts waiting or running.
+        """
+        self.options = options or backend_options()
+        if not self.options["threads"]:
+            # Workers run side by side, so each one gets its share of the cores
+            self.options = {**self.options, "threads": max(1, (os.cpu_count() or 1) // workers)}
+        self.model_size = self.options["model_size"]
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.partial_limit = partial_limit
+        self.state = COLD
+        self._pool = None
+        self._queue = None
+        self._slots = None
+        self._dispatcher = None
+        self._loading = None
+        self._batches = set()
+        self._partials = 0
+        self._sequence = itertools.count()
+        self._cache = ResponseCache("transcription", max_entries=VOICE_CACHE_SIZE)
+        self._flights = SingleFlight("transcription")
+
+    @property
+    def ready(self):
+        """Whether the workers are up and transcription starts without a cold-start delay."""
+        return self.state == READY
+
+    def _ensure_started(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(self.options,)
+            )
+        if self._dispatcher is None:
+            self._queue = asyncio.PriorityQueue(self.queue_size)
+            self._slots = asyncio.Semaphore(self.workers)
+            self._dispatcher = asyncio.create_task(self._dispatch())
+
+    async def _load(self):
+        self.state = LOADING
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            # One call per worker makes the pool start every process and load every model
+            await asyncio.gather(*(loop.run_in_executor(self._pool, _worker_ready) for _ in range(self.workers)))
+        except Exception:
+            self.state = FAILED
+            if self._pool is not None:
+                # A failed initializer breaks the pool; the next attempt starts a fresh one
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool = None
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.observe("voice_model_load_seconds", elapsed, model=self.model_size)
+        logger.info(f"Started {self.workers} Whisper '{self.model_size}' workers ({self.options}) in {elapsed:.1f}s")
+        self.state = READY
+
+    async def load(self):
+        """Starts the worker processes and waits until every one has loaded its model."""
+        if self._loading is None or (self._loading.done() and self.state == FAILED):
+            self._ensure_started()
+            self._loading = asyncio.create_task(self._load())
+        await asyncio.shield(self._loading)
+
+    def warm_up(self):
+        """Starts the workers in the background."""
+        if self._loading is None:
+            self._ensure_started()
+            self._loading = asyncio.create_task(self._load())
+            self._loading.add_done_callback(self._log_warm_up_failure)
+
+    @staticmethod
+    def _log_warm_up_failure(task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Whisper warm-up failed: {task.exception()}")
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            await self._slots.acquire()
+            # While waiting for a free worker more clips may have arrived; take them along
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    pass
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            metrics.set_gauge("voice_queue_depth", self._queue.qsize())
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        for _, _, _, _, enqueued in batch:
+            metrics.observe("voice_queue_wait_seconds", started - enqueued)
+        try:
+            results = await loop.run_in_executor(self._pool, _transcribe_batch, [clip for _, _, clip, _, _ in batch])
+            metrics.observe("voice_inference_seconds", loop.time() - started, model=self.model_size)
+            metrics.observe("voice_batch_size", len(batch))
+            if self.state == FAILED:
+                # The pool was restarted by a request and its workers came up after all
+                self.state = READY
+            for (_, _, _, future, _), result in zip(batch, results):
+                if "trimmed_seconds" in result:
+                    metrics.observe("voice_trimmed_seconds", result["trimmed_seconds"])
+                    metrics.observe("voice_audio_seconds", result["audio_seconds"])
+                if future.done():
+                    continue
+                if "error" in result:
+                    future.set_exception(TranscriptionError(result["error"]))
+                else:
+                    future.set_result(result)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died (e.g. out of memory); the next request starts a fresh pool
+                logger.error("Whisper worker pool is broken, restarting it on the next request")
+                self._pool.shutdown(wait=False, cancel_futures=True)
+                self._pool, self._loading, self.state = None, None, COLD
+            for _, _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(TranscriptionError(f"Transcription failed: {e}"))
+        finally:
+            self._slots.release()
+
+    async def _enqueue(self, clip, priority=FINAL):
+        if self.state == COLD:
+            self.warm_up()
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        try:
+            # The sequence number keeps clips of equal priority in arrival order
+            self._queue.put_nowait((priority, next(self._sequence), clip, future, loop.time()))
+        except asyncio.QueueFull:
+            metrics.inc("voice_rejected")
+            raise TranscriptionQueueFull(f"{self._queue.qsize()} clips are already waiting for transcription")
+        metrics.set_gauge("voice_queue_depth", self._queue.qsize())
+        return await future
+
+    async def transcribe(self, data, content_type=None, language=None):
+        """
+        Transcribes an audio clip, reusing the transcript of an identical earlier upload.
+
+        Args:
+            data (bytes): Encoded audio (webm/opus, ogg, wav, ...) or raw 16-bit PCM.
+            content_type (str, optional): MIME type of the clip.
+            language (str, optional): Language hint such as "ru"; defaults to WHISPER_LANGUAGE.
+
+        Returns:
+            dict: Recognised "text" (empty if the clip has no speech), detected "language",
+            the clip's "audio_seconds" and the "trimmed_seconds" of silence cut before inference.
+
+        Raises:
+            TranscriptionQueueFull: Too many clips are already waiting.
+            TranscriptionError: The clip could not be transcribed.
+        """
+        language = language or self.options["language"]
+        key = canonical_key(
+            hashlib.sha256(data).hexdigest(), content_type,
+            self.model_size, self.options["quantize"], self.options["beam_size"], language
+        )
+        cached = await self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        async def run():
+            result = await self._enqueue((data, content_type, language))
+            await self._cache.set(key, result, VOICE_CACHE_TTL)
+            return result
+
+        return await self._flights.run(key, run)
+
+    async def transcribe_partial(self, data, content_type=None, language=None):
+        """
+        Transcribes the latest audio of a voice message that is still being recorded.
+
+        Partial transcripts are throwaway: they are not cached, wait behind complete
+        clips, and at most partial_limit of them are queued or running at once.
+
+        Args:
+            data (bytes): Raw 16-bit PCM or encoded audio.
+            content_type (str, optional): MIME type of the clip.
+            language (str, optional): Language hint; defaults to WHISPER_LANGUAGE.
+
+        Returns:
+            dict: Same as transcribe().
+
+        Raises:
+            TranscriptionQueueFull: Too many partial transcripts or clips are already waiting.
+            TranscriptionError: The clip could not be transcribed.
+        """
+        if self._partials >= self.partial_limit:
+            raise TranscriptionQueueFull(f"{self._partials} partial transcripts are already in progress")
+        self._partials += 1
+        try:
+            return await self._enqueue((data, content_type, language or self.options["language"]), PARTIAL)
+        finally:
+            self._partials -= 1
+
+    def close(self):
+        """Stops the dispatcher and the worker processes."""
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+
+transcriber = Transcriber()
@@ -0,0 +1,89 @@
+import os
+
+import numpy as np
+
+SAMPLE_RATE = 16000
+VAD_FRAME_MS = 30
+# Frames this much louder than the clip's noise floor count as speech...
+VAD_MARGIN_DB = float(os.getenv("VAD_MARGIN_DB", "12"))
+# ...but never quieter than this absolute level (dBFS).
+VAD_MIN_SPEECH_DB = float(os.getenv("VAD_MIN_SPEECH_DB", "-45"))
+# Silence kept around each speech segment so word onsets and endings are not clipped.
+VAD_PADDING_MS = int(os.getenv("VAD_PADDING_MS", "200"))
+# Pauses shorter than this stay in the audio; longer ones are cut.
+VAD_MAX_PAUSE_MS = int(os.getenv("VAD_MAX_PAUSE_MS", "600"))
+# Speech shorter than this in total is treated as noise.
+VAD_MIN_SPEECH_MS = int(os.getenv("VAD_MIN_SPEECH_MS", "250"))
+
+
+def frame_energies(samples, frame_length):
+    """Returns the RMS level of each frame in dBFS."""
+    frames = len(samples) // frame_length
+    if frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    framed = samples[:frames * frame_length].reshape(frames, frame_length)
+    rms = np.sqrt(np.mean(framed.astype(np.float64) ** 2, axis=1))
+    return 20 * np.log10(np.maximum(rms, 1e-10))
+
+
+def speech_segments(samples, sample_rate=SAMPLE_RATE):
+    """
+    Finds speech in a clip with an adaptive energy threshold.
+
+    Frames VAD_MARGIN_DB above the clip's noise floor are speech. A clip with too
+    little dynamic range for that, but louder than VAD_MIN_SPEECH_DB, is kept whole.
+
+    Args:
+        samples (numpy.ndarray): Mono float32 audio.
+        sample_rate (int, optional): Sample rate of the audio.
+
+    Returns:
+        list: (start, end) sample offsets of speech segments, padded and with short pauses merged.
+    """
+    frame_length = sample_rate * VAD_FRAME_MS // 1000
+    energies = frame_energies(samples, frame_length)
+    if len(energies) == 0:
+        return []
+    noise_floor = np.percentile(energies, 10)
+    threshold = max(noise_floor + VAD_MARGIN_DB, VAD_MIN_SPEECH_DB)
+    voiced = energies > threshold
+    if voiced.sum() * VAD_FRAME_MS < VAD_MIN_SPEECH_MS:
+        # Tightly cropped speech, or speech over steady noise, has no quiet frames to compare
+        # against; only a clip that is quiet in absolute terms has no speech
+        if (energies > VAD_MIN_SPEECH_DB).sum() * VAD_FRAME_MS >= VAD_MIN_SPEECH_MS:
+            return [(0, len(samples))]
+        return []
+
+    # Start and end frame indices of runs of voiced frames
+    edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+    starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    padding = VAD_PADDING_MS // VAD_FRAME_MS
+    max_pause = VAD_MAX_PAUSE_MS // VAD_FRAME_MS
+    segments = []
+    for start, end in zip(starts - padding, ends + padding):
+        start, end = max(start, 0), min(end, len(energies))
+        if segments and start - segments[-1][1] <= max_pause:
+            segments[-1][1] = end
+        else:
+            segments.append([start, end])
+    last = len(samples)
+    return [(s * frame_length, last if e == len(energies) else e * frame_length) for s, e in segments]
+
+
+def trim_silence(samples, sample_rate=SAMPLE_RATE):
+    """
+    Cuts a clip down to its speech segments.
+
+    Args:
+        samples (numpy.ndarray): Mono float32 audio.
+        sample_rate (int, optional): Sample rate of the audio.
+
+    Returns:
+        tuple: (speech-only audio, seconds removed); the audio is empty if the clip has no speech.
+    """
+    segments = speech_segments(samples, sample_rate)
+    if not segments:
+        return samples[:0], len(samples) / sample_rate
+    speech = np.concatenate([samples[start:end] for start, end in segments])
+    return speech, (len(samples) - len(speech)) / sample_rate
@@ -0,0 +1,149 @@
+import os
+
+# Transcription backend and its options; each deployment picks its own accuracy/speed trade-off.
+VOICE_BACKEND = os.getenv("VOICE_BACKEND", "whisper")
+WHISPER_MODEL = os.getenv("WHISPER_MODEL", "tiny")
+# "int8" quantises the linear layers to int8 (CPU only); "none" keeps float32 weights.
+WHISPER_QUANTIZE = os.getenv("WHISPER_QUANTIZE", "none")
+# Torch threads per worker process; 0 splits the CPU cores evenly between the workers.
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))
+# 1 decodes greedily; larger values use beam search (slower, slightly more accurate).
+WHISPER_BEAM_SIZE = int(os.getenv("WHISPER_BEAM_SIZE", "1"))
+# Language hint such as "ru"; empty detects the language of every clip.
+WHISPER_LANGUAGE = os.getenv("WHISPER_LANGUAGE", "") or None
+
+QUANTIZE_MODES = ("none", "int8")
+
+
+def backend_options(**overrides):
+    """
+    Returns the configured backend options.
+
+    Args:
+        **overrides: Options to change, e.g. model_size="base".
+
+    Returns:
+        dict: Picklable options accepted by create_backend().
+    """
+    options = {
+        "backend": VOICE_BACKEND,
+        "model_size": WHISPER_MODEL,
+        "quantize": WHISPER_QUANTIZE,
+        "threads": WHISPER_THREADS,
+        "beam_size": WHISPER_BEAM_SIZE,
+        "language": WHISPER_LANGUAGE,
+    }
+    options.update(overrides)
+    return options
+
+
+class WhisperBackend:
+    """openai-whisper inference on 16 kHz mono float32 audio."""
+
+    def __init__(self, model_size=WHISPER_MODEL, quantize=WHISPER_QUANTIZE, threads=WHISPER_THREADS,
+                 beam_size=WHISPER_BEAM_SIZE, language=WHISPER_LANGUAGE):
+        """
+        Initialize the backend without loading the model.
+
+        Args:
+            model_size (str, optional): Whisper model name (tiny, base, small, ...).
+            quantize (str, optional): "none" or "int8".
+            threads (int, optional): Torch threads; 0 keeps the torch default.
+            beam_size (int, optional): Beam width; 1 decodes greedily.
+            language (str, optional): Default language hint; None detects it.
+
+        Raises:
+            ValueError: Unknown quantisation mode.
+        """
+        if quantize not in QUANTIZE_MODES:
+            raise ValueError(f"Unknown quantisation mode {quantize!r}, expected one of {QUANTIZE_MODES}")
+        self.model_size = model_size
+        self.quantize = quantize
+        self.threads = threads
+        self.beam_size = beam_size
+        self.language = language
+        self.model = None
+
+    def load(self):
+        """Loads the model, quantising it if configured."""
+        # torch and whisper are imported here only, so the API process starts without them
+        import torch
+        import whisper
+
+        if self.threads > 0:
+            torch.set_num_threads(self.threads)
+        if self.quantize == "int8":
+            model = whisper.load_model(self.model_size, device="cpu")
+            # whisper.model.Linear only casts its weights to the input dtype, which is float32 on CPU;
+            # turned into plain Linear layers they are picked up by dynamic quantisation
+            for module in model.modules():
+                if isinstance(module, torch.nn.Linear):
+                    module.__class__ = torch.nn.Linear
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        else:
+            model = whisper.load_model(self.model_size)
+        self.model = model.eval()
+
+    def _decoding_options(self, language):
+        import whisper
+
+        return whisper.DecodingOptions(
+            fp16=False,
+            language=language or self.language,
+            beam_size=self.beam_size if self.beam_size > 1 else None
+        )
+
+    def decode_batch(self, audios, language=None):
+        """
+        Recognises clips of up to 30 s in one batched forward pass.
+
+        Args:
+            audios (list): Mono float32 clips.
+            language (str, optional): Language hint for the whole batch.
+
+        Returns:
+            list: (text, language) per clip.
+        """
+        import torch
+        import whisper
+
+        mels = torch.stack([
+            whisper.log_mel_spectrogram(whisper.pad_or_trim(audio), self.model.dims.n_mels)
+            for audio in audios
+        ]).to(self.model.device)
+        with torch.inference_mode():
+            decoded = whisper.decode(self.model, mels, self._decoding_options(language))
+        return [(result.text, result.language) for result in decoded]
+
+    def transcribe(self, audio, language=None):
+        """
+        Recognises a clip of any length with Whisper's sliding window.
+
+        Returns:
+            tuple: (text, language).
+        """
+        import torch
+
+        options = {"fp16": False, "language": language or self.language}
+        if self.beam_size > 1:
+            options["beam_size"] = self.beam_size
+        with torch.inference_mode():
+            result = self.model.transcribe(audio, **options)
+        return result["text"], result.get("language")
+
+
+BACKENDS = {"whisper": WhisperBackend}
+
+
+def create_backend(options):
+    """
+    Builds a backend from backend_options().
+
+    Raises:
+        ValueError: Unknown backend name or option value.
+    """
+    options = dict(options)
+    name = options.pop("backend")
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown transcription backend {name!r}, expected one of {sorted(BACKENDS)}")
+    return BACKENDS[name](**options)
@@ -0,0 +1,106 @@
+import os
+import logging
+
+from audio_decode import SAMPLE_RATE, pcm16_to_float
+from transcription import VOICE_MAX_UPLOAD_BYTES
+from vad import speech_segments
+
+logger = logging.getLogger(__name__)
+
+# New audio needed before the next partial transcript is requested.
+VOICE_PARTIAL_INTERVAL_MS = int(os.getenv("VOICE_PARTIAL_INTERVAL_MS", "1000"))
+# Partial transcripts cover at most this much of the latest audio (Whisper's window is 30 s).
+VOICE_PARTIAL_WINDOW_S = float(os.getenv("VOICE_PARTIAL_WINDOW_S", "28"))
+# Trailing silence after speech that ends the utterance.
+VOICE_END_SILENCE_MS = int(os.getenv("VOICE_END_SILENCE_MS", "800"))
+# Latest audio searched for the end of speech on every frame.
+VOICE_END_WINDOW_S = float(os.getenv("VOICE_END_WINDOW_S", "3"))
+
+
+class VoiceStream:
+    """Audio of one streaming voice message, received as raw 16-bit PCM chunks."""
+
+    def __init__(self, transcriber, sample_rate=SAMPLE_RATE):
+        """
+        Initialize an empty stream.
+
+        Args:
+            transcriber (Transcriber): Transcription service used for partial and final transcripts.
+            sample_rate (int, optional): Sample rate of the incoming PCM.
+        """
+        self.transcriber = transcriber
+        self.sample_rate = sample_rate
+        self.pcm = bytearray()
+        self.partial_text = ""
+        self._partial_covers = 0
+        self._partial_requested = 0
+
+    @property
+    def content_type(self):
+        return f"audio/L16;rate={self.sample_rate}"
+
+    @property
+    def bytes_per_second(self):
+        return self.sample_rate * 2
+
+    def feed(self, chunk):
+        """
+        Appends a PCM chunk.
+
+        Raises:
+            ValueError: The message exceeds VOICE_MAX_UPLOAD_BYTES.
+        """
+        self.pcm.extend(chunk)
+        if len(self.pcm) > VOICE_MAX_UPLOAD_BYTES:
+            raise ValueError("Voice message is too long")
+
+    def partial_due(self):
+        """Whether enough new audio arrived since the last partial transcript."""
+        return len(self.pcm) - self._partial_requested >= self.bytes_per_second * VOICE_PARTIAL_INTERVAL_MS / 1000
+
+    def _window(self, seconds=VOICE_PARTIAL_WINDOW_S):
+        size = int(self.bytes_per_second * seconds)
+        start = max(len(self.pcm) - size, 0)
+        return bytes(self.pcm[start - start % 2:])
+
+    def speech_ended(self):
+        """
+        Whether the latest audio contains speech followed by VOICE_END_SILENCE_MS of silence.
+
+        Runs on every frame, so only the last VOICE_END_WINDOW_S seconds are checked.
+        """
+        samples = pcm16_to_float(self._window(VOICE_END_WINDOW_S), self.sample_rate)
+        segments = speech_segments(samples)
+        if not segments:
+            return False
+        return len(samples) - segments[-1][1] >= SAMPLE_RATE * VOICE_END_SILENCE_MS / 1000
+
+    async def partial(self):
+        """
+        Transcribes the latest window of audio, see Transcriber.transcribe_partial().
+
+        Returns:
+            str: Partial transcript.
+        """
+        covers = len(self.pcm)
+        self._partial_requested = covers
+        result = await self.transcriber.transcribe_partial(self._window(), self.content_type)
+        if covers >= self._partial_covers:
+            self.partial_text = result["text"].strip()
+            self._partial_covers = covers
+        return self.partial_text
+
+    async def final(self):
+        """
+        Returns the transcript of the whole message.
+
+        The last partial transcript is reused when it already covers all of the
+        audio; otherwise the whole message is transcribed once more.
+
+        Returns:
+            dict: Transcription result with "text".
+        """
+        whole_window = len(self.pcm) <= self.bytes_per_second * VOICE_PARTIAL_WINDOW_S
+        if self._partial_covers == len(self.pcm) and whole_window:
+            return {"text": self.partial_text}
+        return await self.transcriber.transcribe(bytes(self.pcm), self.content_type)
@@ -0,0 +1,38 @@
+"""Add precomputed recommendations
+
+Revision ID: 5b1f0c9e7a42
+Revises: df7e9d27ea9d
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b1f0c9e7a42'
+down_revision: Union[str, None] = 'df7e9d27ea9d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('precomputed_recommendations',
+    sa.Column('user_id', sa.UUID(), nullable=False),
+    sa.Column('mode', sa.String(), nullable=False),
+    sa.Column('recommendations', sa.JSON(), nullable=False),
+    sa.Column('weather', sa.String(), nullable=False),
+    sa.Column('valid_from', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('valid_until', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('computed_at', sa.DateTime(timezone=True), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id')
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('precomputed_recommendations')
@@ -1,6 +1,6 @@
 from app.services.geo import forward_geocode
 from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel
 import httpx
@@ -18,6 +18,8 @@ from app.database import models, schemas
 from app.utils.deps import get_current_user
 from app.services.event import EventService
 from app.services.recommend import get_recommendations_for_user
+from app.services.ml_chat import format_sse, stream_ml_chat
+from app.services.intent_parser import FAST_PATH_MIN_CONFIDENCE, parse_calendar_command
 
 router = APIRouter()
 
@@ -36,7 +38,8 @@ def serialize_event(event):
         "summary": event.title,
         "start": event.start_time.isoformat() if event.start_time else "",
         "end": event.end_time.isoformat() if event.end_time else "",
-        "location": event.location or ""
+        "location": event.location or "",
+        "type": event.type or ""
     }
 
 async def handle_ml_calendar_intent(ml_response_data, db, current_user):
@@ -303,6 +306,109 @@ async def handle_ml_calendar_intent(ml_response_data, db, current_user):
     return {"status": "error", "message": "Invalid response format"}
 
 
+async def build_ml_payload(request: CalendarInterpretRequest, db: AsyncSession, current_user):
+    result = await db.execute(
+        models.Event.__table__.select().where(models.Event.user_id == current_user.id)
+    )
+    events = result.fetchall()
+    calendar = [serialize_event(e) for e in events]
+    print("calendar to send:", calendar)
+    user_location = request.location
+    timezone_value = None
+    # If location is not provided, try to get city from user profile
+    if not user_location or user_location == "UTC":
+        # Get user's city from profile
+        profile_result = await db.execute(
+            models.User.__table__.select().where(models.User.id == current_user.id)
+        )
+        user_row = profile_result.fetchone()
+        user_city = getattr(user_row, "hometown", None) if user_row else None
+        if user_city:
+            # Geocode city to coordinates
+            try:
+                async with httpx.AsyncClient() as client:
+                    geo_resp = await client.get(
+                        f"http://egoai.duckdns.org:8000/api/v1/geocode?city={user_city}"
+                    )
+                    geo_resp.raise_for_status()
+                    geo_data = geo_resp.json()
+                    lat = geo_data.get("lat")
+                    lon = geo_data.get("lon")
+                    if lat and lon:
+                        user_location = f"{lat},{lon}"
+            except Exception as e:
+                print(f"Не удалось получить координаты города пользователя: {e}")
+    try:
+        async with httpx.AsyncClient() as client:
+            tz_response = await client.get(f"http://egoai.duckdns.org:8000/api/v1/timezone?location={user_location or 'UTC'}")
+            tz_response.raise_for_status()
+            tz_data = tz_response.json()
+            timezone_value = tz_data.get("timezone")
+    except Exception as e:
+        print(f"Не удалось получить временную зону: {e}")
+        timezone_value = None
+    payload = {
+        "message": request.text,
+        "calendar": calendar,
+        "timezone": timezone_value,
+        "conversation_id": str(current_user.id)
+    }
+    return payload
+
+
+async def confirm_fast_delete(fast_intent, db, current_user):
+    """
+    Checks a locally parsed delete command against the user's calendar.
+
+    The parser cannot tell "cancel dentist" from a sentence that merely starts with a
+    delete verb, and handle_ml_calendar_intent falls back to loose title and time
+    matching. A delete therefore only skips the LLM if exactly one event has exactly the
+    parsed title (ignoring case), or exactly one of those is on the parsed day. The
+    intent is pinned to that event's start time, so it is deleted by exact title and time.
+
+    Returns:
+        The pinned intent, or None if the LLM should decide.
+    """
+    title = fast_intent["event"].get("title")
+    if not title:
+        return None
+    result = await db.execute(
+        models.Event.__table__.select().where(models.Event.user_id == uuid.UUID(str(current_user.id)))
+    )
+    matches = [e for e in result.fetchall() if e.title and e.title.strip().lower() == title.lower()]
+    if len(matches) > 1:
+        day = datetime.fromisoformat(fast_intent["event"]["start_time"])
+        matches = [e for e in matches if e.start_time and e.start_time.astimezone(day.tzinfo).date() == day.date()]
+    if len(matches) != 1:
+        return None
+    return {"intent": "delete", "event": {"title": matches[0].title, "start_time": matches[0].start_time.isoformat()}}
+
+
+def parse_ml_intent(reply):
+    """
+    Parses a calendar intent from an ML chat reply, streamed or not.
+
+    The ML service repairs intent JSON (fences, trailing commas, quotes) on both
+    /chat and /chat/stream, so a strict parse is enough here; a leftover fence is
+    tolerated.
+
+    Returns:
+        The parsed JSON, or None if the reply is plain text.
+    """
+    text = str(reply).strip()
+    if text.startswith("```"):
+        text = text.strip("`").strip()
+        if text.startswith("json"):
+            text = text[len("json"):]
+    try:
+        ml_response_data = json.loads(text)
+    except (json.JSONDecodeError, TypeError) as e:
+        print(f"Failed to parse ML response as JSON: {e}")
+        return None
+    print(f"Parsed ML response as JSON: {ml_response_data}")
+    return ml_response_data
+
+
 @router.post("/interpret")
 async def interpret_and_create_event(
     request: CalendarInterpretRequest,
@@ -356,51 +462,21 @@ async def interpret_and_create_event(
         # If it's not a JSON, proceed with the original logic
         print("Request text is not a JSON, calling ML service.")
 
-    result = await db.execute(
-        models.Event.__table__.select().where(models.Event.user_id == current_user.id)
-    )
-    events = result.fetchall()
-    calendar = [serialize_event(e) for e in events]
-    print("calendar to send:", calendar)
-    user_location = request.location
-    timezone_value = None
-    # If location is not provided, try to get city from user profile
-    if not user_location or user_location == "UTC":
-        # Get user's city from profile
-        profile_result = await db.execute(
-            models.User.__table__.select().where(models.User.id == current_user.id)
-        )
-        user_row = profile_result.fetchone()
-        user_city = getattr(user_row, "hometown", None) if user_row else None
-        if user_city:
-            # Geocode city to coordinates
-            try:
-                async with httpx.AsyncClient() as client:
-                    geo_resp = await client.get(
-                        f"http://egoai.duckdns.org:8000/api/v1/geocode?city={user_city}"
-                    )
-                    geo_resp.raise_for_status()
-                    geo_data = geo_resp.json()
-                    lat = geo_data.get("lat")
-                    lon = geo_data.get("lon")
-                    if lat and lon:
-                        user_location = f"{lat},{lon}"
-            except Exception as e:
-                print(f"Не удалось получить координаты города пользователя: {e}")
-    try:
-        async with httpx.AsyncClient() as client:
-            tz_response = await client.get(f"http://egoai.duckdns.org:8000/api/v1/timezone?location={user_location or 'UTC'}")
-            tz_response.raise_for_status()
-            tz_data = tz_response.json()
-            timezone_value = tz_data.get("timezone")
-    except Exception as e:
-        print(f"Не удалось получить временную зону: {e}")
-        timezone_value = None
-    payload = {
-        "message": request.text,
-        "calendar": calendar,
-        "timezone": timezone_value
-    }
+    # Simple commands are parsed locally and never reach the ML service
+    fast_intent, confidence = parse_calendar_command(request.text)
+    if fast_intent and fast_intent["intent"] == "delete" and confidence >= FAST_PATH_MIN_CONFIDENCE:
+        fast_intent = await confirm_fast_delete(fast_intent, db, current_user)
+    if fast_intent and confidence >= FAST_PATH_MIN_CONFIDENCE:
+        print(f"Fast-path intent (confidence {confidence}): {fast_intent}")
+        intent_result = await handle_ml_calendar_intent(fast_intent, db, current_user)
+        print(f"Intent result from fast path: {intent_result}")
+        if intent_result.get("status") in ["added", "deleted", "changed"]:
+            return {"status": intent_result["status"], "event": intent_result.get("event")}
+        elif intent_result.get("status") == "not_found":
+            return {"status": "not_found"}
+        # Otherwise let the LLM try to make sense of the command
+
+    payload = await build_ml_payload(request, db, current_user)
     try:
         async with httpx.AsyncClient(follow_redirects=True) as client:
             print(f"Sending request to ML service: {payload}")
@@ -416,14 +492,10 @@ async def interpret_and_create_event(
             # Check if the response data is from the response field
             if isinstance(ml_response_data, dict) and "response" in ml_response_data:
                 # Extract the actual response from the ML service wrapper
-                try:
-                    ml_response_string = ml_response_data["response"]
-                    # Try to parse the response as JSON
-                    ml_response_data = json.loads(ml_response_string)
-                    print(f"Parsed ML response as JSON: {ml_response_data}")
-                except (json.JSONDecodeError, TypeError) as e:
-                    print(f"Failed to parse ML response as JSON: {e}")
-                    # If it's not valid JSON, use it as is (plain text)
+                ml_response_string = ml_response_data["response"]
+                # If it's not valid JSON, use it as is (plain text)
+                ml_response_data = parse_ml_intent(ml_response_string)
+                if ml_response_data is None:
                     ml_response_data = ml_response_string
     except httpx.RequestError as e:
         print(f"Error connecting to ML service: {e}")
@@ -448,6 +520,95 @@ async def interpret_and_create_event(
             detail=intent_result.get("message", "Unexpected response from ML service.")
         )
 
+def serialize_intent_result(intent_result):
+    """Makes the result of handle_ml_calendar_intent JSON-serializable for an SSE frame."""
+    data = {"status": intent_result.get("status")}
+    if intent_result.get("message"):
+        data["message"] = intent_result["message"]
+    event = intent_result.get("event")
+    if event is not None:
+        data["event"] = schemas.Event.model_validate(event).model_dump(mode="json")
+    return data
+
+
+@router.post("/interpret/stream")
+async def interpret_and_create_event_stream(
+    request: CalendarInterpretRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Streaming variant of /interpret.
+
+    Plain-language answers are relayed to the browser as `{"delta": ...}` SSE frames while the
+    ML service generates them. Replies that turn out to be a JSON calendar intent are buffered,
+    handled by handle_ml_calendar_intent once the stream completes and reported as a single
+    `intent` event.
+    """
+    fast_intent, confidence = parse_calendar_command(request.text)
+    fast_result = None
+    if fast_intent and fast_intent["intent"] == "delete" and confidence >= FAST_PATH_MIN_CONFIDENCE:
+        fast_intent = await confirm_fast_delete(fast_intent, db, current_user)
+    if fast_intent and confidence >= FAST_PATH_MIN_CONFIDENCE:
+        print(f"Fast-path intent (confidence {confidence}): {fast_intent}")
+        fast_result = await handle_ml_calendar_intent(fast_intent, db, current_user)
+        if fast_result.get("status") not in ["added", "deleted", "changed", "not_found"]:
+            fast_result = None
+
+    if fast_result is not None:
+        async def fast_relay():
+            yield format_sse(serialize_intent_result(fast_result), event="intent")
+            yield format_sse("[DONE]")
+
+        return StreamingResponse(fast_relay(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+    payload = await build_ml_payload(request, db, current_user)
+
+    async def relay():
+        buffer = []
+        is_intent = None
+        try:
+            async for delta in stream_ml_chat(ML_SERVICE_URL, payload):
+                if is_intent is None:
+                    buffer.append(delta)
+                    head = "".join(buffer).lstrip()
+                    if not head:
+                        continue
+                    # Calendar intents always start with a JSON object (possibly fenced)
+                    is_intent = head.startswith("{") or head.startswith("`")
+                    if not is_intent:
+                        yield format_sse({"delta": "".join(buffer)})
+                elif is_intent:
+                    buffer.append(delta)
+                else:
+                    yield format_sse({"delta": delta})
+        except httpx.RequestError as e:
+            print(f"Error connecting to ML service: {e}")
+            yield format_sse({"detail": f"Could not connect to the ML service: {e}"}, event="error")
+            yield format_sse("[DONE]")
+            return
+        except Exception as e:
+            print(f"Unexpected error: {e}")
+            yield format_sse({"detail": f"Error getting response from ML service: {e}"}, event="error")
+            yield format_sse("[DONE]")
+            return
+
+        if is_intent:
+            ml_response_data = parse_ml_intent("".join(buffer))
+            if ml_response_data is None:
+                yield format_sse({"delta": "".join(buffer)})
+            else:
+                intent_result = await handle_ml_calendar_intent(ml_response_data, db, current_user)
+                print(f"Intent result: {intent_result}")
+                yield format_sse(serialize_intent_result(intent_result), event="intent")
+        yield format_sse("[DONE]")
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/get_tasks", response_model=List[schemas.Event])
 async def get_tasks(
     db: AsyncSession = Depends(get_db),
@@ -1,11 +1,12 @@
 from fastapi import APIRouter, HTTPException
-from fastapi.responses import Response
+from fastapi.responses import Response, StreamingResponse
 from fastapi.encoders import jsonable_encoder
 import httpx
 import os
 from typing import Optional, List
 
 from app.database import schemas
+from app.services.ml_chat import format_sse, stream_ml_chat
 
 router = APIRouter()
 
@@ -17,6 +18,8 @@ async def chat_with_llm(
 ):
     payload = {
         "message": req.message,
+        "history": req.history,
+        "conversation_id": req.conversation_id,
     }
     try:
         async with httpx.AsyncClient() as client:
@@ -37,4 +40,30 @@ async def chat_with_llm(
     except httpx.RequestError as e:
         raise HTTPException(status_code=503, detail=f"Could not connect to the ML service: {e}")
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error getting response from ML service or processing event: {e}") 
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"Error getting response from ML service or processing event: {e}") 
+
+@router.post("/chat/stream")
+async def chat_with_llm_stream(
+    req: schemas.LLM_ChatRequest,
+):
+    payload = {
+        "message": req.message,
+        "history": req.history,
+        "conversation_id": req.conversation_id,
+    }
+
+    async def relay():
+        try:
+            async for delta in stream_ml_chat(ML_SERVICE_URL, payload):
+                yield format_sse({"delta": delta})
+        except httpx.RequestError as e:
+            yield format_sse({"detail": f"Could not connect to the ML service: {e}"}, event="error")
+        except Exception as e:
+            yield format_sse({"detail": f"Error getting response from ML service: {e}"}, event="error")
+        yield format_sse("[DONE]")
+
+    return StreamingResponse(
+        relay(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
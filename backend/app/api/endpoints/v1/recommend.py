@@ -1,14 +1,23 @@
-from fastapi import APIRouter, Depends
+from typing import Literal
+from fastapi import APIRouter, Depends, Query
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.utils.deps import get_current_user, get_db
+from app.utils.deps import get_current_admin, get_current_user, get_db
 from app.database.models.models import User
 from app.services.recommend import get_recommendations_for_user
+from app.services.recommendation_cache import recommendation_cache
+from app.services.recommendation_precompute import precompute_status
 
 router = APIRouter()
 
 @router.post("/recommend", summary="Personalized place recommendations", tags=["recommend"])
 async def recommend(
+    mode: Literal["fast", "rich"] = Query("rich", description="fast: ranked real places without the LLM; rich: LLM-written"),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    return await get_recommendations_for_user(db, current_user) 
+    return await get_recommendations_for_user(db, current_user, mode)
+
+
+@router.get("/recommend/precompute", summary="Progress of the recommendation precompute (admins only)", tags=["recommend"])
+async def recommend_precompute_status(current_user: User = Depends(get_current_admin)):
+    return {**precompute_status, "cache_entries": len(recommendation_cache), "cache": recommendation_cache.stats}
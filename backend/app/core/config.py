@@ -27,8 +27,15 @@ class Settings(BaseSettings):
 
     GROQ_API_KEY: Optional[str] = None
 
+    # Comma-separated emails of users allowed to see service-wide stats
+    ADMIN_EMAILS: str = ""
+
     model_config = SettingsConfigDict(env_file=".env", case_sensitive=True, extra='ignore')
 
+    @property
+    def admin_emails_list(self) -> List[str]:
+        return [email.strip().lower() for email in self.ADMIN_EMAILS.split(",") if email.strip()]
+
     @property
     def backend_cors_origins_list(self) -> List[str]:
         origins = []
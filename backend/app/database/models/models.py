@@ -45,6 +45,19 @@ class UserProfile(Base):
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
 
+class PrecomputedRecommendation(Base):
+    __tablename__ = "precomputed_recommendations"
+
+    # One row per user, replaced by every precompute run
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), primary_key=True)
+    mode = Column(String, nullable=False)
+    recommendations = Column(JSON, nullable=False)
+    weather = Column(String, nullable=False)  # weather bucket the recommendations were made for
+    valid_from = Column(DateTime(timezone=True), nullable=False)
+    valid_until = Column(DateTime(timezone=True), nullable=False)
+    computed_at = Column(DateTime(timezone=True), nullable=False)
+
+
 class Reminder(Base):
     __tablename__ = "reminders"
 
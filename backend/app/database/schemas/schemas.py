@@ -161,6 +161,8 @@ class TokenData(BaseModel):
 
 class LLM_ChatRequest(BaseModel):
     message: str
+    history: Optional[List[dict]] = None
+    conversation_id: Optional[str] = None  # keys the ML service's history summary
 
 
 class LLM_ChatResponse(BaseModel):
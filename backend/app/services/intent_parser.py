@@ -0,0 +1,413 @@
+import re
+import zoneinfo
+from datetime import datetime, timedelta, time
+from typing import Any, Dict, List, Optional, Tuple
+
+# Commands parsed with at least this confidence skip the ML service.
+FAST_PATH_MIN_CONFIDENCE = 0.8
+
+DEFAULT_TIMEZONE = zoneinfo.ZoneInfo("Europe/Moscow")
+DEFAULT_DURATION = timedelta(hours=1)
+DEFAULT_EVENT_TYPE = "other work"
+# Titles longer than this are probably full sentences the LLM should handle.
+MAX_TITLE_WORDS = 6
+
+# Only verbs that are calendar commands in everyday speech too: "drop the kids at school",
+# "put the kettle on", "plan a trip" or "убери квартиру" are tasks, not deletions or events.
+INTENT_PATTERNS = [
+    ("add", re.compile(
+        r"^(?:please\s+|пожалуйста,?\s+)?"
+        r"(add|create|schedule|set up|book|"
+        r"добавь|добавить|создай|создать|запланируй|запланировать|поставь|назначь)\b",
+        re.IGNORECASE)),
+    ("delete", re.compile(
+        r"^(?:please\s+|пожалуйста,?\s+)?"
+        r"(delete|remove|cancel|"
+        r"удали|удалить|отмени|отменить)\b",
+        re.IGNORECASE)),
+]
+
+EN_MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4, "apr": 4,
+    "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sep": 9, "sept": 9, "october": 10, "oct": 10, "november": 11, "nov": 11,
+    "december": 12, "dec": 12,
+}
+RU_MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12,
+}
+WEEKDAYS = {
+    "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3, "friday": 4, "saturday": 5, "sunday": 6,
+    "понедельник": 0, "вторник": 1, "среду": 2, "среда": 2, "четверг": 3,
+    "пятницу": 4, "пятница": 4, "субботу": 5, "суббота": 5, "воскресенье": 6,
+}
+RELATIVE_DAYS = {
+    "today": 0, "tonight": 0, "tomorrow": 1, "day after tomorrow": 2,
+    "сегодня": 0, "завтра": 1, "послезавтра": 2,
+}
+
+_en_month_names = "|".join(sorted(EN_MONTHS, key=len, reverse=True))
+_ru_month_names = "|".join(RU_MONTHS)
+_weekday_names = "|".join(sorted(WEEKDAYS, key=len, reverse=True))
+_relative_names = "|".join(sorted(RELATIVE_DAYS, key=len, reverse=True))
+
+ISO_DATE_RE = re.compile(r"\b(?:on\s+)?(\d{4})-(\d{2})-(\d{2})\b")
+NUMERIC_DATE_RE = re.compile(r"\b(?:on\s+)?(\d{1,2})[./](\d{1,2})(?:[./](\d{2,4}))?\b")
+EN_MONTH_DAY_RE = re.compile(rf"\b(?:on\s+)?({_en_month_names})\.?\s+(\d{{1,2}})(?:st|nd|rd|th)?\b", re.IGNORECASE)
+EN_DAY_MONTH_RE = re.compile(rf"\b(?:on\s+)?(?:the\s+)?(\d{{1,2}})(?:st|nd|rd|th)?\s+(?:of\s+)?({_en_month_names})\b", re.IGNORECASE)
+RU_DAY_MONTH_RE = re.compile(rf"\b(\d{{1,2}})\s+({_ru_month_names})\b", re.IGNORECASE)
+# Repeating events are left to the LLM, the fast path only creates one-off events.
+RECURRENCE_RE = re.compile(
+    r"\b(every|each|daily|weekly|monthly|yearly|annually|weekdays|weekends|"
+    r"кажд(?:ый|ую|ое|ые|ого)|ежедневно|еженедельно|ежемесячно|по\s+будням|по\s+выходным)\b",
+    re.IGNORECASE)
+RELATIVE_RE = re.compile(rf"\b({_relative_names})\b", re.IGNORECASE)
+WEEKDAY_RE = re.compile(
+    rf"\b(?:(?:on|this)\s+|(next)\s+|(?:во?|в\s+эт[оуи]т?)\s+|(?:в\s+)?(следующ(?:ий|ую|ее))\s+)?({_weekday_names})\b",
+    re.IGNORECASE)
+
+_time = r"(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)?"
+TIME_RANGE_RE = re.compile(
+    rf"\b(?:from\s+|с\s+)?{_time}\s*(?:-|–|to|until|till|до)\s*{_time}(?=\s|$|[,.!])", re.IGNORECASE)
+EN_TIME_RE = re.compile(r"\b(?:at\s+)?(\d{1,2})(?::(\d{2}))?\s*(am|pm|a\.m\.|p\.m\.)(?=\s|$|[,.!])|\b(?:at\s+)?(\d{1,2}):(\d{2})\b|\bat\s+(\d{1,2})\b(?!\s*(?:hours?|minutes?|h\b|min))", re.IGNORECASE)
+RU_TIME_RE = re.compile(
+    r"\bв\s+(\d{1,2})(?::(\d{2}))?(?:\s*(?:час(?:а|ов)?|ч)\b)?(?:\s+(утра|дня|вечера|ночи)\b)?", re.IGNORECASE)
+NOON_RE = re.compile(r"\b(?:at\s+)?(noon|midday|midnight|в\s+полдень|в\s+полночь)\b", re.IGNORECASE)
+ALL_DAY_RE = re.compile(r"\b(all[\s-]day|на\s+весь\s+день|весь\s+день)\b", re.IGNORECASE)
+DURATION_RE = re.compile(
+    r"\b(?:for|на)\s+(?:(\d+(?:[.,]\d+)?)\s*(hours?|hrs?|h|minutes?|mins?|m|час(?:а|ов)?|ч|минут[уы]?|мин)"
+    r"|(an?\s+hour|half\s+an\s+hour|час|полчаса|полтора\s+часа))\b",
+    re.IGNORECASE)
+
+FILLER_WORDS = {
+    "a", "an", "the", "new", "event", "task", "called", "named", "please", "my", "calendar",
+    "событие", "задачу", "пожалуйста", "мой", "мою", "календарь", "новое", "новую",
+}
+EDGE_WORDS = {"on", "at", "for", "from", "to", "in", "и", "and", "с", "до", "в", "во", "на", "к"}
+# Inside a title these mean the command says more than a title: a place ("in Berlin"),
+# a purpose ("to discuss budget") or an edit of another event ("15 minutes to meeting").
+CONNECTOR_WORDS = EDGE_WORDS | {
+    "with", "about", "into", "by", "near", "before", "after", "until",
+    "со", "ко", "по", "для", "про", "о", "об", "у", "после", "около",
+}
+CALENDAR_TARGET_RE = re.compile(r"(?:to|in|into|on)\s+(?:my\s+|the\s+)?calendar|в\s+(?:мой\s+)?календарь", re.IGNORECASE)
+AMOUNT_RE = re.compile(
+    r"\b\d+(?:[.,]\d+)?\s*(?:minutes?|mins?|hours?|hrs?|h|days?|weeks?|минут\w*|мин|час\w*|ч|дн\w*|недел\w*)\b",
+    re.IGNORECASE)
+TIMEZONE_RE = re.compile(r"\b(?:utc|gmt|msk|cet|cest|eet|est|edt|pst|pdt|time\s*zone|мск|по\s+\w+\s+времени)\b", re.IGNORECASE)
+# "Moscow time", "Berlin time"
+CITY_TIME_RE = re.compile(r"\b[A-Z][a-z]+\s+time\b")
+
+WORD_RE = re.compile(r"[\w'-]+", re.UNICODE)
+CYRILLIC_RE = re.compile(r"[а-яё]", re.IGNORECASE)
+
+
+def _hour_with_period(hour: int, period: Optional[str]) -> int:
+    if not period:
+        return hour
+    period = period.lower().replace(".", "")
+    if period in ("pm", "дня", "вечера") and hour < 12:
+        return hour + 12
+    if period in ("am", "ночи", "утра") and hour == 12:
+        return 0
+    return hour
+
+
+def _valid_time(hour: int, minute: int) -> Optional[time]:
+    if 0 <= hour <= 23 and 0 <= minute <= 59:
+        return time(hour, minute)
+    return None
+
+
+class _Text:
+    """Keeps track of which parts of the command have been consumed by an extractor."""
+
+    def __init__(self, text: str):
+        self.text = text
+        self.spans: List[Tuple[int, int]] = []
+
+    def search(self, pattern: re.Pattern) -> Optional[re.Match]:
+        for match in pattern.finditer(self.text):
+            if not any(start < match.end() and match.start() < end for start, end in self.spans):
+                return match
+        return None
+
+    def consume(self, match: re.Match) -> None:
+        self.spans.append(match.span())
+
+    def pieces(self) -> List[str]:
+        """Unconsumed stretches of the command, in order."""
+        pieces, position = [], 0
+        for start, end in sorted(self.spans):
+            pieces.append(self.text[position:start])
+            position = max(position, end)
+        pieces.append(self.text[position:])
+        return pieces
+
+    def remainder(self) -> str:
+        chars = list(self.text)
+        for start, end in self.spans:
+            for i in range(start, end):
+                chars[i] = " "
+        return "".join(chars)
+
+
+def _extract_date(text: _Text, now: datetime) -> Tuple[Optional[datetime], bool, bool]:
+    """
+    Returns (date, explicit, weekday); date is None when the command has no date.
+
+    weekday is True when the date is the next occurrence of a bare weekday name,
+    which may be today.
+
+    Raises:
+        ValueError: The command names a date that does not exist, e.g. "31/02".
+    """
+    today = now.date()
+
+    match = text.search(ISO_DATE_RE)
+    if match:
+        text.consume(match)
+        return datetime(int(match.group(1)), int(match.group(2)), int(match.group(3))), True, False
+
+    for pattern, month_group, day_group, months in (
+        (EN_MONTH_DAY_RE, 1, 2, EN_MONTHS),
+        (EN_DAY_MONTH_RE, 2, 1, EN_MONTHS),
+        (RU_DAY_MONTH_RE, 2, 1, RU_MONTHS),
+    ):
+        match = text.search(pattern)
+        if match:
+            text.consume(match)
+            month = months[match.group(month_group).lower()]
+            day = int(match.group(day_group))
+            candidate = datetime(today.year, month, day)
+            if candidate.date() < today:
+                candidate = candidate.replace(year=today.year + 1)
+            return candidate, True, False
+
+    match = text.search(NUMERIC_DATE_RE)
+    if match:
+        text.consume(match)
+        day, month = int(match.group(1)), int(match.group(2))
+        year = match.group(3)
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            return datetime(year, month, day), True, False
+        candidate = datetime(today.year, month, day)
+        if candidate.date() < today:
+            candidate = candidate.replace(year=today.year + 1)
+        return candidate, True, False
+
+    match = text.search(RELATIVE_RE)
+    if match:
+        text.consume(match)
+        offset = RELATIVE_DAYS[match.group(1).lower()]
+        return datetime.combine(today + timedelta(days=offset), time()), True, False
+
+    match = text.search(WEEKDAY_RE)
+    if match:
+        text.consume(match)
+        weekday = WEEKDAYS[match.group(3).lower()]
+        days_ahead = (weekday - today.weekday()) % 7
+        if match.group(1) or match.group(2):
+            days_ahead = days_ahead or 7
+            if match.group(1) and days_ahead < 7 and today.weekday() < weekday:
+                # "next Friday" said on Monday means the Friday of next week
+                days_ahead += 7
+        return datetime.combine(today + timedelta(days=days_ahead), time()), True, days_ahead == 0
+
+    return None, False, False
+
+
+def _extract_times(text: _Text) -> Tuple[Optional[time], Optional[time], bool]:
+    """Returns (start, end, unambiguous) for the time of day mentioned in the command."""
+    match = text.search(TIME_RANGE_RE)
+    if match:
+        start_hour = _hour_with_period(int(match.group(1)), match.group(3) or match.group(6))
+        end_hour = _hour_with_period(int(match.group(4)), match.group(6))
+        start = _valid_time(start_hour, int(match.group(2) or 0))
+        end = _valid_time(end_hour, int(match.group(5) or 0))
+        if start and end and (match.group(2) or match.group(5) or match.group(3) or match.group(6)):
+            text.consume(match)
+            return start, end, True
+
+    match = text.search(NOON_RE)
+    if match:
+        text.consume(match)
+        word = match.group(1).lower()
+        return (time(0, 0) if "midnight" in word or "полночь" in word else time(12, 0)), None, True
+
+    match = text.search(EN_TIME_RE)
+    if match:
+        text.consume(match)
+        if match.group(3):
+            hour = _hour_with_period(int(match.group(1)), match.group(3))
+            return _valid_time(hour, int(match.group(2) or 0)), None, True
+        if match.group(4):
+            return _valid_time(int(match.group(4)), int(match.group(5))), None, True
+        hour = int(match.group(6))
+        # "at 7" could be morning or evening, only 13-23 are unambiguous
+        return _valid_time(hour, 0), None, hour >= 13
+
+    match = text.search(RU_TIME_RE)
+    if match:
+        text.consume(match)
+        hour = _hour_with_period(int(match.group(1)), match.group(3))
+        unambiguous = bool(match.group(2) or match.group(3)) or hour >= 13 or hour == 0
+        return _valid_time(hour, int(match.group(2) or 0)), None, unambiguous
+
+    return None, None, False
+
+
+def _extract_duration(text: _Text) -> Optional[timedelta]:
+    match = text.search(DURATION_RE)
+    if not match:
+        return None
+    text.consume(match)
+    if match.group(3):
+        phrase = re.sub(r"\s+", " ", match.group(3).lower())
+        if phrase in ("half an hour", "полчаса"):
+            return timedelta(minutes=30)
+        if phrase == "полтора часа":
+            return timedelta(minutes=90)
+        return timedelta(hours=1)
+    amount = float(match.group(1).replace(",", "."))
+    unit = match.group(2).lower()
+    if unit.startswith(("h", "час", "ч")):
+        return timedelta(hours=amount)
+    return timedelta(minutes=amount)
+
+
+def _normalize_russian_title(words: List[str]) -> List[str]:
+    """Turns an accusative first noun back into the nominative: "встречу" -> "встреча"."""
+    first = words[0]
+    lower = first.lower()
+    if len(lower) > 3 and CYRILLIC_RE.match(lower):
+        if lower.endswith("у") and lower[-2] not in "аеёиоуыэюя":
+            first = first[:-1] + "а"
+        elif lower.endswith("ю") and lower[-2] == "и":
+            first = first[:-1] + "я"
+    return [first] + words[1:]
+
+
+def _extract_title(remainder: str) -> Tuple[str, bool]:
+    """
+    Returns (title, extra) from what is left of the command.
+
+    extra is True when the leftover is more than a title: it has a connector word
+    inside, an amount with a unit or a timezone, which only the LLM can interpret.
+    """
+    remainder = CALENDAR_TARGET_RE.sub(" ", remainder)
+    extra = bool(AMOUNT_RE.search(remainder) or TIMEZONE_RE.search(remainder) or CITY_TIME_RE.search(remainder))
+    words = [w for w in WORD_RE.findall(remainder) if w.lower() not in FILLER_WORDS]
+    while words and words[0].lower() in EDGE_WORDS:
+        words.pop(0)
+    while words and words[-1].lower() in EDGE_WORDS:
+        words.pop()
+    if not words:
+        return "", extra
+    extra = extra or any(w.lower() in CONNECTOR_WORDS for w in words)
+    if CYRILLIC_RE.search(words[0]):
+        words = _normalize_russian_title(words)
+    title = " ".join(words)
+    return title[0].upper() + title[1:], extra
+
+
+def parse_calendar_command(text: str, now: Optional[datetime] = None) -> Tuple[Optional[Dict[str, Any]], float]:
+    """
+    Parses simple add/delete calendar commands in English and Russian without the LLM,
+    e.g. "add meeting tomorrow at 15:00" or "удали стоматолога в пятницу".
+
+    Returns ({"intent", "event"}, confidence) in the same shape the ML service produces,
+    so the result can go straight to handle_ml_calendar_intent. The intent is None when
+    the text is not a command this parser understands, names an impossible date or
+    describes a repeating event; only results with confidence at or above
+    FAST_PATH_MIN_CONFIDENCE should be acted upon. Commands that say more than a
+    title, date and time ("... in Berlin", "... to discuss budget") stay below it. Delete intents additionally need an
+    exact title match in the user's calendar, see confirm_fast_delete in calendar.py.
+    """
+    command = " ".join(text.strip().split())
+    if not command or "?" in command or RECURRENCE_RE.search(command):
+        return None, 0.0
+
+    intent = None
+    for name, pattern in INTENT_PATTERNS:
+        match = pattern.match(command)
+        if match:
+            intent = name
+            command = command[match.end():]
+            break
+    if intent is None:
+        return None, 0.0
+
+    now = now or datetime.now(DEFAULT_TIMEZONE)
+    parts = _Text(command)
+    all_day_match = parts.search(ALL_DAY_RE)
+    if all_day_match:
+        parts.consume(all_day_match)
+    try:
+        day, explicit_date, weekday_today = _extract_date(parts, now)
+    except ValueError:
+        # "31/02" or "2026-13-45": the user meant a specific date, the LLM has to work out which
+        return None, 0.0
+    start, end, unambiguous_time = _extract_times(parts)
+    duration = _extract_duration(parts)
+    title, extra = _extract_title(parts.remainder())
+    # Words on both sides of the date or time ("meeting tomorrow at 15:00 moscow time")
+    extra = extra or sum(1 for piece in parts.pieces() if _extract_title(piece)[0]) > 1
+
+    confidence = 0.3
+    if title:
+        confidence += 0.25 if intent == "add" else 0.35
+        if len(title.split()) > MAX_TITLE_WORDS:
+            confidence -= 0.3
+    if intent == "add":
+        if all_day_match or (start and unambiguous_time):
+            confidence += 0.3
+        elif start:
+            confidence += 0.15
+        if explicit_date:
+            confidence += 0.15
+    else:
+        if explicit_date or (start and unambiguous_time):
+            confidence += 0.35
+        elif start:
+            confidence += 0.15
+    if extra:
+        confidence = min(confidence, FAST_PATH_MIN_CONFIDENCE - 0.2)
+
+    day = day or datetime.combine(now.date(), time())
+    if all_day_match:
+        start, end = time(0, 0), time(23, 59)
+    start_dt = datetime.combine(day.date(), start or time(0, 0), tzinfo=DEFAULT_TIMEZONE)
+    if intent == "add" and weekday_today and start and start_dt < now:
+        # "в субботу в 7 утра" said on Saturday at 10:00 means next Saturday
+        day += timedelta(days=7)
+        start_dt += timedelta(days=7)
+    elif intent == "add" and not explicit_date and start and start_dt < now:
+        # "add meeting at 9am" said at 15:00 means tomorrow
+        day += timedelta(days=1)
+        start_dt += timedelta(days=1)
+    if end:
+        end_dt = datetime.combine(day.date(), end, tzinfo=DEFAULT_TIMEZONE)
+        if end_dt <= start_dt:
+            end_dt += timedelta(days=1)
+    else:
+        end_dt = start_dt + (duration or DEFAULT_DURATION)
+
+    event: Dict[str, Any] = {
+        "title": title,
+        "start_time": start_dt.isoformat(sep=" "),
+    }
+    if intent == "add":
+        event.update({
+            "description": "",
+            "end_time": end_dt.isoformat(sep=" "),
+            "all_day": bool(all_day_match),
+            "location": "",
+            "type": DEFAULT_EVENT_TYPE,
+        })
+    elif not title:
+        event.pop("title")
+
+    return {"intent": intent, "event": event}, round(max(min(confidence, 1.0), 0.0), 2)
@@ -0,0 +1,60 @@
+import json
+import logging
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Time allowed between two frames of the ML stream, not for the whole answer.
+ML_STREAM_READ_TIMEOUT = 30.0
+
+
+class MLStreamError(Exception):
+    """Raised when the ML service reports an error inside an open stream."""
+
+
+def stream_url(ml_service_url: str) -> str:
+    """Returns the streaming endpoint that sits next to the ML chat endpoint."""
+    return f"{ml_service_url.rstrip('/')}/stream"
+
+
+def format_sse(data: Any, event: Optional[str] = None) -> str:
+    """Formats a single Server-Sent Events frame; non-string payloads are JSON-encoded."""
+    if not isinstance(data, str):
+        data = json.dumps(data, ensure_ascii=False, default=str)
+    frame = f"event: {event}\n" if event else ""
+    return frame + f"data: {data}\n\n"
+
+
+async def stream_ml_chat(ml_service_url: str, payload: Dict[str, Any]) -> AsyncIterator[str]:
+    """
+    Relays text deltas from the ML service `/stream` endpoint.
+
+    Yields each delta as soon as its SSE frame arrives. Raises httpx errors if the
+    ML service cannot be reached and MLStreamError if it reports a failure mid-stream.
+    """
+    url = stream_url(ml_service_url)
+    timeout = httpx.Timeout(ML_STREAM_READ_TIMEOUT, connect=5.0)
+    async with httpx.AsyncClient(follow_redirects=True, timeout=timeout) as client:
+        async with client.stream("POST", url, json=payload) as response:
+            response.raise_for_status()
+            event = None
+            async for line in response.aiter_lines():
+                if not line:
+                    event = None
+                    continue
+                if line.startswith("event:"):
+                    event = line[len("event:"):].strip()
+                    continue
+                if not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    return
+                frame = json.loads(data)
+                if event == "error":
+                    raise MLStreamError(frame.get("detail", "ML stream failed"))
+                delta = frame.get("delta")
+                if delta:
+                    yield delta
@@ -1,18 +1,38 @@
-from typing import Optional
+import asyncio
+from typing import Awaitable, Callable, Optional, Tuple
 from fastapi import HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.database.models.models import User, UserProfile
+from app.database.models.models import PrecomputedRecommendation, User, UserProfile
 import httpx
 import datetime
 from app.services import timezone as timezone_service
 from app.services.geo import fetch_poi_opentripmap, forward_geocode
+from app.services.recommendation_cache import (
+    TTLCache, geohash, recommendation_cache, recommendation_key, weather_bucket,
+)
 import logging
+import os
 
 logger = logging.getLogger(__name__)
 
 DEFAULT_POSITION = "55.7558,37.6173"  # Москва
 
+ML_RECOMMEND_URL = "http://ego-ai-ml-service:8001/recommend/"
+# Budgets of the ML call per mode, in seconds; a rich call that fails or runs out falls back to fast.
+ML_TIMEOUTS = {"fast": 5.0, "rich": 60.0}
+# Lookups shared by everyone in a location cell: geocoded cities, weather and timezone, nearby places.
+GEOCODE_TTL_SECONDS = 7 * 24 * 3600
+CONDITIONS_TTL_SECONDS = 600
+PLACES_TTL_SECONDS = 24 * 3600
+# A fast answer given in place of a failed rich one is cached under the rich key only this long,
+# and is refreshed by the next request.
+RECOMMEND_FALLBACK_MAX_AGE_SECONDS = float(os.getenv("RECOMMEND_FALLBACK_MAX_AGE_SECONDS", "300"))
+
+geocode_cache = TTLCache(GEOCODE_TTL_SECONDS)
+conditions_cache = TTLCache(CONDITIONS_TTL_SECONDS)
+places_cache = TTLCache(PLACES_TTL_SECONDS)
+
 # Типы мест, которые будем искать (можно расширить)
 POI_TYPES = [
     "cafe", "restaurant", "bar", "pub", "fast_food", "park", "playground", "garden", "exhibition_center", "museum", "art_gallery", "theatre", "cinema", "library", "attraction", "zoo", "aquarium", "theme_park", "shopping", "supermarket", "convenience", "bakery", "clothes", "shoes", "gift", "sports_shop", "hotel", "hostel", "motel", "guest_house", "camp_site", "caravan_site", "hospital", "clinic", "pharmacy", "doctors", "dentist", "veterinary", "school", "university", "college", "kindergarten", "bank", "atm", "post_office", "police", "fire_station", "fuel", "parking", "charging_station", "bus_station", "taxi", "train_station", "subway_entrance", "airport", "ferry_terminal", "marketplace", "stadium", "sports_centre", "swimming_pool", "fitness_centre", "nightclub", "casino", "beach", "viewpoint", "water_park", "sauna", "spa", "bowling_alley", "ice_rink", "golf_course", "miniature_golf", "dog_park", "community_centre", "place_of_worship", "church", "mosque", "synagogue", "temple", "monastery", "embassy", "courthouse", "townhall", "public_building", "memorial", "monument", "ruins", "castle", "fort", "archaeological_site"
@@ -26,20 +46,42 @@ def filter_poi_by_types(pois, poi_types):
             filtered.append(poi)
     return filtered
 
-async def get_recommendations_for_user(db: AsyncSession, user: User):
+async def get_user_profile(db: AsyncSession, user: User) -> UserProfile:
+    """
+    Returns the user's profile.
+
+    Raises:
+        HTTPException: 404 if the user has no profile.
+    """
     result = await db.execute(
         select(UserProfile).where(UserProfile.user_id == user.id)
     )
     profile = result.scalar_one_or_none()
     if not profile:
         raise HTTPException(status_code=404, detail="User profile not found")
+    return profile
+
 
+def resolve_position(hometown: Optional[str]) -> Tuple[str, str, str]:
+    """
+    Turns the profile's hometown (a city name or "lat,lon") into coordinates.
+
+    Geocoded cities are cached, the default is Moscow. Geocoding is a blocking
+    HTTP call, so async callers run this in a thread.
+
+    Returns:
+        tuple: (position "lat,lon", lat, lon).
+    """
     # Определяем position
-    position = profile.hometown or DEFAULT_POSITION
+    position = hometown or DEFAULT_POSITION
     logger.info(f"[recommend] User hometown/raw position: {position}")
 
     # Если position не содержит запятой (т.е. это не координаты, а город), преобразуем в координаты
     if "," not in position:
+        cached = geocode_cache.get(position.lower())
+        if cached is not None:
+            return cached
+        city = position
         try:
             logger.info(f"[recommend] Trying to geocode city name: {position}")
             geo_data = forward_geocode(position)
@@ -47,6 +89,7 @@ async def get_recommendations_for_user(db: AsyncSession, user: User):
             lon = geo_data["lon"]
             position = f"{lat},{lon}"
             logger.info(f"[recommend] Geocoded city '{position}' to coordinates: {lat}, {lon}")
+            geocode_cache.set(city.lower(), (position, lat, lon))
         except Exception as e:
             logger.error(f"[recommend] Failed to geocode city '{position}': {e}. Using default Moscow.", exc_info=True)
             position = DEFAULT_POSITION
@@ -54,32 +97,67 @@ async def get_recommendations_for_user(db: AsyncSession, user: User):
     else:
         lat, lon = position.split(",")
         logger.info(f"[recommend] Using provided coordinates: {lat}, {lon}")
+    return position, lat.strip(), lon.strip()
 
-    # Получаем погоду
-    try:
-        from app.services import weather as weather_service
-        w = weather_service.get_current_weather(position)
-        temp = w['current_weather']['temperature']
-        code = w['current_weather']['weathercode']
-        weather = f"{temp}°C, code {code}"
-        logger.info(f"[recommend] Weather: {weather}")
-    except Exception as e:
-        logger.warning(f"[recommend] Weather fetch failed: {e}")
-        weather = "unknown"
 
-    # Получаем локальное время и временную зону
-    try:
-        tz_info = timezone_service.get_timezone_utc(position)
-        utc_offset = tz_info.get("utc_offset_seconds", 0)
-        now_utc = datetime.datetime.utcnow()
-        local_time = now_utc + datetime.timedelta(seconds=utc_offset)
-        local_time_str = local_time.strftime("%Y-%m-%d %H:%M:%S")
-        timezone_name = tz_info.get("timezone", "")
-        logger.info(f"[recommend] Local time: {local_time_str}, Timezone: {timezone_name}")
-    except Exception as e:
-        logger.warning(f"[recommend] Timezone fetch failed: {e}")
-        local_time_str = ""
-        timezone_name = ""
+def get_cell_conditions(position: str, cell: str, at: Optional[datetime.datetime] = None) -> dict:
+    """
+    Returns the current weather and local time of a location cell.
+
+    Weather and timezone are fetched once per cell and cached for CONDITIONS_TTL_SECONDS;
+    the local time is recomputed from the cached UTC offset. The lookups are blocking
+    HTTP calls, so async callers run this in a thread.
+
+    Args:
+        position (str): "lat,lon" of the cell.
+        cell (str): Geohash cell.
+        at (datetime, optional): Time to give the local time of instead of now; aware.
+
+    Returns:
+        dict: weather string, weather_code, temperature, local_time, hour and timezone.
+    """
+    cached = conditions_cache.get(cell)
+    if cached is None:
+        cached = {"weather": "unknown", "weather_code": None, "temperature": None, "utc_offset": None, "timezone": ""}
+        # Получаем погоду
+        try:
+            from app.services import weather as weather_service
+            w = weather_service.get_current_weather(position)
+            cached["temperature"] = w['current_weather']['temperature']
+            cached["weather_code"] = w['current_weather']['weathercode']
+            cached["weather"] = f"{cached['temperature']}°C, code {cached['weather_code']}"
+            logger.info(f"[recommend] Weather: {cached['weather']}")
+        except Exception as e:
+            logger.warning(f"[recommend] Weather fetch failed: {e}")
+
+        # Получаем временную зону
+        try:
+            tz_info = timezone_service.get_timezone_utc(position)
+            cached["utc_offset"] = tz_info.get("utc_offset_seconds", 0)
+            cached["timezone"] = tz_info.get("timezone", "")
+        except Exception as e:
+            logger.warning(f"[recommend] Timezone fetch failed: {e}")
+        conditions_cache.set(cell, cached)
+
+    conditions = dict(cached, local_time="", hour=None)
+    if cached["utc_offset"] is not None:
+        utc_time = at.astimezone(datetime.timezone.utc).replace(tzinfo=None) if at else datetime.datetime.utcnow()
+        local_time = utc_time + datetime.timedelta(seconds=cached["utc_offset"])
+        conditions["local_time"] = local_time.strftime("%Y-%m-%d %H:%M:%S")
+        conditions["hour"] = local_time.hour
+        logger.info(f"[recommend] Local time: {conditions['local_time']}, Timezone: {conditions['timezone']}")
+    return conditions
+
+
+async def get_nearby_places(lat: str, lon: str, cell: str) -> list:
+    """
+    Returns up to 50 real places around a location, fetched from OpenTripMap once per cell.
+
+    The search radius grows until something is found.
+    """
+    cached = places_cache.get(cell)
+    if cached is not None:
+        return cached
 
     # Получаем реальные POI через OpenTripMap
     nearby_places = []
@@ -105,8 +183,15 @@ async def get_recommendations_for_user(db: AsyncSession, user: User):
             })
     except Exception as e:
         logger.error(f"[recommend] Error fetching POI from OpenTripMap: {e}", exc_info=True)
-        nearby_places = []
+        # A failed lookup is not cached, the next request tries again
+        return []
+
+    places_cache.set(cell, nearby_places[:50])
+    return nearby_places[:50]
+
 
+def build_recommendation_payload(profile: UserProfile, position: str, conditions: dict, nearby_places: list) -> dict:
+    """Builds the ML recommender request."""
     # Если после всех попыток nearby_places пустой — логируем и отправляем пустой список в ML
     if not nearby_places:
         logger.warning("[recommend] WARNING: No relevant POI found for user, sending empty nearby_places to ML.")
@@ -116,95 +201,215 @@ async def get_recommendations_for_user(db: AsyncSession, user: User):
         "age": profile.age if profile.age is not None else None,
         "gender": profile.sex or "",
         "description": profile.description or "",
-        "weather": weather,
-        "local_time": local_time_str,
-        "timezone": timezone_name,
-        "nearby_places": nearby_places[:50] if nearby_places else None  # None если пусто
+        "weather": conditions["weather"],
+        "local_time": conditions["local_time"],
+        "timezone": conditions["timezone"],
+        "nearby_places": nearby_places or None  # None если пусто
     }
     logger.info(f"[recommend] ML payload: {payload}")
+    return payload
+
+
+def transform_recommendations(recommendations) -> list:
+    """
+    Converts ML recommendations to the shape the frontend expects.
+
+    Entries without valid coordinates are skipped.
+
+    Args:
+        recommendations (list): Items with name, description, latitude, longitude, confidence and optional category.
+
+    Returns:
+        list: Frontend recommendations (id, title, description, address, lat, lon, category, rating, timestamps).
+    """
+    transformed_recommendations = []
+    now = datetime.datetime.now()
+    timestamp = int(now.timestamp())
+    for i, rec in enumerate(recommendations):
+        if not isinstance(rec, dict):
+            continue
+        # Extract and validate coordinates
+        try:
+            lat = float(rec.get("latitude", 0))
+            lon = float(rec.get("longitude", 0))
+        except (ValueError, TypeError) as e:
+            logger.error(f"[RECOMMEND] Failed to parse coordinates for recommendation {i}: {e}")
+            continue
+        # Validate coordinate ranges
+        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            logger.warning(f"[RECOMMEND] Invalid coordinates for recommendation {i}: lat={lat}, lon={lon}")
+            continue
+
+        transformed_recommendations.append({
+            "id": f"rec_{timestamp}_{i}",  # Unique ID: timestamp + index
+            "title": rec.get("name", "Unknown Place"),  # ML: name → Frontend: title
+            "description": rec.get("description", ""),
+            "address": f"{lat:.6f}, {lon:.6f}",  # Create address from coordinates with precision
+            "lat": lat,  # ML: latitude → Frontend: lat
+            "lon": lon,  # ML: longitude → Frontend: lon
+            "category": rec.get("category") or "Recommendation",
+            "rating": float(rec.get("confidence", 5)) / 2,  # Convert confidence (0-10) to rating (0-5)
+            "createdAt": now.isoformat(),
+            "updatedAt": now.isoformat()
+        })
+    return transformed_recommendations
+
 
+async def fetch_ml_recommendations(payload: dict, mode: str) -> list:
+    """
+    Calls the ML recommender in the given mode.
+
+    Returns:
+        list: Raw ML recommendations.
+
+    Raises:
+        httpx.HTTPError: The ML service failed or did not answer within ML_TIMEOUTS[mode].
+        ValueError: The ML service returned invalid JSON.
+    """
+    async with httpx.AsyncClient() as client:
+        logger.info(f"[RECOMMEND] Calling ML service at: {ML_RECOMMEND_URL} (mode={mode})")
+        response = await client.post(ML_RECOMMEND_URL, json={**payload, "mode": mode}, timeout=ML_TIMEOUTS[mode])
+        logger.info(f"[RECOMMEND] ML service raw response: {response.text}")
+        response.raise_for_status()
+        ml_response = response.json()
+
+    if isinstance(ml_response, dict) and "recommendations" in ml_response:
+        return ml_response["recommendations"]
+    if isinstance(ml_response, list):
+        return ml_response
+    return [ml_response]
+
+
+async def compute_recommendations(payload_parts: Callable[[], Awaitable[dict]], mode: str) -> dict:
+    """
+    Calls the ML recommender and transforms its answer for the frontend.
+
+    A rich call that fails or times out falls back to fast mode.
+
+    Args:
+        payload_parts (callable): Returns a coroutine producing the ML request.
+        mode (str): "fast" or "rich".
+
+    Returns:
+        dict: {"recommendations": [...], "mode": mode that produced them}.
+
+    Raises:
+        HTTPException: 503 if the ML service failed in fast mode too.
+    """
+    payload = await payload_parts()
     try:
-        async with httpx.AsyncClient() as client:
-            logger.info("[RECOMMEND] Calling ML service at: http://ego-ai-ml-service:8001/recommend/")
-            response = await client.post(
-                "http://ego-ai-ml-service:8001/recommend/",
-                json=payload,
-                timeout=60.0
-            )
-            
-            # Log raw response content
-            raw_content = response.text
-            logger.info(f"[RECOMMEND] ML service raw response: {raw_content}")
-            
-            response.raise_for_status()
-            
-            try:
-                ml_response = response.json()
-                logger.info(f"[RECOMMEND] ML service parsed JSON: {ml_response}")
-            except Exception as json_error:
-                logger.error(f"[RECOMMEND] Failed to parse ML response as JSON: {json_error}")
-                logger.error(f"[RECOMMEND] Raw response that failed to parse: {raw_content}")
-                raise HTTPException(status_code=500, detail=f"ML service returned invalid JSON: {raw_content}")
-            
-            logger.info(f"[RECOMMEND] Final response to frontend: {ml_response}")
-            
-            # Transform ML response to match frontend expectations
-            if isinstance(ml_response, dict) and "recommendations" in ml_response:
-                recommendations = ml_response["recommendations"]
-            elif isinstance(ml_response, list):
-                recommendations = ml_response
-            else:
-                recommendations = [ml_response]
-            
-            # Transform each recommendation to match frontend format
-            transformed_recommendations = []
-            timestamp = int(datetime.datetime.now().timestamp())
-            for i, rec in enumerate(recommendations):
-                if isinstance(rec, dict):
-                    # Extract and validate coordinates
-                    try:
-                        lat = float(rec.get("latitude", 0))
-                        lon = float(rec.get("longitude", 0))
-                        
-                        # Validate coordinate ranges
-                        if not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
-                            logger.warning(f"[RECOMMEND] Invalid coordinates for recommendation {i}: lat={lat}, lon={lon}")
-                            continue
-                            
-                    except (ValueError, TypeError) as e:
-                        logger.error(f"[RECOMMEND] Failed to parse coordinates for recommendation {i}: {e}")
-                        continue
-                    
-                    transformed_rec = {
-                        "id": f"rec_{timestamp}_{i}",  # Unique ID: timestamp + index
-                        "title": rec.get("name", "Unknown Place"),  # ML: name → Frontend: title
-                        "description": rec.get("description", ""),  # ✅ совпадает
-                        "address": f"{lat:.6f}, {lon:.6f}",  # Create address from coordinates with precision
-                        "lat": lat,  # ML: latitude → Frontend: lat
-                        "lon": lon,  # ML: longitude → Frontend: lon
-                        "category": "Recommendation",  # Default category
-                        "rating": float(rec.get("confidence", 5)) / 2,  # Convert confidence (0-10) to rating (0-5)
-                        "createdAt": datetime.datetime.now().isoformat(),
-                        "updatedAt": datetime.datetime.now().isoformat()
-                    }
-                    
-                    logger.info(f"[RECOMMEND] Transformed recommendation {i}: {transformed_rec}")
-                    transformed_recommendations.append(transformed_rec)
-            
-            final_response = {
-                "recommendations": transformed_recommendations
-            }
-            
-            logger.info(f"[RECOMMEND] Transformed response for frontend: {final_response}")
-            
-            # Log the actual response that will be sent
-            import json
-            response_json = json.dumps(final_response, ensure_ascii=False)
-            logger.info(f"[RECOMMEND] Final response JSON string: {response_json}")
-            logger.info(f"[RECOMMEND] Final response content-type: application/json")
-            
-    except Exception as e:
-        logger.error(f"[RECOMMEND] ML service error: {e}", exc_info=True)
-        raise HTTPException(status_code=503, detail=f"ML service error: {e}")
+        recommendations = await fetch_ml_recommendations(payload, mode)
+    except (httpx.HTTPError, ValueError) as e:
+        if mode == "fast":
+            logger.error(f"[RECOMMEND] ML service error: {e}", exc_info=True)
+            raise HTTPException(status_code=503, detail=f"ML service error: {e}")
+        logger.warning(f"[RECOMMEND] Rich recommendations failed, falling back to fast mode: {e}")
+        mode = "fast"
+        try:
+            recommendations = await fetch_ml_recommendations(payload, mode)
+        except (httpx.HTTPError, ValueError) as e:
+            logger.error(f"[RECOMMEND] ML service error: {e}", exc_info=True)
+            raise HTTPException(status_code=503, detail=f"ML service error: {e}")
 
+    final_response = {"recommendations": transform_recommendations(recommendations), "mode": mode}
+    logger.info(f"[RECOMMEND] Transformed response for frontend: {final_response}")
     return final_response
+
+
+async def recommend_for_profile(profile: UserProfile, mode: str = "rich", wait: bool = False,
+                                at: Optional[datetime.datetime] = None) -> dict:
+    """
+    Recommends places for a profile, sharing cached answers between similar users nearby.
+
+    Answers are cached per geohash cell, age band, sex, description, weather and
+    time-of-day bucket and mode. A stale answer is returned at once and refreshed
+    in the background; nearby places are only fetched when the answer is recomputed.
+    A fast fallback to a rich request is stale right away and kept only for
+    RECOMMEND_FALLBACK_MAX_AGE_SECONDS, so rich mode is retried on the next request.
+
+    Args:
+        profile (UserProfile): User's profile.
+        mode (str, optional): "fast" or "rich".
+        wait (bool, optional): Recompute a stale answer before returning it.
+        at (datetime, optional): Time the recommendations are for instead of now.
+
+    Returns:
+        dict: {"recommendations": [...], "mode": mode that produced them}.
+    """
+    position, lat, lon = await asyncio.to_thread(resolve_position, profile.hometown)
+    cell = geohash(float(lat), float(lon))
+    conditions = await asyncio.to_thread(get_cell_conditions, position, cell, at)
+    key = recommendation_key(
+        cell, profile.age, profile.sex, profile.description,
+        conditions["weather_code"], conditions["temperature"], conditions["hour"], mode
+    )
+
+    async def payload_parts():
+        nearby_places = await get_nearby_places(lat, lon, cell)
+        return build_recommendation_payload(profile, position, conditions, nearby_places)
+
+    def lifetime(result):
+        return None if result["mode"] == mode else (0.0, RECOMMEND_FALLBACK_MAX_AGE_SECONDS)
+
+    result = await recommendation_cache.get_or_compute(
+        key, lambda: compute_recommendations(payload_parts, mode), wait, lifetime
+    )
+    logger.info(f"[recommend] Cache key {key}, stats {recommendation_cache.stats}")
+    return result
+
+
+async def load_precomputed(db: AsyncSession, profile: UserProfile, mode: str,
+                           now: Optional[datetime.datetime] = None) -> Optional[dict]:
+    """
+    Returns the user's precomputed recommendations if they still apply.
+
+    They apply within the time-of-day bucket they were made for, if the profile has
+    not changed since and the weather bucket of the user's cell is still the same.
+
+    Args:
+        db (AsyncSession): Database session.
+        profile (UserProfile): User's profile.
+        mode (str): Requested mode; only recommendations made in that mode are used.
+        now (datetime, optional): Current time; aware.
+
+    Returns:
+        dict: {"recommendations": [...], "mode": mode}, or None.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    row = await db.get(PrecomputedRecommendation, profile.user_id)
+    if row is None or row.mode != mode or not row.valid_from <= now < row.valid_until:
+        return None
+    if getattr(profile, "updated_at", None) and profile.updated_at > row.computed_at:
+        return None
+    position, lat, lon = await asyncio.to_thread(resolve_position, profile.hometown)
+    conditions = await asyncio.to_thread(get_cell_conditions, position, geohash(float(lat), float(lon)), now)
+    weather = weather_bucket(conditions["weather_code"], conditions["temperature"])
+    # Unknown current weather is no reason to drop them
+    if weather != row.weather and conditions["weather_code"] is not None:
+        return None
+    logger.info(f"[recommend] Using recommendations precomputed at {row.computed_at} for user {profile.user_id}")
+    return {"recommendations": row.recommendations, "mode": row.mode}
+
+
+async def get_recommendations_for_user(db: AsyncSession, user: User, mode: str = "rich",
+                                       now: Optional[datetime.datetime] = None):
+    """
+    Recommends places near the user.
+
+    Recommendations precomputed for the current time of day are used if they still
+    apply, see load_precomputed().
+
+    Args:
+        db (AsyncSession): Database session.
+        user (User): Current user.
+        mode (str, optional): "fast" (ranked real places, no LLM) or "rich" (LLM-written).
+        now (datetime, optional): Current time; aware.
+
+    Returns:
+        dict: {"recommendations": [...], "mode": mode that produced them}.
+    """
+    profile = await get_user_profile(db, user)
+    precomputed = await load_precomputed(db, profile, mode, now)
+    if precomputed is not None:
+        return precomputed
+    return await recommend_for_profile(profile, mode, at=now)
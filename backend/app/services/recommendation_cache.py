@@ -0,0 +1,262 @@
+import asyncio
+import hashlib
+import os
+import time
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+# Geohash length of a location cell; 5 characters is roughly 5 x 5 km.
+RECOMMEND_CELL_PRECISION = int(os.getenv("RECOMMEND_CELL_PRECISION", "5"))
+# Cached recommendations are served as they are for this long...
+RECOMMEND_CACHE_FRESH_SECONDS = float(os.getenv("RECOMMEND_CACHE_FRESH_SECONDS", "900"))
+# ...then served while a background task refreshes them, and never after this.
+RECOMMEND_CACHE_MAX_AGE_SECONDS = float(os.getenv("RECOMMEND_CACHE_MAX_AGE_SECONDS", "21600"))
+RECOMMEND_CACHE_SIZE = int(os.getenv("RECOMMEND_CACHE_SIZE", "4096"))
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+AGE_BANDS = ((18, "under18"), (25, "18-24"), (35, "25-34"), (45, "35-44"), (55, "45-54"))
+TEMPERATURE_BANDS = ((0, "freezing"), (10, "cold"), (20, "mild"), (28, "warm"))
+HOUR_BUCKETS = ((6, "night"), (11, "morning"), (16, "midday"), (21, "evening"), (24, "late"))
+
+
+def geohash(lat: float, lon: float, precision: int = RECOMMEND_CELL_PRECISION) -> str:
+    """Encodes coordinates as a geohash; nearby points share a prefix."""
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return "".join(chars)
+
+
+def age_band(age: Optional[Union[int, str]]) -> str:
+    """Age band of a profile age; user_profiles.age is stored as a string."""
+    try:
+        age = int(float(age))
+    except (TypeError, ValueError):
+        return "unknown"
+    for limit, band in AGE_BANDS:
+        if age < limit:
+            return band
+    return "55+"
+
+
+def description_digest(description: Optional[str]) -> str:
+    """Short hash of a profile description; case and whitespace do not matter."""
+    normalized = " ".join((description or "").lower().split())
+    return hashlib.sha256(normalized.encode("utf-8")).hexdigest()[:12]
+
+
+def weather_bucket(code: Optional[int], temperature: Optional[float]) -> str:
+    """Groups WMO weather codes and temperatures into the few classes that change recommendations."""
+    if code is None:
+        sky = "unknown"
+    elif code <= 1:
+        sky = "clear"
+    elif code <= 3:
+        sky = "cloudy"
+    elif code in (45, 48):
+        sky = "fog"
+    elif 71 <= code <= 77 or code in (85, 86):
+        sky = "snow"
+    elif code >= 95:
+        sky = "storm"
+    else:
+        sky = "rain"
+    if temperature is None:
+        return f"{sky}/unknown"
+    for limit, band in TEMPERATURE_BANDS:
+        if temperature < limit:
+            return f"{sky}/{band}"
+    return f"{sky}/hot"
+
+
+def hour_bucket(hour: Optional[int]) -> str:
+    if hour is None:
+        return "unknown"
+    for limit, bucket in HOUR_BUCKETS:
+        if hour < limit:
+            return bucket
+    return "late"
+
+
+def hour_bucket_bounds(hour: int) -> Tuple[int, int]:
+    """First and last-plus-one local hour of the time-of-day bucket of an hour."""
+    start = 0
+    for limit, _ in HOUR_BUCKETS:
+        if hour < limit:
+            return start, limit
+        start = limit
+    return start, 24
+
+
+def recommendation_key(cell: str, age: Optional[Union[int, str]], sex: Optional[str], description: Optional[str],
+                       weather_code: Optional[int], temperature: Optional[float], hour: Optional[int],
+                       mode: str) -> str:
+    """
+    Builds the cache key shared by users who would get near-identical recommendations.
+
+    Args:
+        cell (str): Geohash cell of the user's position.
+        age (int or str, optional): User's age, reduced to an age band.
+        sex (str, optional): User's sex.
+        description (str, optional): Profile description, hashed.
+        weather_code (int, optional): WMO weather code, bucketed with the temperature.
+        temperature (float, optional): Temperature in °C.
+        hour (int, optional): Local hour, bucketed by time of day.
+        mode (str): Recommendation mode.
+
+    Returns:
+        str: Cache key.
+    """
+    return ":".join((
+        cell, age_band(age), (sex or "unknown").lower(), description_digest(description),
+        weather_bucket(weather_code, temperature), hour_bucket(hour), mode,
+    ))
+
+
+class TTLCache:
+    """Small in-memory LRU cache whose entries expire after a fixed time."""
+
+    def __init__(self, ttl: float, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, key: str) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+
+class RecommendationCache:
+    """
+    Recommendations per cache key, served stale while they are refreshed in the background.
+
+    Entries younger than fresh_seconds are returned as they are. Older ones are still
+    returned immediately, but trigger one background refresh. Entries older than
+    max_age_seconds are recomputed before answering. Both limits can be overridden
+    per entry. Concurrent misses for the same key share one computation.
+    """
+
+    def __init__(self, fresh_seconds: float = RECOMMEND_CACHE_FRESH_SECONDS,
+                 max_age_seconds: float = RECOMMEND_CACHE_MAX_AGE_SECONDS, max_entries: int = RECOMMEND_CACHE_SIZE):
+        self.fresh_seconds = fresh_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._computing: Dict[str, asyncio.Task] = {}
+        self.stats = {"fresh": 0, "stale": 0, "miss": 0, "refresh_failed": 0}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def age(self, key: str) -> Optional[float]:
+        """Seconds since the entry was stored, or None if there is no usable entry."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        age = time.monotonic() - entry[1]
+        if age >= entry[3]:
+            del self._entries[key]
+            return None
+        return age
+
+    def put(self, key: str, value: Any, fresh_seconds: Optional[float] = None,
+            max_age_seconds: Optional[float] = None) -> None:
+        """Stores a value; the limits default to the cache's own."""
+        self._entries[key] = (
+            value, time.monotonic(),
+            self.fresh_seconds if fresh_seconds is None else fresh_seconds,
+            self.max_age_seconds if max_age_seconds is None else max_age_seconds,
+        )
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _compute(self, key: str, compute: Callable[[], Awaitable[Any]],
+                 lifetime: Optional[Callable[[Any], Optional[Tuple[float, float]]]]) -> asyncio.Task:
+        task = self._computing.get(key)
+        if task is None:
+            async def run():
+                try:
+                    value = await compute()
+                    self.put(key, value, *(lifetime and lifetime(value) or ()))
+                    return value
+                finally:
+                    self._computing.pop(key, None)
+
+            task = asyncio.ensure_future(run())
+            # Failures reach the waiting callers; nobody may be waiting for a refresh
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._computing[key] = task
+        return task
+
+    def _log_refresh(self, key: str, task: asyncio.Task) -> None:
+        if not task.cancelled() and task.exception() is not None:
+            self.stats["refresh_failed"] += 1
+            logger.warning(f"[recommend-cache] Background refresh of {key} failed: {task.exception()}")
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]], wait: bool = False,
+                             lifetime: Optional[Callable[[Any], Optional[Tuple[float, float]]]] = None) -> Any:
+        """
+        Returns the cached value for key, computing or refreshing it as needed.
+
+        Args:
+            key (str): Cache key, see recommendation_key().
+            compute (callable): Returns a coroutine producing a fresh value.
+            wait (bool, optional): Wait for the refresh of a stale entry instead of
+                returning it, as batch precomputation does.
+            lifetime (callable, optional): Returns (fresh_seconds, max_age_seconds) for
+                a computed value, or None to keep the cache's defaults.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+        age = self.age(key)
+        if age is not None:
+            self._entries.move_to_end(key)
+            value, _, fresh_seconds, _ = self._entries[key]
+            if age < fresh_seconds:
+                self.stats["fresh"] += 1
+                return value
+            self.stats["stale"] += 1
+            if wait:
+                return await asyncio.shield(self._compute(key, compute, lifetime))
+            if key not in self._computing:
+                task = self._compute(key, compute, lifetime)
+                task.add_done_callback(lambda t: self._log_refresh(key, t))
+            return value
+
+        self.stats["miss"] += 1
+        # The computation outlives a caller that is cancelled, so it can still fill the cache
+        return await asyncio.shield(self._compute(key, compute, lifetime))
+
+recommendation_cache = RecommendationCache()
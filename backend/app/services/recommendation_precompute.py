@@ -0,0 +1,307 @@
+import asyncio
+import datetime
+import json
+import os
+import time
+import uuid
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.future import select
+
+from app.core.logging import LOG_DIR
+from app.database.models.models import AI_Interaction, Event, PrecomputedRecommendation, User, UserProfile
+from app.services.recommend import get_cell_conditions, recommend_for_profile, resolve_position
+from app.services.recommendation_cache import geohash, hour_bucket_bounds, weather_bucket
+
+logger = logging.getLogger(__name__)
+
+# UTC time of day ("HH:MM") of the nightly run; empty disables the schedule.
+RECOMMEND_PRECOMPUTE_AT = os.getenv("RECOMMEND_PRECOMPUTE_AT", "")
+# Users with calendar, assistant or profile activity within this many days are precomputed.
+RECOMMEND_PRECOMPUTE_ACTIVE_DAYS = int(os.getenv("RECOMMEND_PRECOMPUTE_ACTIVE_DAYS", "14"))
+# Recommendations computed at the same time; each one is an ML call.
+RECOMMEND_PRECOMPUTE_CONCURRENCY = int(os.getenv("RECOMMEND_PRECOMPUTE_CONCURRENCY", "4"))
+# Users read from the database per page; the cursor advances after each page.
+RECOMMEND_PRECOMPUTE_BATCH_SIZE = int(os.getenv("RECOMMEND_PRECOMPUTE_BATCH_SIZE", "200"))
+RECOMMEND_PRECOMPUTE_MODE = os.getenv("RECOMMEND_PRECOMPUTE_MODE", "rich")
+# Local hour users are expected to open the app; recommendations are made for it and
+# used throughout its time-of-day bucket.
+RECOMMEND_PRECOMPUTE_FOR_HOUR = int(os.getenv("RECOMMEND_PRECOMPUTE_FOR_HOUR", "8"))
+# Progress of the current run, so an interrupted run continues where it stopped.
+RECOMMEND_PRECOMPUTE_CURSOR = os.getenv("RECOMMEND_PRECOMPUTE_CURSOR", str(LOG_DIR / "recommend_precompute.json"))
+
+precompute_status = {
+    "state": "idle",
+    "started_at": None,
+    "finished_at": None,
+    "last_user_id": None,
+    "processed": 0,
+    "failed": 0,
+    "cells": 0,
+    "users_per_second": 0.0,
+}
+
+
+def load_cursor(path: str = RECOMMEND_PRECOMPUTE_CURSOR) -> Optional[dict]:
+    """Returns the cursor of an unfinished run, or None if the last run finished."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            cursor = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return None if cursor.get("done") else cursor
+
+
+def save_cursor(cursor: dict, path: str = RECOMMEND_PRECOMPUTE_CURSOR) -> None:
+    """Writes the cursor atomically, so a crash never leaves half a file."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(cursor, f)
+    os.replace(tmp_path, path)
+
+
+async def fetch_active_profiles(db: AsyncSession, after: Optional[str], limit: int,
+                                active_since: datetime.datetime) -> List[UserProfile]:
+    """
+    Returns the next page of active users' profiles, ordered by user id.
+
+    A user is active if they created or changed a calendar event, talked to the
+    assistant or updated their profile since active_since.
+
+    Args:
+        db (AsyncSession): Database session.
+        after (str, optional): Last user id of the previous page.
+        limit (int): Page size.
+        active_since (datetime): Start of the activity window.
+
+    Returns:
+        list: Up to limit profiles.
+    """
+    recent_events = select(Event.id).where(
+        Event.user_id == User.id,
+        or_(Event.created_at >= active_since, Event.updated_at >= active_since),
+    ).exists()
+    recent_interactions = select(AI_Interaction.id).where(
+        AI_Interaction.user_id == User.id, AI_Interaction.created_at >= active_since
+    ).exists()
+    query = (
+        select(UserProfile)
+        .join(User, User.id == UserProfile.user_id)
+        .where(or_(recent_events, recent_interactions, UserProfile.updated_at >= active_since))
+        .order_by(User.id)
+        .limit(limit)
+    )
+    if after:
+        query = query.where(User.id > uuid.UUID(after))
+    result = await db.execute(query)
+    return list(result.scalars().all())
+
+
+def precompute_window(utc_offset: Optional[int], hour: int,
+                      now: datetime.datetime) -> Tuple[datetime.datetime, datetime.datetime, datetime.datetime]:
+    """
+    Finds the next time-of-day bucket containing a local hour.
+
+    If the bucket has already started today, it is today's; once it has ended,
+    tomorrow's.
+
+    Args:
+        utc_offset (int, optional): Local UTC offset in seconds; UTC if unknown.
+        hour (int): Local hour.
+        now (datetime): Current time; aware.
+
+    Returns:
+        tuple: (time to recommend for, bucket start, bucket end), all aware UTC.
+    """
+    offset = datetime.timedelta(seconds=utc_offset or 0)
+    local_now = now.astimezone(datetime.timezone.utc) + offset
+    start, end = hour_bucket_bounds(hour)
+    day = local_now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if local_now >= day + datetime.timedelta(hours=end):
+        day += datetime.timedelta(days=1)
+    at = max(day + datetime.timedelta(hours=hour), local_now)
+    return at - offset, day + datetime.timedelta(hours=start) - offset, day + datetime.timedelta(hours=end) - offset
+
+
+async def save_precomputed(db: AsyncSession, rows: List[dict]) -> None:
+    """Replaces the users' precomputed recommendations."""
+    for row in rows:
+        await db.merge(PrecomputedRecommendation(**row))
+    await db.commit()
+
+
+async def group_by_cell(profiles: List[UserProfile]) -> Dict[str, List[UserProfile]]:
+    """Groups profiles by the geohash cell of their hometown."""
+    cells: Dict[str, List[UserProfile]] = {}
+    for profile in profiles:
+        _, lat, lon = await asyncio.to_thread(resolve_position, profile.hometown)
+        cells.setdefault(geohash(float(lat), float(lon)), []).append(profile)
+    return cells
+
+
+async def precompute_page(profiles: List[UserProfile], mode: str, semaphore: asyncio.Semaphore,
+                          now: Optional[datetime.datetime] = None,
+                          hour: int = RECOMMEND_PRECOMPUTE_FOR_HOUR) -> Tuple[Dict[str, int], List[dict]]:
+    """
+    Precomputes recommendations for one page of users.
+
+    Recommendations are made for the local hour users are expected to open the app,
+    and are valid throughout its time-of-day bucket. Cells are processed concurrently.
+    Within a cell the first user goes alone, which fetches the cell's weather, timezone
+    and nearby places once; the others then reuse them, and users with the same
+    profile segment share one ML call.
+
+    Args:
+        profiles (list): Users' profiles.
+        mode (str): Recommendation mode.
+        semaphore (asyncio.Semaphore): Limits the recommendations computed at the same time.
+        now (datetime, optional): Current time; aware.
+        hour (int, optional): Local hour to recommend for.
+
+    Returns:
+        tuple: Number of "processed" and "failed" users and "cells", and the
+        precomputed_recommendations rows to store. Fast fallbacks to a rich
+        request are not stored.
+    """
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    counts = {"processed": 0, "failed": 0}
+    rows = []
+
+    async def precompute_user(profile):
+        async with semaphore:
+            try:
+                # Geocoding, weather and timezone lookups block, keep them off the event loop
+                position, lat, lon = await asyncio.to_thread(resolve_position, profile.hometown)
+                conditions = await asyncio.to_thread(get_cell_conditions, position, geohash(float(lat), float(lon)))
+                at, valid_from, valid_until = precompute_window(conditions["utc_offset"], hour, now)
+                result = await recommend_for_profile(profile, mode, wait=True, at=at)
+                counts["processed"] += 1
+                if result["mode"] == mode:
+                    rows.append({
+                        "user_id": profile.user_id, "mode": mode, "recommendations": result["recommendations"],
+                        "weather": weather_bucket(conditions["weather_code"], conditions["temperature"]),
+                        "valid_from": valid_from, "valid_until": valid_until, "computed_at": now,
+                    })
+            except Exception as e:
+                counts["failed"] += 1
+                logger.warning(f"[recommend-precompute] Failed for user {profile.user_id}: {e}")
+
+    async def precompute_cell(cell_profiles):
+        await precompute_user(cell_profiles[0])
+        await asyncio.gather(*(precompute_user(profile) for profile in cell_profiles[1:]))
+
+    cells = await group_by_cell(profiles)
+    await asyncio.gather(*(precompute_cell(cell_profiles) for cell_profiles in cells.values()))
+    return dict(counts, cells=len(cells)), rows
+
+
+async def run_precompute(session_factory=None, mode: str = RECOMMEND_PRECOMPUTE_MODE,
+                         concurrency: int = RECOMMEND_PRECOMPUTE_CONCURRENCY,
+                         batch_size: int = RECOMMEND_PRECOMPUTE_BATCH_SIZE,
+                         cursor_path: str = RECOMMEND_PRECOMPUTE_CURSOR) -> dict:
+    """
+    Precomputes recommendations for all active users.
+
+    Users are read page by page in user id order. Each page's recommendations are
+    stored in precomputed_recommendations, where every backend worker finds them.
+    After each page the cursor file records the last user id and the counters, so a
+    run that is interrupted resumes after the last finished page instead of starting over.
+
+    Args:
+        session_factory (callable, optional): Creates database sessions; AsyncSessionLocal by default.
+        mode (str, optional): Recommendation mode to precompute.
+        concurrency (int, optional): Recommendations computed at the same time.
+        batch_size (int, optional): Users per page.
+        cursor_path (str, optional): Cursor file.
+
+    Returns:
+        dict: Final precompute_status.
+    """
+    if precompute_status["state"] == "running":
+        raise RuntimeError("Recommendation precompute is already running")
+    if session_factory is None:
+        from app.database.session import AsyncSessionLocal
+        session_factory = AsyncSessionLocal
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cursor = load_cursor(cursor_path)
+    if cursor:
+        logger.info(f"[recommend-precompute] Resuming run of {cursor['started_at']} after user {cursor['last_user_id']}")
+    else:
+        cursor = {
+            "started_at": now.isoformat(),
+            "active_since": (now - datetime.timedelta(days=RECOMMEND_PRECOMPUTE_ACTIVE_DAYS)).isoformat(),
+            "last_user_id": None, "processed": 0, "failed": 0, "cells": 0, "done": False,
+        }
+    precompute_status.update(
+        {key: cursor[key] for key in ("started_at", "last_user_id", "processed", "failed", "cells")},
+        state="running", finished_at=None, users_per_second=0.0,
+    )
+    active_since = datetime.datetime.fromisoformat(cursor["active_since"])
+    semaphore = asyncio.Semaphore(concurrency)
+    started = time.monotonic()
+    users = 0
+
+    try:
+        while True:
+            async with session_factory() as db:
+                profiles = await fetch_active_profiles(db, cursor["last_user_id"], batch_size, active_since)
+            if not profiles:
+                break
+            counts, rows = await precompute_page(profiles, mode, semaphore, now)
+            async with session_factory() as db:
+                await save_precomputed(db, rows)
+            users += len(profiles)
+            cursor["last_user_id"] = str(profiles[-1].user_id)
+            for key in ("processed", "failed", "cells"):
+                cursor[key] += counts[key]
+            save_cursor(cursor, cursor_path)
+            precompute_status.update(
+                {key: cursor[key] for key in ("last_user_id", "processed", "failed", "cells")},
+                users_per_second=round(users / max(time.monotonic() - started, 1e-9), 2),
+            )
+            logger.info(
+                f"[recommend-precompute] {cursor['processed']} users done, {cursor['failed']} failed, "
+                f"{cursor['cells']} cells, {precompute_status['users_per_second']} users/s"
+            )
+            if len(profiles) < batch_size:
+                break
+    except Exception:
+        precompute_status.update(state="failed", finished_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+        logger.error("[recommend-precompute] Run failed, it resumes from the cursor next time", exc_info=True)
+        raise
+
+    cursor["done"] = True
+    save_cursor(cursor, cursor_path)
+    precompute_status.update(state="finished", finished_at=datetime.datetime.now(datetime.timezone.utc).isoformat())
+    logger.info(f"[recommend-precompute] Finished: {precompute_status}")
+    return dict(precompute_status)
+
+
+def seconds_until(at: str, now: Optional[datetime.datetime] = None) -> float:
+    """Seconds from now until the next "HH:MM" UTC."""
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    hour, minute = (int(part) for part in at.split(":"))
+    target = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if target <= now:
+        target += datetime.timedelta(days=1)
+    return (target - now).total_seconds()
+
+
+async def precompute_scheduler(at: str = RECOMMEND_PRECOMPUTE_AT) -> None:
+    """
+    Runs the precompute every day at a fixed UTC time.
+
+    An unfinished run found in the cursor file is resumed right away.
+    """
+    if load_cursor() is None:
+        await asyncio.sleep(seconds_until(at))
+    while True:
+        try:
+            await run_precompute()
+        except Exception as e:
+            logger.error(f"[recommend-precompute] Scheduled run failed: {e}")
+        await asyncio.sleep(seconds_until(at))
@@ -38,3 +38,14 @@ async def get_current_user(
     if user is None:
         raise credentials_exception
     return user 
+
+
+async def get_current_admin(
+    current_user: models.User = Depends(get_current_user)
+) -> models.User:
+    if (current_user.email or "").lower() not in settings.admin_emails_list:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not enough permissions",
+        )
+    return current_user
@@ -2,6 +2,7 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 import logging
+import asyncio
 import json
 import time
 
@@ -9,6 +10,7 @@ from app.core import settings
 from app.core.logging import logger
 from app.api import api_router
 from app.core.exception_handlers import add_exception_handlers
+from app.services.recommendation_precompute import RECOMMEND_PRECOMPUTE_AT, precompute_scheduler
 from fastapi import Request, Response
 
 # Alembic теперь управляет созданием таблиц, поэтому эта строка не нужна
@@ -92,4 +94,7 @@ app.include_router(api_router, prefix=settings.API_V1_STR)
 @app.on_event("startup")
 async def on_startup():
     logger.info(f"Starting {settings.PROJECT_NAME}")
+    if RECOMMEND_PRECOMPUTE_AT:
+        logger.info(f"Recommendations are precomputed daily at {RECOMMEND_PRECOMPUTE_AT} UTC")
+        app.state.precompute_task = asyncio.create_task(precompute_scheduler())
 
@@ -8,3 +8,36 @@ async def test_calendar_endpoint(client):
     r = client.get("/api/v1/calendar/")
     assert r.status_code==200
     assert isinstance(r.json(), list)
+
+
+class _Rows:
+    def __init__(self, rows):
+        self.rows = rows
+
+    def fetchall(self):
+        return self.rows
+
+
+class _FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def execute(self, query):
+        return _Rows(self.rows)
+
+
+@pytest.mark.asyncio
+async def test_fast_delete_needs_exact_title_match():
+    from types import SimpleNamespace
+    from app.api.endpoints.v1.calendar import confirm_fast_delete
+    from app.services.intent_parser import DEFAULT_TIMEZONE
+
+    user = SimpleNamespace(id="00000000-0000-4000-8000-000000000001")
+    dentist = SimpleNamespace(title="Dentist", start_time=datetime(2026, 10, 16, 9, 0, tzinfo=DEFAULT_TIMEZONE))
+    dentist_talk = SimpleNamespace(title="Dentist talk", start_time=datetime(2026, 10, 16, 12, 0, tzinfo=DEFAULT_TIMEZONE))
+    intent = {"intent": "delete", "event": {"title": "Dentist", "start_time": "2026-10-16 00:00:00+03:00"}}
+
+    confirmed = await confirm_fast_delete(intent, _FakeDB([dentist, dentist_talk]), user)
+    assert confirmed["event"] == {"title": "Dentist", "start_time": "2026-10-16T09:00:00+03:00"}
+    assert await confirm_fast_delete(intent, _FakeDB([dentist_talk]), user) is None
+    assert await confirm_fast_delete(intent, _FakeDB([]), user) is None
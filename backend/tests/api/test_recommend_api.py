@@ -0,0 +1,21 @@
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException, status
+from app.utils import deps
+
+
+@pytest.mark.asyncio
+async def test_precompute_stats_are_for_admins_only(monkeypatch):
+    monkeypatch.setattr(deps.settings, "ADMIN_EMAILS", "ops@example.com, Admin@Example.com")
+    admin = SimpleNamespace(id=uuid.uuid4(), email="admin@example.com")
+    assert await deps.get_current_admin(admin) is admin
+
+    with pytest.raises(HTTPException) as exc:
+        await deps.get_current_admin(SimpleNamespace(id=uuid.uuid4(), email="user@example.com"))
+    assert exc.value.status_code == status.HTTP_403_FORBIDDEN
+
+    monkeypatch.setattr(deps.settings, "ADMIN_EMAILS", "")
+    with pytest.raises(HTTPException):
+        await deps.get_current_admin(admin)
@@ -0,0 +1,116 @@
+# tests/services/test_intent_parser.py
+from datetime import datetime
+from app.services.intent_parser import (
+    DEFAULT_TIMEZONE,
+    FAST_PATH_MIN_CONFIDENCE,
+    parse_calendar_command,
+)
+
+# Friday
+NOW = datetime(2026, 10, 16, 10, 0, tzinfo=DEFAULT_TIMEZONE)
+
+
+def test_add_english_command():
+    intent, confidence = parse_calendar_command("add meeting tomorrow at 15:00", NOW)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent["intent"] == "add"
+    assert intent["event"]["title"] == "Meeting"
+    assert intent["event"]["start_time"] == "2026-10-17 15:00:00+03:00"
+    assert intent["event"]["end_time"] == "2026-10-17 16:00:00+03:00"
+    assert intent["event"]["type"] == "other work"
+
+
+def test_add_russian_command_with_range():
+    intent, confidence = parse_calendar_command("запланируй тренировку в среду с 18:00 до 19:30", NOW)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent["event"]["title"] == "Тренировка"
+    assert intent["event"]["start_time"] == "2026-10-21 18:00:00+03:00"
+    assert intent["event"]["end_time"] == "2026-10-21 19:30:00+03:00"
+
+
+def test_add_with_duration_and_month_name():
+    intent, confidence = parse_calendar_command("поставь лекцию 15 ноября в 10 утра на 2 часа", NOW)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent["event"]["start_time"] == "2026-11-15 10:00:00+03:00"
+    assert intent["event"]["end_time"] == "2026-11-15 12:00:00+03:00"
+
+
+def test_delete_by_title_and_weekday():
+    intent, confidence = parse_calendar_command("delete dentist on Friday", NOW)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent == {
+        "intent": "delete",
+        "event": {"title": "Dentist", "start_time": "2026-10-16 00:00:00+03:00"},
+    }
+
+
+def test_ambiguous_time_falls_back_to_llm():
+    intent, confidence = parse_calendar_command("add gym at 7", NOW)
+    assert intent["intent"] == "add"
+    assert confidence < FAST_PATH_MIN_CONFIDENCE
+
+
+def test_long_sentence_falls_back_to_llm():
+    _, confidence = parse_calendar_command(
+        "add dinner with parents at the italian place and remind me to buy flowers tomorrow at 19:00", NOW
+    )
+    assert confidence < FAST_PATH_MIN_CONFIDENCE
+
+
+def test_questions_and_chat_are_not_commands():
+    assert parse_calendar_command("what do I have tomorrow?", NOW) == (None, 0.0)
+    assert parse_calendar_command("Hello!", NOW) == (None, 0.0)
+
+
+def test_everyday_phrases_are_not_commands():
+    # "drop", "put" and "plan" start ordinary tasks; they must never parse as a delete or an event
+    assert parse_calendar_command("drop the kids at school tomorrow at 8:00", NOW) == (None, 0.0)
+    assert parse_calendar_command("put the kettle on at 15:00", NOW) == (None, 0.0)
+    assert parse_calendar_command("plan a trip to Kazan tomorrow at 10:00", NOW) == (None, 0.0)
+    assert parse_calendar_command("убери квартиру завтра в 10:00", NOW) == (None, 0.0)
+
+
+def test_impossible_dates_fall_back_to_llm():
+    for text in ("add dinner 31/02 at 19:00", "add meeting at 10:00 on 2026-13-45", "add party on February 30 at 20:00"):
+        intent, confidence = parse_calendar_command(text, NOW)
+        assert confidence < FAST_PATH_MIN_CONFIDENCE, text
+
+
+def test_todays_weekday_in_the_past_means_next_week():
+    # NOW is Friday 10:00
+    intent, confidence = parse_calendar_command("добавь пробежку в пятницу в 7 утра", NOW)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent["event"]["start_time"] == "2026-10-23 07:00:00+03:00"
+    intent, _ = parse_calendar_command("add call on Friday at 15:00", NOW)
+    assert intent["event"]["start_time"] == "2026-10-16 15:00:00+03:00"
+
+
+def test_recurring_events_fall_back_to_llm():
+    assert parse_calendar_command("add standup every day at 10:00", NOW) == (None, 0.0)
+    assert parse_calendar_command("добавь йогу каждую среду в 19:00", NOW) == (None, 0.0)
+
+
+def test_leftover_beyond_the_title_falls_back_to_llm():
+    now = datetime(2026, 10, 17, 15, 0, tzinfo=DEFAULT_TIMEZONE)
+    for text in (
+        "add 15 minutes to meeting tomorrow at 15:00",
+        "add meeting tomorrow at 15:00 in Berlin",
+        "add meeting tomorrow at 15:00 Moscow time",
+        "add meeting tomorrow at 15:00 moscow time",
+        "add meeting tomorrow at 3pm to discuss budget",
+        "добавь встречу завтра в 15:00 по московскому времени",
+    ):
+        _, confidence = parse_calendar_command(text, now)
+        assert confidence < FAST_PATH_MIN_CONFIDENCE, text
+    intent, confidence = parse_calendar_command("add meeting to my calendar tomorrow at 15:00", now)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent["event"]["title"] == "Meeting"
+
+
+def test_bare_time_in_the_past_means_tomorrow():
+    now = datetime(2026, 10, 17, 15, 0, tzinfo=DEFAULT_TIMEZONE)
+    intent, confidence = parse_calendar_command("add meeting at 9am", now)
+    assert confidence >= FAST_PATH_MIN_CONFIDENCE
+    assert intent["event"]["start_time"] == "2026-10-18 09:00:00+03:00"
+    intent, _ = parse_calendar_command("add meeting at 16:00", now)
+    assert intent["event"]["start_time"] == "2026-10-17 16:00:00+03:00"
@@ -0,0 +1,125 @@
+# tests/services/test_recommend.py
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from fastapi import HTTPException
+from app.services import recommend
+from app.services.recommend import compute_recommendations, recommend_for_profile, transform_recommendations
+from app.services.recommendation_cache import RecommendationCache
+
+
+def test_transform_maps_ml_fields_to_frontend_shape():
+    [rec] = transform_recommendations([{
+        "name": "Pushkin Museum",
+        "description": "A cultural site, 1.2 km away.",
+        "latitude": 55.7473,
+        "longitude": 37.6051,
+        "confidence": 8,
+        "category": "culture",
+    }])
+    assert rec["title"] == "Pushkin Museum"
+    assert rec["description"] == "A cultural site, 1.2 km away."
+    assert (rec["lat"], rec["lon"]) == (55.7473, 37.6051)
+    assert rec["address"] == "55.747300, 37.605100"
+    assert rec["category"] == "culture"
+    assert rec["rating"] == 4.0
+    assert rec["id"].startswith("rec_")
+
+
+def test_transform_defaults_and_skips_invalid_entries():
+    recs = transform_recommendations([
+        {"name": "Park", "latitude": "55.7", "longitude": "37.6"},
+        {"name": "Nowhere", "latitude": 123, "longitude": 37.6},
+        {"name": "Broken", "latitude": "north", "longitude": 37.6},
+        "not a dict",
+    ])
+    assert [r["title"] for r in recs] == ["Park"]
+    assert recs[0]["category"] == "Recommendation"
+    assert recs[0]["rating"] == 2.5
+
+
+async def fake_payload():
+    return {"position": "55.75,37.61", "nearby_places": []}
+
+
+@pytest.fixture
+def ml_calls(monkeypatch):
+    calls = []
+
+    async def fake_fetch(payload, mode):
+        calls.append(mode)
+        if mode == "rich":
+            raise httpx.ReadTimeout("LLM too slow")
+        return [{"name": "Cafe", "latitude": 55.75, "longitude": 37.61, "confidence": 6}]
+
+    monkeypatch.setattr(recommend, "fetch_ml_recommendations", fake_fetch)
+    return calls
+
+
+@pytest.mark.asyncio
+async def test_rich_mode_falls_back_to_fast(ml_calls):
+    result = await compute_recommendations(fake_payload, mode="rich")
+    assert ml_calls == ["rich", "fast"]
+    assert result["mode"] == "fast"
+    assert [r["title"] for r in result["recommendations"]] == ["Cafe"]
+
+
+@pytest.mark.asyncio
+async def test_fast_mode_failure_is_reported(monkeypatch, ml_calls):
+    async def failing_fetch(payload, mode):
+        raise httpx.ConnectError("ML service down")
+
+    monkeypatch.setattr(recommend, "fetch_ml_recommendations", failing_fetch)
+    with pytest.raises(HTTPException) as exc:
+        await compute_recommendations(fake_payload, mode="fast")
+    assert exc.value.status_code == 503
+
+
+@pytest.mark.asyncio
+async def test_similar_profiles_in_one_cell_share_recommendations(monkeypatch, ml_calls):
+    places_fetched = []
+
+    async def fake_places(lat, lon, cell):
+        places_fetched.append(cell)
+        return []
+
+    monkeypatch.setattr(recommend, "recommendation_cache", RecommendationCache())
+    monkeypatch.setattr(recommend, "get_cell_conditions", lambda position, cell, at=None: {
+        "weather": "12°C, code 2", "weather_code": 2, "temperature": 12,
+        "local_time": "2024-05-01 13:00:00", "hour": 13, "timezone": "Europe/Moscow",
+    })
+    monkeypatch.setattr(recommend, "get_nearby_places", fake_places)
+
+    first = SimpleNamespace(hometown="55.7558,37.6173", age=27, sex="female", description="Museums")
+    neighbour = SimpleNamespace(hometown="55.7560,37.6180", age=31, sex="female", description=" museums ")
+    other = SimpleNamespace(hometown="55.7558,37.6173", age=52, sex="female", description="Museums")
+
+    assert await recommend_for_profile(first, "fast") == await recommend_for_profile(neighbour, "fast")
+    assert len(places_fetched) == 1
+    await recommend_for_profile(other, "fast")
+    assert len(places_fetched) == 2
+
+
+@pytest.mark.asyncio
+async def test_fast_fallback_is_not_served_as_a_fresh_rich_answer(monkeypatch, ml_calls):
+    monkeypatch.setattr(recommend, "recommendation_cache", RecommendationCache())
+    monkeypatch.setattr(recommend, "get_cell_conditions", lambda position, cell, at=None: {
+        "weather": "12°C, code 2", "weather_code": 2, "temperature": 12,
+        "local_time": "2024-05-01 13:00:00", "hour": 13, "timezone": "Europe/Moscow",
+    })
+
+    async def no_places(lat, lon, cell):
+        return []
+
+    monkeypatch.setattr(recommend, "get_nearby_places", no_places)
+    profile = SimpleNamespace(hometown="55.7558,37.6173", age=27, sex="female", description="Museums")
+
+    assert (await recommend_for_profile(profile, "rich"))["mode"] == "fast"
+    assert ml_calls == ["rich", "fast"]
+
+    # The next request still gets the fallback, but retries rich mode right away
+    assert (await recommend_for_profile(profile, "rich"))["mode"] == "fast"
+    await asyncio.sleep(0.01)
+    assert ml_calls[2] == "rich"
@@ -0,0 +1,124 @@
+# tests/services/test_recommendation_cache.py
+import asyncio
+
+import pytest
+from app.services.recommendation_cache import (
+    RecommendationCache, TTLCache, age_band, geohash, hour_bucket, recommendation_key, weather_bucket,
+)
+
+
+def test_geohash_known_values():
+    assert geohash(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    assert geohash(55.7558, 37.6173, 5) == geohash(55.7560, 37.6180, 5)
+    assert geohash(55.7558, 37.6173, 5) != geohash(59.9343, 30.3351, 5)
+
+
+def test_buckets():
+    assert age_band(None) == "unknown"
+    assert age_band(24) == "18-24"
+    assert age_band("31") == "25-34"
+    assert age_band("n/a") == "unknown"
+    assert age_band(70) == "55+"
+    assert weather_bucket(0, 22) == "clear/warm"
+    assert weather_bucket(63, 5) == "rain/cold"
+    assert weather_bucket(None, None) == "unknown/unknown"
+    assert hour_bucket(8) == "morning"
+    assert hour_bucket(23) == "late"
+
+
+def test_key_ignores_description_case_and_whitespace():
+    a = recommendation_key("ucfv0", 30, "Male", "Hiking  and coffee", 2, 15, 19, "rich")
+    b = recommendation_key("ucfv0", 33, "male", "hiking and coffee ", 3, 17, 20, "rich")
+    assert a == b
+    assert a != recommendation_key("ucfv0", 30, "male", "hiking and coffee", 2, 15, 19, "fast")
+
+
+def test_ttl_cache_expires():
+    cache = TTLCache(ttl=0.0)
+    cache.set("k", 1)
+    assert cache.get("k") is None
+
+
+@pytest.mark.asyncio
+async def test_fresh_stale_and_expired_entries():
+    cache = RecommendationCache(fresh_seconds=0.05, max_age_seconds=0.2)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return len(calls)
+
+    assert await cache.get_or_compute("k", compute) == 1
+    assert await cache.get_or_compute("k", compute) == 1
+    assert cache.stats["fresh"] == 1
+
+    await asyncio.sleep(0.06)
+    # Stale: the old value is returned and refreshed in the background
+    assert await cache.get_or_compute("k", compute) == 1
+    await asyncio.sleep(0)
+    assert await cache.get_or_compute("k", compute) == 2
+
+    await asyncio.sleep(0.21)
+    assert await cache.get_or_compute("k", compute) == 3
+    assert cache.stats == {"fresh": 2, "stale": 1, "miss": 2, "refresh_failed": 0}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_misses_share_one_computation():
+    cache = RecommendationCache()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "value"
+
+    results = await asyncio.gather(*(cache.get_or_compute("k", compute) for _ in range(5)))
+    assert results == ["value"] * 5
+    assert len(calls) == 1
+
+
+@pytest.mark.asyncio
+async def test_failed_refresh_keeps_stale_value():
+    cache = RecommendationCache(fresh_seconds=0.0, max_age_seconds=60)
+    cache.put("k", "old")
+
+    async def failing():
+        raise RuntimeError("ML down")
+
+    assert await cache.get_or_compute("k", failing) == "old"
+    await asyncio.sleep(0.01)
+    assert cache.stats["refresh_failed"] == 1
+    assert await cache.get_or_compute("k", failing) == "old"
+
+
+@pytest.mark.asyncio
+async def test_wait_recomputes_stale_entry_before_returning():
+    cache = RecommendationCache(fresh_seconds=0.0, max_age_seconds=60)
+    cache.put("k", "old")
+
+    async def compute():
+        return "new"
+
+    assert await cache.get_or_compute("k", compute, wait=True) == "new"
+
+
+@pytest.mark.asyncio
+async def test_lifetime_overrides_limits_per_value():
+    cache = RecommendationCache(fresh_seconds=60, max_age_seconds=600)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return "fallback" if len(calls) == 1 else "full"
+
+    def lifetime(value):
+        return (0.0, 60) if value == "fallback" else None
+
+    assert await cache.get_or_compute("k", compute, lifetime=lifetime) == "fallback"
+    # Stale at once, so the next request refreshes it
+    assert await cache.get_or_compute("k", compute, lifetime=lifetime) == "fallback"
+    await asyncio.sleep(0)
+    assert await cache.get_or_compute("k", compute, lifetime=lifetime) == "full"
+    assert await cache.get_or_compute("k", compute, lifetime=lifetime) == "full"
+    assert len(calls) == 2
@@ -0,0 +1,212 @@
+# tests/services/test_recommendation_precompute.py
+import asyncio
+import datetime
+import json
+import threading
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from app.services import recommend
+from app.services import recommendation_precompute as precompute
+from app.services.recommendation_cache import RecommendationCache, TTLCache, geohash
+from app.services.recommendation_precompute import (
+    load_cursor, precompute_window, run_precompute, save_precomputed, seconds_until,
+)
+
+MOSCOW = "55.7558,37.6173"
+PETERSBURG = "59.9343,30.3351"
+
+
+def make_profiles(hometowns):
+    ids = sorted(uuid.uuid4() for _ in hometowns)
+    return [SimpleNamespace(user_id=user_id, hometown=town) for user_id, town in zip(ids, hometowns)]
+
+
+class FakeSession:
+    rows = {}
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def merge(self, row):
+        self.rows[row.user_id] = row
+
+    async def get(self, model, key):
+        return self.rows.get(key)
+
+    async def commit(self):
+        pass
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = []
+
+    async def fake_recommend(profile, mode, wait=False, at=None):
+        calls.append((profile.hometown, mode, wait))
+        await asyncio.sleep(0)
+        if profile.hometown == "broken":
+            raise RuntimeError("ML down")
+        return {"recommendations": [], "mode": mode}
+
+    monkeypatch.setattr(precompute, "recommend_for_profile", fake_recommend)
+    monkeypatch.setattr(precompute, "resolve_position",
+                        lambda hometown: (hometown, *(hometown if "," in hometown else MOSCOW).split(",")))
+    monkeypatch.setattr(precompute, "get_cell_conditions", lambda position, cell: {
+        "weather_code": 2, "temperature": 12, "utc_offset": 10800,
+    })
+    monkeypatch.setattr(precompute, "precompute_status", dict(precompute.precompute_status, state="idle"))
+    monkeypatch.setattr(FakeSession, "rows", {})
+    return calls
+
+
+def serve(monkeypatch, profiles, fail_after=None):
+    async def fake_fetch(db, after, limit, active_since):
+        if fail_after is not None and after == str(profiles[fail_after - 1].user_id):
+            raise ConnectionError("database gone")
+        start = 0 if after is None else [str(p.user_id) for p in profiles].index(after) + 1
+        return profiles[start:start + limit]
+
+    monkeypatch.setattr(precompute, "fetch_active_profiles", fake_fetch)
+
+
+@pytest.mark.asyncio
+async def test_first_user_of_a_cell_warms_it_for_the_others(calls):
+    profiles = make_profiles([MOSCOW, MOSCOW, PETERSBURG, MOSCOW])
+    counts, rows = await precompute.precompute_page(profiles, "rich", asyncio.Semaphore(2))
+    assert counts == {"processed": 4, "failed": 0, "cells": 2}
+    assert len(rows) == 4
+    assert calls[0][0] != calls[1][0]
+    assert all(wait for _, _, wait in calls)
+
+
+@pytest.mark.asyncio
+async def test_run_records_progress_and_failures(monkeypatch, tmp_path, calls):
+    cursor_path = str(tmp_path / "cursor.json")
+    profiles = make_profiles([MOSCOW, PETERSBURG, "broken", MOSCOW, PETERSBURG])
+    serve(monkeypatch, profiles)
+
+    status = await run_precompute(FakeSession, batch_size=2, cursor_path=cursor_path)
+    assert status["state"] == "finished"
+    assert (status["processed"], status["failed"]) == (4, 1)
+    assert status["last_user_id"] == str(profiles[-1].user_id)
+    assert load_cursor(cursor_path) is None
+    with open(cursor_path) as f:
+        assert json.load(f)["done"] is True
+    assert len(FakeSession.rows) == 4
+
+
+@pytest.mark.asyncio
+async def test_interrupted_run_resumes_after_last_page(monkeypatch, tmp_path, calls):
+    cursor_path = str(tmp_path / "cursor.json")
+    profiles = make_profiles([MOSCOW, PETERSBURG, MOSCOW, PETERSBURG])
+    serve(monkeypatch, profiles, fail_after=2)
+
+    with pytest.raises(ConnectionError):
+        await run_precompute(FakeSession, batch_size=2, cursor_path=cursor_path)
+    assert load_cursor(cursor_path)["last_user_id"] == str(profiles[1].user_id)
+    assert precompute.precompute_status["state"] == "failed"
+
+    calls.clear()
+    serve(monkeypatch, profiles)
+    status = await run_precompute(FakeSession, batch_size=2, cursor_path=cursor_path)
+    assert len(calls) == 2
+    assert status["processed"] == 4
+
+
+def test_seconds_until_next_run():
+    now = datetime.datetime(2024, 5, 1, 3, 30, tzinfo=datetime.timezone.utc)
+    assert seconds_until("04:00", now) == 1800
+    assert seconds_until("03:00", now) == 23.5 * 3600
+
+
+def test_precompute_window_is_the_next_bucket_of_the_hour():
+    utc = datetime.timezone.utc
+    at_night = datetime.datetime(2026, 10, 16, 23, 0, tzinfo=utc)  # 02:00 in Moscow
+    assert precompute_window(10800, 8, at_night) == (
+        datetime.datetime(2026, 10, 17, 5, 0, tzinfo=utc),
+        datetime.datetime(2026, 10, 17, 3, 0, tzinfo=utc),
+        datetime.datetime(2026, 10, 17, 8, 0, tzinfo=utc),
+    )
+    # Already in the morning: for now, until the morning ends
+    at_nine = datetime.datetime(2026, 10, 17, 6, 0, tzinfo=utc)
+    assert precompute_window(10800, 8, at_nine)[0] == at_nine
+    # After the morning: tomorrow's
+    at_noon = datetime.datetime(2026, 10, 17, 9, 0, tzinfo=utc)
+    assert precompute_window(10800, 8, at_noon)[1] == datetime.datetime(2026, 10, 18, 3, 0, tzinfo=utc)
+
+
+@pytest.mark.asyncio
+async def test_precomputed_at_night_is_used_in_the_morning(monkeypatch):
+    utc = datetime.timezone.utc
+    payloads = []
+
+    async def fake_fetch(payload, mode):
+        payloads.append(payload["local_time"])
+        return [{"name": "Cafe", "latitude": 55.75, "longitude": 37.61, "confidence": 6}]
+
+    async def no_places(lat, lon, cell):
+        return []
+
+    conditions_cache = TTLCache(600)
+    conditions_cache.set(geohash(55.7558, 37.6173), {
+        "weather": "5°C, code 2", "weather_code": 2, "temperature": 5,
+        "utc_offset": 10800, "timezone": "Europe/Moscow",
+    })
+    monkeypatch.setattr(recommend, "conditions_cache", conditions_cache)
+    monkeypatch.setattr(recommend, "get_nearby_places", no_places)
+    monkeypatch.setattr(recommend, "fetch_ml_recommendations", fake_fetch)
+    monkeypatch.setattr(recommend, "recommendation_cache", RecommendationCache())
+    monkeypatch.setattr(FakeSession, "rows", {})
+    [profile] = make_profiles([MOSCOW])
+    profile.age, profile.sex, profile.description, profile.updated_at = "30", "female", "Museums", None
+
+    # 02:00 in Moscow
+    night = datetime.datetime(2026, 10, 16, 23, 0, tzinfo=utc)
+    counts, rows = await precompute.precompute_page([profile], "rich", asyncio.Semaphore(1), night)
+    await save_precomputed(FakeSession(), rows)
+    assert payloads == ["2026-10-17 08:00:00"]
+
+    # A restarted worker has nothing cached in memory
+    monkeypatch.setattr(recommend, "recommendation_cache", RecommendationCache())
+
+    async def fake_profile(db, user):
+        return profile
+
+    monkeypatch.setattr(recommend, "get_user_profile", fake_profile)
+    user = SimpleNamespace(id=profile.user_id)
+
+    # 08:30 in Moscow
+    morning = datetime.datetime(2026, 10, 17, 5, 30, tzinfo=utc)
+    result = await recommend.get_recommendations_for_user(FakeSession(), user, "rich", morning)
+    assert [r["title"] for r in result["recommendations"]] == ["Cafe"]
+    assert len(payloads) == 1
+
+    # 12:30 in Moscow, the morning's recommendations no longer apply
+    noon = datetime.datetime(2026, 10, 17, 9, 30, tzinfo=utc)
+    await recommend.get_recommendations_for_user(FakeSession(), user, "rich", noon)
+    assert payloads[1] == "2026-10-17 12:30:00"
+
+
+@pytest.mark.asyncio
+async def test_location_lookups_run_off_the_event_loop(monkeypatch, calls):
+    loop_thread = threading.get_ident()
+    threads = []
+
+    def resolve(hometown):
+        threads.append(threading.get_ident())
+        return hometown, *hometown.split(",")
+
+    def conditions(position, cell):
+        threads.append(threading.get_ident())
+        return {"weather_code": 2, "temperature": 12, "utc_offset": 10800}
+
+    monkeypatch.setattr(precompute, "resolve_position", resolve)
+    monkeypatch.setattr(precompute, "get_cell_conditions", conditions)
+    counts, _ = await precompute.precompute_page(make_profiles([MOSCOW, PETERSBURG]), "rich", asyncio.Semaphore(2))
+    assert counts["processed"] == 2
+    assert threads and loop_thread not in threads
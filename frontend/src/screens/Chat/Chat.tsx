@@ -84,7 +84,7 @@ export const Chat: React.FC = () => {
       ].map((m) => ({ role: m.sender === 'user' ? 'user' : 'llm', content: m.text }));
 
       console.log('Sending chat history to ML:', chatHistory.length, 'messages');
-      const result = await chatWithML(userMessage.text, chatHistory);
+      const result = await chatWithML(userMessage.text, chatHistory, undefined, userId);
       const llmResponse = result.response ?? 'No response from ML service.';
 
       // Check if the response is already a JSON object or if it's a JSON string
@@ -1,11 +1,11 @@
 const ML_API_URL = import.meta.env.VITE_ML_API_URL ?? "http://egoai.duckdns.org:8001";
 
-export async function chatWithML(message: string, history?: any, calendar?: any) {
+export async function chatWithML(message: string, history?: any, calendar?: any, conversationId?: string) {
   try {
     const response = await fetch(`${ML_API_URL}/chat`, {
       method: "POST",
       headers: { "Content-Type": "application/json" },
-      body: JSON.stringify({ message, history, calendar }),
+      body: JSON.stringify({ message, history, calendar, conversation_id: conversationId }),
     });
     
     if (!response.ok) {